@@ -6,33 +6,68 @@ Script for GitHub Actions to review code changes using LLM API
 import os
 import sys
 import json
+import hashlib
+import time
+import random
 import requests
-import subprocess
-from typing import List, Dict, Any
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from requests.adapters import HTTPAdapter
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 
+from diff_reader import REVIEW_MAX_FILE_DIFF_BYTES, FileDiff, iter_file_diffs
+from prompt_builder import build_segments, pack_for_review
+from review_reduce import FILE_REDUCE_HEADER, PR_SUMMARY_HEADER, build_reduce_prompts, dedupe_findings
+from review_state import ReviewStateStore
+
 # Configuration
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 LLM_API_URL = os.getenv("LLM_API_URL", "http://127.0.0.1:8000/api/review/")
+LLM_BATCH_API_URL = os.getenv("LLM_BATCH_API_URL", LLM_API_URL.rstrip('/') + "/batch")
+LLM_JOBS_API_URL = os.getenv("LLM_JOBS_API_URL", LLM_API_URL.rstrip('/') + "/jobs")
+# Registered API key: the server rate-limits per key instead of per runner IP
+LLM_API_KEY = os.getenv("LLM_API_KEY", "")
 PR_NUMBER = os.getenv("PR_NUMBER")
 REPO = "https://github.com/CaramenSuaChua/Demo_Fastapi.git"
 
-def get_changed_files() -> List[str]:
-    """Get list of changed files in PR"""
-    try:
-        # Get diff between PR branch and target branch
-        result = subprocess.run(
-            ["git", "diff", "--name-only", "HEAD~1", "HEAD"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        
-        files = result.stdout.strip().split('\n')
-        return [f for f in files if f]  # Remove empty strings
-    except subprocess.CalledProcessError as e:
-        print(f"Error getting changed files: {e}")
-        return []
+# Diff range: the PR's base..head when the workflow provides it
+BASE_SHA = os.getenv("BASE_SHA")
+HEAD_SHA = os.getenv("HEAD_SHA")
+DIFF_RANGE = [BASE_SHA, HEAD_SHA] if BASE_SHA and HEAD_SHA else ["HEAD~1", "HEAD"]
+
+# Incremental review: reuse reviews of hunks already reviewed at a previous head SHA
+REVIEW_INCREMENTAL = os.getenv("REVIEW_INCREMENTAL", "false").lower() == "true"
+REVIEW_STATE_FILE = os.getenv("REVIEW_STATE_FILE", ".review-state.json")
+
+# Concurrency / retry
+REVIEW_MAX_CONCURRENCY = max(1, int(os.getenv("REVIEW_MAX_CONCURRENCY", "4")))
+REVIEW_MAX_RETRIES = max(0, int(os.getenv("REVIEW_MAX_RETRIES", "2")))
+REVIEW_RETRY_BACKOFF = float(os.getenv("REVIEW_RETRY_BACKOFF", "1.0"))
+REVIEW_TIMEOUT = float(os.getenv("REVIEW_TIMEOUT", "60"))
+# Deadline sent to the server (X-Request-Timeout): it cancels the LLM call instead of letting it run on
+# after our own socket timeout. Defaults to a little under REVIEW_TIMEOUT so the server answers first.
+REVIEW_DEADLINE = float(os.getenv("REVIEW_DEADLINE", str(max(1.0, REVIEW_TIMEOUT - 5))))
+# Accept the part of a review generated before the deadline instead of an error
+REVIEW_ALLOW_PARTIAL = os.getenv("REVIEW_ALLOW_PARTIAL", "false").lower() == "true"
+PARTIAL_NOTE = "\n\n_⚠️ Partial review: the server deadline was reached before the model finished._"
+# > 0: send files to /api/review/batch in groups of this size instead of one request per file
+REVIEW_BATCH_SIZE = int(os.getenv("REVIEW_BATCH_SIZE", "0"))
+# Socket timeout of a whole batch request; 0 = REVIEW_TIMEOUT per item in the batch.
+# The batch deadline keeps the same margin below it as REVIEW_DEADLINE does for a single review.
+REVIEW_BATCH_TIMEOUT = float(os.getenv("REVIEW_BATCH_TIMEOUT", "0"))
+# Submit reviews as async jobs and poll for the result instead of holding a request open
+REVIEW_USE_JOBS = os.getenv("REVIEW_USE_JOBS", "false").lower() == "true"
+REVIEW_POLL_INTERVAL = float(os.getenv("REVIEW_POLL_INTERVAL", "2"))
+REVIEW_JOB_TIMEOUT = float(os.getenv("REVIEW_JOB_TIMEOUT", "900"))
+
+# Map-reduce: chunks of every file are reviewed concurrently (map), then the chunk reviews of a file
+# are merged into one deduplicated review and the files into a PR summary (reduce)
+REVIEW_MAP_REDUCE = os.getenv("REVIEW_MAP_REDUCE", "true").lower() == "true"
+# Concurrent LLM requests, shared by the chunks of all files
+REVIEW_FANOUT = max(1, int(os.getenv("REVIEW_FANOUT", str(REVIEW_MAX_CONCURRENCY))))
+# PR-level summary when at least this many files were reviewed (0 = never)
+REVIEW_PR_SUMMARY_MIN_FILES = int(os.getenv("REVIEW_PR_SUMMARY_MIN_FILES", "2"))
 
 def get_file_content(file_path: str) -> str:
     """Get content of a specific file"""
@@ -43,196 +78,265 @@ def get_file_content(file_path: str) -> str:
         print(f"Error reading file {file_path}: {e}")
         return ""
 
-def get_file_diff(file_path: str) -> str:
-    """Get diff of a specific file"""
-    try:
-        result = subprocess.run(
-            ["git", "diff", "HEAD~1", "HEAD", "--", file_path],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        print(f"Error getting diff for {file_path}: {e}")
-        return ""
-
 def get_file_extension(file_path: str) -> str:
     """Get file extension"""
     return Path(file_path).suffix.lower()
 
+# File matchers, built once: set lookups and str.startswith/endswith with tuples
+CODE_EXTENSIONS = frozenset({
+    '.py', '.js', '.ts', '.jsx', '.tsx', '.java', '.cpp', '.c', '.h', 
+    '.hpp', '.go', '.rs', '.rb', '.php', '.swift', '.kt', '.scala',
+    '.cs', '.html', '.css', '.scss', '.sass', '.less', '.vue', '.svelte'
+})
+# Code files without an extension
+CODE_FILENAMES = frozenset({'dockerfile', 'makefile', 'docker-compose.yml'})
+# Hidden files that are not code
+NON_CODE_DOTFILES = frozenset({'.gitignore', '.env', '.env.example'})
+
+IGNORE_PREFIXES = (
+    # Directories
+    'node_modules/', 'vendor/', 'dist/', 'build/', 'out/', 'target/',
+    '__pycache__/', '.git/', '.github/', '.next/', '.nuxt/', '.output/',
+    'coverage/', '.nyc_output/', '.pytest_cache/', '.mypy_cache/',
+    '.ruff_cache/', '.venv/', 'venv/', 'env/', '.env', '.env.',
+    # IDE files
+    '.idea', '.vscode', '.vs',
+)
+IGNORE_SUFFIXES = (
+    # Minified files
+    '.min.js', '.min.css',
+    # Compiled/binary files
+    '.pyc', '.pyo', '.pyd', '.so', '.dll', '.exe', '.dylib', '.class', '.jar', '.war', '.ear',
+    # Log files
+    '.log',
+    # Temporary files
+    '.tmp', '.temp', '.bak', '.swp', '.swo',
+    # OS files
+    '.ds_store',
+    # Image/video files
+    '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg',
+    '.mp4', '.avi', '.mov', '.mkv',
+    '.mp3', '.wav', '.ogg',
+    # Font files
+    '.ttf', '.otf', '.woff', '.woff2',
+    # Archive files
+    '.zip', '.tar', '.gz', '.7z', '.rar',
+    # Document files
+    '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx',
+)
+IGNORE_FILENAMES = frozenset({
+    # Lock files
+    'package-lock.json', 'yarn.lock', 'pnpm-lock.yaml', 'poetry.lock',
+    'pipfile.lock', 'composer.lock', 'gemfile.lock',
+    # OS files
+    'thumbs.db',
+})
+
 def is_code_file(filename: str) -> bool:
     """Check if file is a code file"""
-    code_extensions = {
-        '.py', '.js', '.ts', '.jsx', '.tsx', '.java', '.cpp', '.c', '.h', 
-        '.hpp', '.go', '.rs', '.rb', '.php', '.swift', '.kt', '.scala',
-        '.cs', '.html', '.css', '.scss', '.sass', '.less', '.vue', '.svelte'
-    }
-    file_path = Path(filename)
-    extension = file_path.suffix.lower()
+    extension = Path(filename).suffix.lower()
     
     # Check nếu là file đặc biệt (không có extension nhưng là code)
     if not extension:
-        # Check for files without extension but known as code files
         filename_lower = filename.lower()
-        if filename_lower in ['dockerfile', 'makefile', 'docker-compose.yml']:
+        if filename_lower in CODE_FILENAMES:
             return True
         # Check if file starts with dot (hidden config files)
         if filename_lower.startswith('.'):
-            return filename_lower not in ['.gitignore', '.env', '.env.example']
+            return filename_lower not in NON_CODE_DOTFILES
     
-    return extension in code_extensions
+    return extension in CODE_EXTENSIONS
 
 def should_ignore_file(filename: str) -> bool:
     """Check if file should be ignored"""
     filename_lower = filename.lower()
-    
-    # Các pattern cần ignore
-    ignore_list = [
-        # Lock files
-        'package-lock.json',
-        'yarn.lock',
-        'pnpm-lock.yaml',
-        'poetry.lock',
-        'pipfile.lock',
-        'composer.lock',
-        'gemfile.lock',
-        
-        # Minified files
-        '.min.js',
-        '.min.css',
-        
-        # Compiled/binary files
-        '.pyc',
-        '.pyo',
-        '.pyd',
-        '.so',
-        '.dll',
-        '.exe',
-        '.dylib',
-        '.class',
-        '.jar',
-        '.war',
-        '.ear',
-        
-        # Log files
-        '.log',
-        
-        # Temporary files
-        '.tmp',
-        '.temp',
-        '.bak',
-        '.swp',
-        '.swo',
-        
-        # IDE files
-        '.idea/',
-        '.vscode/',
-        '.vs/',
-        
-        # OS files
-        '.ds_store',
-        'thumbs.db',
-        
-        # Image/video files
-        '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg',
-        '.mp4', '.avi', '.mov', '.mkv',
-        '.mp3', '.wav', '.ogg',
-        
-        # Font files
-        '.ttf', '.otf', '.woff', '.woff2',
-        
-        # Archive files
-        '.zip', '.tar', '.gz', '.7z', '.rar',
-        
-        # Document files
-        '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx',
-    ]
-    
-    # Check các thư mục cần ignore
-    if any(filename_lower.startswith(pattern) for pattern in [
-        'node_modules/',
-        'vendor/',
-        'dist/',
-        'build/',
-        'out/',
-        'target/',
-        '__pycache__/',
-        '.git/',
-        '.github/',
-        '.next/',
-        '.nuxt/',
-        '.output/',
-        'coverage/',
-        '.nyc_output/',
-        '.pytest_cache/',
-        '.mypy_cache/',
-        '.ruff_cache/',
-        '.venv/',
-        'venv/',
-        'env/',
-        '.env',
-        '.env.',
-    ]):
-        return True
-    
-    # Check các file cụ thể
-    for pattern in ignore_list:
-        if pattern.endswith('/'):
-            if filename_lower.startswith(pattern[:-1]):
-                return True
-        elif pattern.startswith('.'):
-            if filename_lower.endswith(pattern):
-                return True
-        elif filename_lower == pattern:
-            return True
-    
-    return False
+    return (filename_lower.startswith(IGNORE_PREFIXES)
+            or filename_lower.endswith(IGNORE_SUFFIXES)
+            or filename_lower in IGNORE_FILENAMES)
 
-def call_llm_api(prompt: str) -> str:
-    """Call LLM API for code review"""
-    try:
-        headers = {
-            'Content-Type': 'application/json',
-            'User-Agent': 'GitHub-Actions-Code-Review'
-        }
-        
-        payload = {
-            'question': prompt
-        }
-        
-        print(f"Calling LLM API at: {LLM_API_URL}")
-        
-        response = requests.post(
-            LLM_API_URL,
-            headers=headers,
-            json=payload,
-            timeout=60
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get('success'):
-                return result.get('answer', 'No review generated')
-            else:
-                return f"API Error: {result.get('error', 'Unknown error')}"
+def should_review(filename: str) -> bool:
+    return is_code_file(filename) and not should_ignore_file(filename)
+
+def get_changed_files() -> List[FileDiff]:
+    """
+    Changed code files of the PR with their hunks, from a single `git diff` over DIFF_RANGE
+    Deleted files and pure renames have nothing to review and are skipped
+    """
+    def report(records: list):
+        print(f"📁 Changed files: {len(records)}")
+
+    files = []
+    for file_diff in iter_file_diffs(DIFF_RANGE, should_review, report):
+        if file_diff.status == 'D':
+            print(f"  Skipping deleted file: {file_diff.path}")
+        elif file_diff.status in ('R', 'C') and not file_diff.hunks:
+            print(f"  Skipping unchanged rename: {file_diff.old_path} -> {file_diff.path}")
         else:
-            return f"HTTP Error {response.status_code}: {response.text}"
-            
-    except requests.exceptions.RequestException as e:
-        return f"Request Error: {str(e)}"
-    except Exception as e:
-        return f"Unexpected Error: {str(e)}"
+            if file_diff.truncated:
+                print(f"  ⚠️  Diff of {file_diff.path} exceeds {REVIEW_MAX_FILE_DIFF_BYTES} bytes, truncated")
+            files.append(file_diff)
+    return files
+
+def create_session(pool_size: int) -> requests.Session:
+    """Create a pooled HTTP session shared by all review workers"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, REVIEW_RETRY_BACKOFF * (2 ** attempt))
+
+def post_with_retry(url: str, payload: Dict[str, Any],
+                    session: Optional[requests.Session] = None,
+                    deadline: float = REVIEW_DEADLINE,
+                    timeout: float = REVIEW_TIMEOUT,
+                    max_retries: int = REVIEW_MAX_RETRIES) -> Any:
+    """
+    POST JSON to the review API, retrying transient failures with jittered backoff
+    Returns the decoded JSON body, or an error string
+    """
+    http = session or requests
+    headers = {
+        'Content-Type': 'application/json',
+        # Compact responses: answer/model/usage only, no echoed prompt or question
+        'Accept': 'application/vnd.llm-review.compact+json, application/json',
+        'User-Agent': 'GitHub-Actions-Code-Review'
+    }
+    if LLM_API_KEY:
+        headers['X-API-Key'] = LLM_API_KEY
+    if deadline > 0:
+        headers['X-Request-Timeout'] = f"{deadline:g}"
+        if REVIEW_ALLOW_PARTIAL:
+            headers['X-Allow-Partial'] = '1'
+
+    print(f"Calling LLM API at: {url}")
+
+    for attempt in range(max_retries + 1):
+        retryable = False
+        try:
+            response = http.post(
+                url,
+                headers=headers,
+                json=payload,
+                timeout=timeout
+            )
+
+            if response.status_code in (200, 202):
+                return response.json()
+
+            # 429 và 5xx là lỗi tạm thời -> thử lại
+            retryable = response.status_code == 429 or response.status_code >= 500
+            error = f"HTTP Error {response.status_code}: {response.text}"
+            retry_after = response.headers.get('Retry-After', '')
+
+        except requests.exceptions.RequestException as e:
+            retryable = True
+            error = f"Request Error: {str(e)}"
+            retry_after = ''
+        except Exception as e:
+            return f"Unexpected Error: {str(e)}"
+
+        if not retryable or attempt == max_retries:
+            return error
+
+        # Rate limited / overloaded: wait as long as the server asks
+        delay = max(backoff_delay(attempt), float(retry_after) if retry_after.isdigit() else 0)
+        print(f"  ↻ {error[:80]} - retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+    return error
+
+def call_llm_job_api(prompt: str, session: Optional[requests.Session] = None) -> str:
+    """Submit a review job, then poll until it finishes or REVIEW_JOB_TIMEOUT expires"""
+    # The job is useless once we stop polling: let the server drop it at the same time
+    submitted = post_with_retry(LLM_JOBS_API_URL, {'question': prompt}, session, REVIEW_JOB_TIMEOUT)
+    if isinstance(submitted, str):
+        return submitted
+
+    http = session or requests
+    status_url = f"{LLM_JOBS_API_URL.rstrip('/')}/{submitted['job_id']}"
+    deadline = time.monotonic() + REVIEW_JOB_TIMEOUT
+    interval = REVIEW_POLL_INTERVAL
+
+    while time.monotonic() < deadline:
+        time.sleep(interval)
+        # Poll less often for long jobs
+        interval = min(interval * 1.5, 10.0)
+        try:
+            response = http.get(status_url, timeout=REVIEW_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            print(f"  ↻ Polling {submitted['job_id']} failed: {str(e)[:80]}")
+            continue
+
+        if response.status_code == 404:
+            return "API Error: Review job expired or not found"
+        if response.status_code != 200:
+            continue
+
+        job = response.json()
+        if job['status'] == 'succeeded':
+            return job['result'].get('answer', 'No review generated') + (PARTIAL_NOTE if job['result'].get('partial') else '')
+        if job['status'] == 'failed':
+            return f"API Error: {job.get('error', 'Unknown error')}"
 
-def format_review_for_pr(file_reviews: Dict[str, str]) -> str:
+    return f"Request Error: Review job {submitted['job_id']} did not finish in {REVIEW_JOB_TIMEOUT:.0f}s"
+
+def call_llm_api(prompt: str, session: Optional[requests.Session] = None) -> str:
+    """Call LLM API for code review"""
+    if REVIEW_USE_JOBS:
+        return call_llm_job_api(prompt, session)
+    result = post_with_retry(LLM_API_URL, {'question': prompt}, session)
+    if isinstance(result, str):
+        return result
+    if result.get('success') or 'answer' in result:
+        return result.get('answer', 'No review generated') + (PARTIAL_NOTE if result.get('partial') else '')
+    return f"API Error: {result.get('error', 'Unknown error')}"
+
+def batch_timeout(size: int) -> Tuple[float, float]:
+    """(socket timeout, server deadline) of a batch request with `size` items"""
+    timeout = REVIEW_BATCH_TIMEOUT if REVIEW_BATCH_TIMEOUT > 0 else REVIEW_TIMEOUT * size
+    return timeout, max(1.0, timeout - (REVIEW_TIMEOUT - REVIEW_DEADLINE))
+
+def call_llm_batch_api(items: List[Dict[str, str]],
+                       session: Optional[requests.Session] = None) -> List[str]:
+    """
+    Call batch LLM API, returns one review per item in item order
+    The batch is not retried as a whole: if it fails, or some items fail or come back
+    partial, those items are reviewed one by one with the single-file timeout and retries.
+    """
+    timeout, deadline = batch_timeout(len(items))
+    result = post_with_retry(LLM_BATCH_API_URL, {'items': items}, session, deadline, timeout, max_retries=0)
+    if isinstance(result, str):
+        print(f"  ↻ Batch of {len(items)} failed ({result[:80]}), reviewing items one by one")
+        return [call_llm_api(item['question'], session) for item in items]
+
+    reviews: List[Optional[str]] = [None] * len(items)
+    for item_result in result.get('results', []):
+        if item_result.get('success') and not item_result.get('partial'):
+            reviews[item_result['index']] = item_result.get('answer', 'No review generated')
+
+    retry = [i for i, review in enumerate(reviews) if review is None]
+    if retry:
+        print(f"  ↻ {len(retry)}/{len(items)} batch item(s) failed or partial, reviewing them one by one")
+        for i in retry:
+            reviews[i] = call_llm_api(items[i]['question'], session)
+    return reviews
+
+def format_review_for_pr(file_reviews: Dict[str, str], pr_summary: Optional[str] = None) -> str:
     """Format review results for PR comment"""
     if not file_reviews:
         return "✅ No code files changed or all changes are in non-code files."
     
     review_text = "### 📊 Code Review Summary\n\n"
     
+    if pr_summary:
+        review_text += f"#### 🧭 Overall\n{pr_summary}\n\n"
+    
     for file_path, review in file_reviews.items():
-        if review.startswith("Error:"):
+        if is_error_review(review):
             review_text += f"#### 📄 {file_path}\n"
             review_text += f"❌ {review}\n\n"
         else:
@@ -241,7 +345,7 @@ def format_review_for_pr(file_reviews: Dict[str, str]) -> str:
     
     # Add summary
     total_files = len(file_reviews)
-    reviewed_files = sum(1 for r in file_reviews.values() if not r.startswith("Error:"))
+    reviewed_files = sum(1 for r in file_reviews.values() if not is_error_review(r))
     
     review_text += "---\n"
     review_text += f"**📈 Summary**: Reviewed {reviewed_files}/{total_files} files\n\n"
@@ -249,23 +353,176 @@ def format_review_for_pr(file_reviews: Dict[str, str]) -> str:
     
     return review_text
 
+def load_review_item(file_diff: FileDiff) -> Optional[Dict[str, str]]:
+    """Read content of a changed file and pair it with its diff, returns None when the file should be skipped"""
+    content = get_file_content(file_diff.path)
+    diff = file_diff.diff
+    
+    if not content and not diff:
+        print(f"  Skipping empty file: {file_diff.path}")
+        return None
+    
+    return {'path': file_diff.path, 'content': content, 'diff': diff}
+
+def join_part_reviews(reviews: List[str]) -> str:
+    """Combine reviews of a file that was split across several prompts"""
+    if len(reviews) == 1:
+        return reviews[0]
+    return "\n\n".join(
+        f"**Part {i}/{len(reviews)}**\n\n{review}" for i, review in enumerate(reviews, 1)
+    )
+
+def is_error_review(review: str) -> bool:
+    """Check if a review is an error message rather than an LLM answer"""
+    return review.startswith(("Error:", "HTTP Error", "Request Error", "API Error", "Unexpected Error"))
+
+def plan_review(file_path: str, item: Dict[str, str],
+                state: Optional[ReviewStateStore] = None) -> Tuple[List[Tuple[str, List[str]]], List[str]]:
+    """
+    Build the prompts to send for a file
+    Returns (prompt, segment keys) pairs, plus the stored reviews reused for
+    segments that were already reviewed (incremental mode only).
+    """
+    # Only changed regions are sent; large changes are split into several prompts
+    segments = build_segments(item['content'], item['diff'])
+    reused: List[str] = []
+    if state is not None:
+        segments, reused = state.partition(file_path, segments)
+        if reused:
+            print(f"  ♻️  {file_path}: reusing {len(reused)} stored review(s)")
+    
+    return pack_for_review(file_path, segments) if segments else [], [
+        f"♻️ *Unchanged since the last reviewed commit*\n\n{review}" for review in reused
+    ]
+
+def record_review(file_path: str, keys: List[str], review: str,
+                  state: Optional[ReviewStateStore] = None):
+    """Store a successful, complete review in the incremental state"""
+    if state is not None and not is_error_review(review) and not review.endswith(PARTIAL_NOTE):
+        state.record(file_path, keys, review)
+
+@dataclass
+class FilePlan:
+    """Prompts (chunks) to send for one file, stored reviews reused for the others, or an error"""
+    path: str
+    prompts: List[Tuple[str, List[str]]] = field(default_factory=list)
+    reused: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+def plan_file(file_diff: FileDiff, state: Optional[ReviewStateStore] = None) -> Optional[FilePlan]:
+    """Split a file into review chunks, returns None when the file should be skipped"""
+    file_path = file_diff.path
+    print(f"🔍 Reviewing: {file_path}")
+    
+    if not os.path.exists(file_path):
+        print(f"  File not found: {file_path}")
+        return FilePlan(file_path, error="Error: File not found in workspace")
+    
+    item = load_review_item(file_diff)
+    if item is None:
+        return None
+    
+    prompts, reused = plan_review(file_path, item, state)
+    if not prompts and not reused:
+        return None
+    return FilePlan(file_path, prompts, reused)
+
+def chunk_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+def map_chunks(plans: List[FilePlan], executor: Executor,
+               session: Optional[requests.Session] = None) -> Dict[str, str]:
+    """
+    Map stage: review the chunks of all files concurrently (REVIEW_FANOUT at a time)
+    Returns reviews by chunk content hash; identical chunks are sent once
+    """
+    chunks: Dict[str, Tuple[str, str]] = {}
+    for plan in plans:
+        for prompt, _ in plan.prompts:
+            chunks.setdefault(chunk_key(prompt), (plan.path, prompt))
+    keys = list(chunks)
+    
+    if REVIEW_BATCH_SIZE > 0:
+        batches = [keys[i:i + REVIEW_BATCH_SIZE] for i in range(0, len(keys), REVIEW_BATCH_SIZE)]
+        print(f"📦 Batch mode: {len(batches)} requests of up to {REVIEW_BATCH_SIZE} chunks")
+        reviews = [
+            review
+            for batch_reviews in executor.map(
+                lambda batch: call_llm_batch_api(
+                    [{'path': chunks[key][0], 'question': chunks[key][1]} for key in batch], session
+                ),
+                batches
+            )
+            for review in batch_reviews
+        ]
+    else:
+        reviews = list(executor.map(lambda key: call_llm_api(chunks[key][1], session), keys))
+    
+    return dict(zip(keys, reviews))
+
+def merge_reviews(header: str, notes: List[Tuple[str, str]], session: Optional[requests.Session] = None,
+                  executor: Optional[Executor] = None) -> Optional[str]:
+    """
+    Merge notes with the LLM; notes that don't fit in one prompt are merged in groups,
+    then the group results are merged again (each prompt stays under REVIEW_TOKEN_BUDGET).
+    Returns None if a merge request fails.
+    """
+    while True:
+        prompts = build_reduce_prompts(header, notes)
+        mapper = executor.map if executor is not None else map
+        results = list(mapper(lambda prompt: call_llm_api(prompt, session), prompts))
+        
+        failed = [result for result in results if is_error_review(result)]
+        if failed:
+            print(f"  ⚠️  Merge failed: {failed[0][:80]}")
+            return None
+        if len(results) == 1:
+            return results[0]
+        notes = [(f"Group {i}", result) for i, result in enumerate(results, 1)]
+
+def reduce_file(plan: FilePlan, reviews: List[str], session: Optional[requests.Session] = None) -> str:
+    """Reduce stage of one file: merge its chunk reviews into one deduplicated review"""
+    if plan.error is not None:
+        return plan.error
+    
+    errors = [review for review in reviews if is_error_review(review)]
+    parts = plan.reused + [review for review in reviews if not is_error_review(review)]
+    if not parts:
+        return errors[0]
+    
+    if REVIEW_MAP_REDUCE and len(parts) > 1:
+        unique = dedupe_findings(parts)
+        review = unique[0] if len(unique) == 1 else merge_reviews(
+            FILE_REDUCE_HEADER.format(path=plan.path),
+            [(f"Part {i}", part) for i, part in enumerate(unique, 1)],
+            session
+        )
+        # Merge failed: keep the chunk reviews as they are
+        review = review or join_part_reviews(parts)
+    else:
+        review = join_part_reviews(parts)
+    
+    if errors:
+        review += f"\n\n⚠️ {len(errors)} part(s) of this file could not be reviewed: {errors[0][:200]}"
+    
+    print(f"  ✓ Review generated for {plan.path} ({len(plan.prompts)} prompt(s), {len(review)} chars)")
+    return review
+
+def summarize_pr(file_reviews: Dict[str, str], executor: Executor,
+                 session: Optional[requests.Session] = None) -> Optional[str]:
+    """PR-level summary over the per-file reviews (None when disabled, too few files or failed)"""
+    notes = [(path, review) for path, review in file_reviews.items() if not is_error_review(review)]
+    if not REVIEW_MAP_REDUCE or REVIEW_PR_SUMMARY_MIN_FILES <= 0 or len(notes) < REVIEW_PR_SUMMARY_MIN_FILES:
+        return None
+    print(f"🧭 Summarizing {len(notes)} file reviews")
+    return merge_reviews(PR_SUMMARY_HEADER.format(count=len(notes)), notes, session, executor)
+
 def main():
     """Main function"""
     print("🤖 Starting AI Code Review...")
     
-    # Get changed files
-    changed_files = get_changed_files()
-    print(f"📁 Changed files: {len(changed_files)}")
-    
-    if not changed_files:
-        print("No files changed. Exiting.")
-        # Set output for GitHub Actions
-        with open(os.environ['GITHUB_OUTPUT'], 'a') as f:
-            f.write(f"has_review=false\n")
-        sys.exit(0)
-    
-    # Filter code files
-    code_files = [f for f in changed_files if is_code_file(f)]
+    # Changed code files and their hunks, from one pass over the PR diff
+    code_files = get_changed_files()
     print(f"📝 Code files to review: {len(code_files)}")
     
     if not code_files:
@@ -276,63 +533,38 @@ def main():
             f.write(f"review_content=✅ No code files changed.\n")
         sys.exit(0)
     
-    # Review each code file
-    file_reviews = {}
+    state = ReviewStateStore(REVIEW_STATE_FILE) if REVIEW_INCREMENTAL else None
+    if state is not None:
+        print(f"♻️  Incremental mode: last reviewed head {state.head_sha or '(none)'}")
     
-    for file_path in code_files:
-        print(f"🔍 Reviewing: {file_path}")
-        
-        if not os.path.exists(file_path):
-            print(f"  File not found: {file_path}")
-            file_reviews[file_path] = "Error: File not found in workspace"
-            continue
-        
-        # Get file content and diff
-        content = get_file_content(file_path)
-        diff = get_file_diff(file_path)
-        
-        if not content and not diff:
-            print(f"  Skipping empty file: {file_path}")
-            continue
-        
-        # Prepare prompt for LLM
-        file_ext = get_file_extension(file_path)
-        language = file_ext.replace('.', '')
-        
-        prompt = f"""
-        Please review the following {language.upper()} code changes:
-        
-        FILE: {file_path}
-        
-        CODE CONTENT:
-        ```
-        {content[:5000]}  # Limit content length
-        ```
-        
-        CHANGES (diff):
-        ```
-        {diff[:5000]}     # Limit diff length
-        ```
-        
-        Please provide a code review focusing on:
-        1. Code quality and readability
-        2. Potential bugs or issues
-        3. Performance considerations
-        4. Security concerns
-        5. Best practices violations
-        6. Suggestions for improvement
-        
-        Keep the review concise and actionable.
-        """
-        
-        # Call LLM API
-        review = call_llm_api(prompt)
-        file_reviews[file_path] = review
-        
-        print(f"  ✓ Review generated ({len(review)} chars)")
+    plans = [plan for plan in (plan_file(f, state) for f in code_files) if plan is not None]
+    chunk_count = sum(len(plan.prompts) for plan in plans)
+    
+    # Map: all chunks of all files concurrently; reduce: merge per file, then the PR summary
+    print(f"⚙️  Fan-out: {REVIEW_FANOUT} concurrent requests for {chunk_count} chunk(s)")
+    with create_session(REVIEW_FANOUT) as session:
+        with ThreadPoolExecutor(max_workers=REVIEW_FANOUT) as executor:
+            chunk_reviews = map_chunks(plans, executor, session)
+            
+            plan_reviews = []
+            for plan in plans:
+                reviews = [chunk_reviews[chunk_key(prompt)] for prompt, _ in plan.prompts]
+                for (_, keys), review in zip(plan.prompts, reviews):
+                    record_review(plan.path, keys, review, state)
+                plan_reviews.append(reviews)
+            
+            file_reviews = dict(zip(
+                [plan.path for plan in plans],
+                executor.map(lambda args: reduce_file(args[0], args[1], session), zip(plans, plan_reviews))
+            ))
+            pr_summary = summarize_pr(file_reviews, executor, session)
+    
+    if state is not None:
+        state.save(HEAD_SHA or DIFF_RANGE[-1])
+        print(f"♻️  Segments sent to LLM: {state.stats['new']}, reused: {state.stats['reused']}")
     
     # Format final review
-    final_review = format_review_for_pr(file_reviews)
+    final_review = format_review_for_pr(file_reviews, pr_summary)
     
     # Set outputs for GitHub Actions
     with open(os.environ['GITHUB_OUTPUT'], 'a') as f:
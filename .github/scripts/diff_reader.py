@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Single-pass diff ingestion for the code review script
+
+One `git diff --raw --patch -z -M` process produces the whole PR diff. The raw
+section (NUL-separated, exact paths, rename detection) comes first, followed
+by one patch per file. The patch stream is parsed line by line into per-file
+hunk records, so only the current file is held in memory, and lines of files
+the caller does not want are never kept.
+
+Patches are matched to raw records by path, not by position: a type change
+(file -> symlink) is one raw record but two patches (delete + add).
+"""
+
+import os
+import re
+import subprocess
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from prompt_builder import Hunk, parse_hunk_header
+
+# Cap on the diff kept for a single file (generated or vendored files can be huge)
+REVIEW_MAX_FILE_DIFF_BYTES = int(os.getenv("REVIEW_MAX_FILE_DIFF_BYTES", str(2 * 1024 * 1024)))
+READ_CHUNK = 64 * 1024
+QUOTED_PAIR_RE = re.compile(r'^("(?:\\.|[^"\\])*") ("(?:\\.|[^"\\])*")$')
+
+@dataclass
+class FileDiff:
+    """Changes of one file: status letter (A, M, D, R, C, T), paths and parsed hunks"""
+    path: str
+    status: str
+    old_path: Optional[str] = None
+    hunks: List[Hunk] = field(default_factory=list)
+    truncated: bool = False
+
+    @property
+    def diff(self) -> str:
+        return "\n".join(h.text for h in self.hunks)
+
+def parse_raw_records(raw: bytes) -> List[Tuple[str, str, Optional[str]]]:
+    """Parse the NUL-separated --raw section into (status, path, old_path) tuples"""
+    fields = raw.split(b"\0")
+    records = []
+    i = 0
+    while i < len(fields):
+        meta = fields[i]
+        if not meta.startswith(b":"):
+            i += 1
+            continue
+        status = meta.split()[-1].decode()[:1]
+        if status in ("R", "C"):
+            old_path, path = fields[i + 1].decode("utf-8", "replace"), fields[i + 2].decode("utf-8", "replace")
+            i += 3
+        else:
+            old_path, path = None, fields[i + 1].decode("utf-8", "replace")
+            i += 2
+        records.append((status, path, old_path))
+    return records
+
+def _unquote(path: str) -> str:
+    """Undo git's C-style quoting of paths with special characters ("a/f\\303\\266o")"""
+    if not path.startswith('"'):
+        return path
+    raw = path[1:-1].encode("latin-1", "backslashreplace").decode("unicode_escape")
+    return raw.encode("latin-1").decode("utf-8", "replace")
+
+def header_path(line: str) -> Optional[str]:
+    """Path of a `diff --git a/X b/X` header when both sides are the same file, else None"""
+    rest = line[len("diff --git "):]
+    quoted = QUOTED_PAIR_RE.match(rest)
+    if quoted:
+        a, b = _unquote(quoted.group(1)), _unquote(quoted.group(2))
+    else:
+        half = (len(rest) - 1) // 2
+        if rest[half:half + 1] != " ":
+            return None
+        a, b = rest[:half], rest[half + 1:]
+    if a.startswith("a/") and b.startswith("b/") and a[2:] == b[2:]:
+        return a[2:]
+    return None
+
+def patch_header_path(line: str, old_path: Optional[str]) -> Optional[str]:
+    """Path named by an extended header line of a patch (rename/copy target, +++ b/X, or --- a/X if deleted)"""
+    for prefix in ("rename to ", "copy to "):
+        if line.startswith(prefix):
+            return _unquote(line[len(prefix):])
+    if line.startswith("+++ "):
+        target = _unquote(line[4:].rstrip("\t"))
+        if target == "/dev/null":
+            return old_path
+        return target[2:] if target.startswith("b/") else None
+    return None
+
+def _iter_lines(pending: bytes, stream) -> Iterator[bytes]:
+    """Split the rest of the output into lines while reading it in fixed-size chunks"""
+    while True:
+        *lines, pending = pending.split(b"\n")
+        yield from lines
+        chunk = stream.read(READ_CHUNK)
+        if not chunk:
+            break
+        pending += chunk
+    if pending:
+        yield pending
+
+def _read_raw_section(stream) -> Tuple[bytes, bytes]:
+    """Read up to the empty field that ends the raw section; returns (raw, rest of buffer)"""
+    buffer = b""
+    while True:
+        end = buffer.find(b"\0\0")
+        if end >= 0:
+            return buffer[:end + 1], buffer[end + 2:]
+        chunk = stream.read(READ_CHUNK)
+        if not chunk:
+            return buffer, b""
+        buffer += chunk
+
+def parse_diff_stream(stream, include: Callable[[str], bool],
+                      on_records: Optional[Callable[[list], None]] = None) -> Iterator[FileDiff]:
+    """
+    Parse `git diff --raw --patch -z` output from a binary stream
+    Yields a FileDiff per file accepted by `include`, as soon as its patch ends
+    """
+    raw, rest = _read_raw_section(stream)
+    records = parse_raw_records(raw)
+    if on_records is not None:
+        on_records(records)
+
+    by_path = {record[1]: record for record in records}
+    current: Optional[FileDiff] = None
+    current_path: Optional[str] = None
+    in_header = False
+    deleted_path: Optional[str] = None
+    hunk: Optional[Hunk] = None
+    size = 0
+
+    for line_bytes in _iter_lines(rest, stream):
+        path = None
+        if line_bytes.startswith(b"diff --git "):
+            in_header, deleted_path, hunk = True, None, None
+            path = header_path(line_bytes.decode("utf-8", "replace"))
+            if path is None:
+                # Rename / copy: the target path comes with the extended header lines
+                if current is not None:
+                    yield current
+                current, current_path = None, None
+                continue
+        elif in_header and not line_bytes.startswith(b"@@"):
+            line = line_bytes.decode("utf-8", "replace")
+            if line.startswith("--- "):
+                source = _unquote(line[4:].rstrip("\t"))
+                deleted_path = source[2:] if source.startswith("a/") else None
+                continue
+            path = patch_header_path(line, deleted_path)
+            if path is None:
+                continue
+        else:
+            in_header = False
+
+        if path is not None:
+            if path != current_path:
+                # A type change repeats the same path for its add patch: keep filling the same file
+                if current is not None:
+                    yield current
+                current, current_path, size = None, path, 0
+                record = by_path.get(path)
+                if record is not None and include(path):
+                    current = FileDiff(path=path, status=record[0], old_path=record[2])
+            continue
+
+        if current is None or current.truncated:
+            continue
+        size += len(line_bytes) + 1
+        if size > REVIEW_MAX_FILE_DIFF_BYTES:
+            current.truncated = True
+            continue
+
+        line = line_bytes.decode("utf-8", "replace")
+        header = parse_hunk_header(line)
+        if header is not None:
+            hunk = header
+            current.hunks.append(hunk)
+        elif hunk is not None and line[:1] in (" ", "+", "-", "\\"):
+            hunk.lines.append(line)
+        elif hunk is not None and line == "":
+            hunk.lines.append(" ")
+        else:
+            hunk = None
+
+    if current is not None:
+        yield current
+
+def iter_file_diffs(diff_range: List[str], include: Callable[[str], bool],
+                    on_records: Optional[Callable[[list], None]] = None) -> Iterator[FileDiff]:
+    """Run one `git diff` for the whole range and yield the files accepted by `include`"""
+    process = subprocess.Popen(
+        ["git", "diff", "--raw", "--patch", "-z", "-M", "--no-color", "--no-ext-diff",
+         "--src-prefix=a/", "--dst-prefix=b/", *diff_range],
+        stdout=subprocess.PIPE
+    )
+    try:
+        yield from parse_diff_stream(process.stdout, include, on_records)
+    finally:
+        process.stdout.close()
+        if process.wait() != 0:
+            print(f"Error: git diff exited with status {process.returncode}")
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Diff-aware prompt builder for the code review script
+
+Instead of sending the whole file cut at 5000 characters, the diff is parsed
+into hunks, each hunk is paired with the surrounding code (its enclosing
+function/class when it can be found), and the pieces are packed into one or
+more prompts that each stay under a token budget.
+"""
+
+import hashlib
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# Configuration
+REVIEW_TOKEN_BUDGET = int(os.getenv("REVIEW_TOKEN_BUDGET", "3000"))
+REVIEW_CONTEXT_LINES = int(os.getenv("REVIEW_CONTEXT_LINES", "10"))
+REVIEW_MAX_SCOPE_LINES = int(os.getenv("REVIEW_MAX_SCOPE_LINES", "150"))
+
+HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@(.*)$")
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+SCOPE_RE = re.compile(
+    r"^\s*(?:export\s+|public\s+|private\s+|protected\s+|static\s+|async\s+|pub\s+)*"
+    r"(?:def|class|function|func|fn|interface|struct|impl|enum|trait|module)\b"
+)
+
+PROMPT_HEADER = """Please review the following {language} code changes:
+
+FILE: {path}{part}
+"""
+
+PROMPT_FOOTER = """
+Please provide a code review focusing on:
+1. Code quality and readability
+2. Potential bugs or issues
+3. Performance considerations
+4. Security concerns
+5. Best practices violations
+6. Suggestions for improvement
+
+Keep the review concise and actionable.
+"""
+
+@dataclass
+class Hunk:
+    """One hunk of a unified diff"""
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    section: str = ""
+    lines: List[str] = field(default_factory=list)
+
+    @property
+    def header(self) -> str:
+        return (f"@@ -{self.old_start},{self.old_count} "
+                f"+{self.new_start},{self.new_count} @@{self.section}")
+
+    @property
+    def text(self) -> str:
+        return "\n".join([self.header] + self.lines)
+
+@dataclass
+class Segment:
+    """A packable unit: changed hunk(s) plus the surrounding code"""
+    context: str
+    diff: str
+    key: str = ""  # Content hash of the originating segment (kept when a segment is split)
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.context) + estimate_tokens(self.diff)
+
+def estimate_tokens(text: str) -> int:
+    """Fast token estimate (words and punctuation), close to BPE counts for code"""
+    return len(TOKEN_RE.findall(text))
+
+def parse_hunk_header(line: str) -> Optional[Hunk]:
+    """Start a hunk from an `@@ -a,b +c,d @@` line, None for any other line"""
+    match = HUNK_HEADER_RE.match(line)
+    if not match:
+        return None
+    old_start, old_count, new_start, new_count, section = match.groups()
+    return Hunk(
+        old_start=int(old_start),
+        old_count=int(old_count) if old_count is not None else 1,
+        new_start=int(new_start),
+        new_count=int(new_count) if new_count is not None else 1,
+        section=section
+    )
+
+def parse_unified_diff(diff: str) -> List[Hunk]:
+    """Parse unified diff text into hunks (file headers are skipped)"""
+    hunks: List[Hunk] = []
+    current: Optional[Hunk] = None
+
+    for line in diff.splitlines():
+        hunk = parse_hunk_header(line)
+        if hunk is not None:
+            current = hunk
+            hunks.append(current)
+        elif current is not None and line[:1] in (" ", "+", "-", "\\"):
+            current.lines.append(line)
+        elif current is not None and line == "":
+            current.lines.append(" ")
+        else:
+            current = None
+
+    return hunks
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+def find_enclosing_scope(lines: List[str], start: int, end: int) -> Optional[Tuple[int, int]]:
+    """
+    Find the function/class enclosing lines[start:end] (0-based, end exclusive)
+    by indentation. Returns (scope_start, scope_end) or None.
+    """
+    if not lines or start >= len(lines):
+        return None
+
+    first = next((l for l in lines[start:end] if l.strip()), lines[start])
+    indent = _indent(first)
+
+    scope_start = None
+    for i in range(min(start, len(lines) - 1), -1, -1):
+        line = lines[i]
+        if line.strip() and SCOPE_RE.match(line) and (_indent(line) < indent or i == start):
+            scope_start = i
+            break
+    if scope_start is None:
+        return None
+
+    scope_indent = _indent(lines[scope_start])
+    scope_end = len(lines)
+    for i in range(max(end, scope_start + 1), len(lines)):
+        line = lines[i]
+        if line.strip() and _indent(line) <= scope_indent:
+            # Closing brace of a brace-style language belongs to the scope
+            scope_end = i + 1 if line.strip().startswith("}") else i
+            break
+
+    if scope_end - scope_start > REVIEW_MAX_SCOPE_LINES:
+        return None
+    return scope_start, scope_end
+
+def _context_window(lines: List[str], hunk: Hunk) -> Tuple[int, int]:
+    """Line range of the new file to show for a hunk (0-based, end exclusive)"""
+    start = max(hunk.new_start - 1, 0)
+    end = min(start + max(hunk.new_count, 1), len(lines))
+
+    scope = find_enclosing_scope(lines, start, end)
+    if scope is not None:
+        return scope
+    return max(start - REVIEW_CONTEXT_LINES, 0), min(end + REVIEW_CONTEXT_LINES, len(lines))
+
+def segment_key(context: str, diff: str) -> str:
+    """
+    Content hash of a segment: the changed lines without hunk headers,
+    so the same change keeps its key when it moves to other line numbers
+    """
+    if diff:
+        body = "\n".join(l for l in diff.splitlines() if not l.startswith("@@"))
+    else:
+        body = context
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()[:16]
+
+def _render_lines(lines: List[str], start: int, end: int) -> str:
+    width = len(str(end))
+    return "\n".join(f"{i + 1:>{width}} | {lines[i]}" for i in range(start, end))
+
+def build_segments(content: str, diff: str) -> List[Segment]:
+    """Pair each hunk with its context; hunks whose windows overlap are merged"""
+    lines = content.splitlines()
+    hunks = parse_unified_diff(diff)
+
+    if not hunks:
+        # No diff available: review the file itself
+        if not lines:
+            return []
+        context = _render_lines(lines, 0, len(lines))
+        return [Segment(context=context, diff="", key=segment_key(context, ""))]
+
+    windows: List[Tuple[int, int, List[Hunk]]] = []
+    for hunk in hunks:
+        start, end = _context_window(lines, hunk)
+        if windows and start <= windows[-1][1]:
+            prev_start, prev_end, prev_hunks = windows[-1]
+            windows[-1] = (prev_start, max(prev_end, end), prev_hunks + [hunk])
+        else:
+            windows.append((start, end, [hunk]))
+
+    segments = []
+    for start, end, window_hunks in windows:
+        context = _render_lines(lines, start, end) if end > start else ""
+        diff_text = "\n".join(h.text for h in window_hunks)
+        segments.append(Segment(context=context, diff=diff_text, key=segment_key(context, diff_text)))
+    return segments
+
+def _split_text(text: str, budget: int) -> List[str]:
+    """Split text by lines into pieces of at most `budget` tokens"""
+    pieces: List[str] = []
+    current: List[str] = []
+    used = 0
+    for line in text.splitlines():
+        cost = estimate_tokens(line) + 1
+        if current and used + cost > budget:
+            pieces.append("\n".join(current))
+            current, used = [], 0
+        current.append(line)
+        used += cost
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+def _fit_segment(segment: Segment, budget: int) -> List[Segment]:
+    """Make a segment fit the budget: drop context first, then split the diff"""
+    if segment.tokens <= budget:
+        return [segment]
+    if estimate_tokens(segment.diff) <= budget and segment.diff:
+        return [Segment(context="", diff=segment.diff, key=segment.key)]
+    if segment.diff:
+        return [Segment(context="", diff=piece, key=segment.key)
+                for piece in _split_text(segment.diff, budget)]
+    return [Segment(context=piece, diff="", key=segment.key)
+            for piece in _split_text(segment.context, budget)]
+
+def pack_segments(segments: List[Segment], budget: int) -> List[List[Segment]]:
+    """Greedily pack segments (in file order) into groups under the token budget"""
+    groups: List[List[Segment]] = []
+    current: List[Segment] = []
+    used = 0
+
+    for segment in segments:
+        for piece in _fit_segment(segment, budget):
+            if current and used + piece.tokens > budget:
+                groups.append(current)
+                current, used = [], 0
+            current.append(piece)
+            used += piece.tokens
+
+    if current:
+        groups.append(current)
+    return groups
+
+def _render_prompt(file_path: str, group: List[Segment], part: int, parts: int) -> str:
+    language = Path(file_path).suffix.lower().replace('.', '').upper() or "CODE"
+    prompt = PROMPT_HEADER.format(
+        language=language,
+        path=file_path,
+        part=f" (part {part}/{parts})" if parts > 1 else ""
+    )
+
+    for segment in group:
+        if segment.context:
+            prompt += f"\nCODE CONTEXT (new version, with line numbers):\n```\n{segment.context}\n```\n"
+        if segment.diff:
+            prompt += f"\nCHANGES (diff):\n```diff\n{segment.diff}\n```\n"
+
+    return prompt + PROMPT_FOOTER
+
+def pack_for_review(file_path: str, segments: List[Segment],
+                    token_budget: int = REVIEW_TOKEN_BUDGET) -> List[Tuple[str, List[str]]]:
+    """
+    Pack segments into prompts under the token budget
+    Returns (prompt, keys of the segments it covers) pairs in file order.
+    """
+    overhead = estimate_tokens(PROMPT_HEADER + PROMPT_FOOTER) + estimate_tokens(file_path) + 20
+    budget = max(token_budget - overhead, 200)
+
+    groups = pack_segments(segments, budget)
+    return [
+        (
+            _render_prompt(file_path, group, i + 1, len(groups)),
+            list(dict.fromkeys(segment.key for segment in group))
+        )
+        for i, group in enumerate(groups)
+    ]
+
+def build_review_prompts(file_path: str, content: str, diff: str,
+                         token_budget: int = REVIEW_TOKEN_BUDGET) -> List[str]:
+    """
+    Build the review prompt(s) for one file
+    Changed regions that don't fit in one prompt are spread across several.
+    """
+    return [
+        prompt
+        for prompt, _ in pack_for_review(file_path, build_segments(content, diff), token_budget)
+    ]
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Reduce stage of the map-reduce review
+
+The map stage reviews every chunk of a PR separately. Here the chunk reviews
+of a file are deduplicated and packed into "merge" prompts (per-file summary),
+and the file summaries into a PR-level summary prompt. When the notes don't
+fit in one prompt under the token budget they are merged in groups, and the
+group results are merged again, so any amount of input is reduced in a
+bounded number of rounds without a prompt ever exceeding the budget.
+"""
+
+import re
+from typing import List, Tuple
+
+from prompt_builder import REVIEW_TOKEN_BUDGET, estimate_tokens
+
+FILE_REDUCE_HEADER = """The following are review notes for different parts of the file {path}, written separately.
+Merge them into one review of the file:
+- Remove duplicate or overlapping findings, keep the most specific wording
+- Keep every distinct issue, with its location (function, line) when given
+- Order by severity: bugs and security first, then performance, then style
+Keep the review concise and actionable.
+"""
+
+PR_SUMMARY_HEADER = """The following are reviews of the {count} changed files of a pull request.
+Write a PR-level summary:
+- The most important issues across all files (bugs, security, performance)
+- Concerns that span several files (API changes, consistency, missing tests)
+- An overall assessment in one or two sentences
+Do not repeat minor per-file style notes.
+"""
+
+# Block boundaries outside code fences: blank lines, list items and headings
+BLOCK_SPLIT_RE = re.compile(r"\n\s*\n|\n(?=\s*(?:[-*•]|\d+[.)]|#{1,6})\s)")
+# A fenced code block up to its closing fence (or the end of the review if unterminated)
+FENCE_RE = re.compile(r"^[ \t]*(`{3,}|~{3,})[^\n]*\n.*?(?:^[ \t]*\1[ \t]*$|\Z)", re.S | re.M)
+NORMALIZE_RE = re.compile(r"[\W_]+")
+
+def _normalize(block: str) -> str:
+    return NORMALIZE_RE.sub(" ", block.lower()).strip()
+
+def _split_blocks(review: str) -> List[str]:
+    """Split a review into blocks; a fenced code block is always one block, blank lines and all"""
+    blocks = []
+    pos = 0
+    for fence in FENCE_RE.finditer(review):
+        blocks.extend(BLOCK_SPLIT_RE.split(review[pos:fence.start()]))
+        blocks.append(fence.group(0))
+        pos = fence.end()
+    blocks.extend(BLOCK_SPLIT_RE.split(review[pos:]))
+    return [block.strip("\n") for block in blocks if block.strip()]
+
+def dedupe_findings(reviews: List[str]) -> List[str]:
+    """
+    Drop blocks (paragraphs, bullets) that already appeared in an earlier review
+    Blocks are compared ignoring case, punctuation and markdown; blocks with nothing to
+    compare (a rule, a lone fence) are always kept, reviews left empty are dropped.
+    """
+    seen = set()
+    result = []
+    for review in reviews:
+        kept = []
+        for block in _split_blocks(review.strip()):
+            key = _normalize(block)
+            if key:
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(block)
+        if kept:
+            result.append("\n\n".join(kept))
+    return result
+
+def truncate_note(text: str, budget: int) -> str:
+    """Cut a note to about `budget` tokens at a line boundary, with an explicit marker"""
+    total = estimate_tokens(text)
+    if total <= budget:
+        return text
+    kept: List[str] = []
+    used = 0
+    for line in text.splitlines():
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept) + f"\n\n[... note truncated: {total - used} of {total} tokens omitted to fit the merge prompt]"
+
+def _pack_notes(header: str, notes: List[Tuple[str, str]], budget: int, note_budget: int) -> List[str]:
+    prompts: List[str] = []
+    current: List[str] = []
+    used = 0
+    for title, text in notes:
+        text = truncate_note(text, max(note_budget - estimate_tokens(title) - 5, 1))
+        section = f"### {title}\n{text}\n"
+        cost = estimate_tokens(section)
+        if current and used + cost > budget:
+            prompts.append(header + "\n" + "\n".join(current))
+            current, used = [], 0
+        current.append(section)
+        used += cost
+    if current:
+        prompts.append(header + "\n" + "\n".join(current))
+    return prompts
+
+def build_reduce_prompts(header: str, notes: List[Tuple[str, str]],
+                         token_budget: int = REVIEW_TOKEN_BUDGET) -> List[str]:
+    """
+    Pack (title, text) notes into merge prompts under the token budget
+    A note larger than the budget is truncated with a marker. When packing would leave every
+    note in a prompt of its own, notes are capped at half the budget so each prompt merges
+    at least two: every round of merging then reduces the number of notes.
+    """
+    overhead = estimate_tokens(header) + 20
+    budget = max(token_budget - overhead, 200)
+
+    prompts = _pack_notes(header, notes, budget, budget)
+    if len(prompts) >= len(notes) > 1:
+        prompts = _pack_notes(header, notes, budget, budget // 2)
+    return prompts
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Local review-state store for incremental reviews
+
+Reviews are stored per file and per segment content hash (see
+prompt_builder.segment_key), so a hunk that was already reviewed at a previous
+head SHA is not sent to the LLM again on the next push.
+"""
+
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from prompt_builder import Segment
+
+class ReviewStateStore:
+    """JSON file keyed by file path -> segment hash -> review parts"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.head_sha: Optional[str] = None
+        self.files: Dict[str, Dict[str, List[str]]] = {}
+        self._seen: Dict[str, Set[str]] = {}
+        self.stats = {"new": 0, "reused": 0}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.head_sha = data.get('head_sha')
+            self.files = data.get('files', {})
+        except Exception as e:
+            print(f"Error reading review state {self.path}: {e}")
+
+    def partition(self, file_path: str,
+                  segments: List[Segment]) -> Tuple[List[Segment], List[str]]:
+        """Split segments into (not yet reviewed, stored reviews of the others)"""
+        stored = self.files.get(file_path, {})
+        new_segments: List[Segment] = []
+        reused: List[str] = []
+
+        with self._lock:
+            seen = self._seen.setdefault(file_path, set())
+            for segment in segments:
+                seen.add(segment.key)
+                if segment.key in stored:
+                    self.stats["reused"] += 1
+                    for review in stored[segment.key]:
+                        if review not in reused:
+                            reused.append(review)
+                else:
+                    self.stats["new"] += 1
+                    new_segments.append(segment)
+
+        return new_segments, reused
+
+    def record(self, file_path: str, keys: List[str], review: str):
+        """Store the review of a prompt under every segment it covered"""
+        with self._lock:
+            file_state = self.files.setdefault(file_path, {})
+            for key in keys:
+                reviews = file_state.setdefault(key, [])
+                if review not in reviews:
+                    reviews.append(review)
+
+    def save(self, head_sha: Optional[str]):
+        """Write state atomically, keeping only segments seen in this run"""
+        with self._lock:
+            files = {
+                file_path: {key: reviews for key, reviews in state.items()
+                            if key in self._seen.get(file_path, set())}
+                for file_path, state in self.files.items()
+                if file_path in self._seen
+            }
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'head_sha': head_sha, 'files': files}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,235 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException
+
+from .backends import NoBackendAvailable, is_retryable_error
+from .config import settings
+from .metrics import registry
+from .profiling import stage
+
+ADMISSION_WAIT = registry.histogram(
+    "llm_admission_wait_seconds", "Thời gian chờ trong hàng đợi trước khi gọi LLM upstream"
+)
+ADMISSION_REJECTED = registry.counter(
+    "llm_admission_rejected_total", "Request bị từ chối do quá tải", ("reason",)
+)
+
+class Overloaded(HTTPException):
+    """Server quá tải: trả 503 nhanh kèm Retry-After thay vì để request timeout"""
+
+    def __init__(self, retry_after: int, reason: str):
+        super().__init__(
+            status_code=503,
+            detail=f"LLM upstream overloaded ({reason}), retry later",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+def is_overload_error(error: Exception) -> bool:
+    """
+    Tín hiệu quá tải của upstream (timeout, mất kết nối, 429, 5xx, hết backend) -> giảm limit
+    Lỗi 4xx (request sai, auth, vượt context) và deadline của client không phản ánh sức chứa upstream
+    """
+    return isinstance(error, NoBackendAvailable) or is_retryable_error(error)
+
+class AdmissionController:
+    """
+    Giới hạn số lời gọi upstream đồng thời với hàng đợi có giới hạn
+    Limit điều chỉnh kiểu AIMD: tăng cộng dần khi latency quanh mức nền,
+    giảm nhân khi latency vượt baseline * tolerance hoặc upstream lỗi.
+    """
+
+    def __init__(self, initial_limit: int, min_limit: int, max_limit: int,
+                 max_queue: int, queue_timeout: float, tolerance: float, backoff: float):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Latency nền (EWMA chậm) theo loại lời gọi: complete / stream (TTFT)
+        self._baseline: Dict[str, float] = {}
+        self._latency: Dict[str, float] = {}
+        # Thời gian giữ slot (EWMA), dùng cho Retry-After và chu kỳ giảm limit
+        self._hold_time = 1.0
+        self._last_decrease = 0.0
+
+    @property
+    def capacity(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Ước lượng số giây tới khi hàng đợi hiện tại được xử lý hết"""
+        return min(60, max(1, math.ceil(self._hold_time * (self.queue_depth + 1) / self.capacity)))
+
+    async def acquire(self):
+        if self.in_flight < self.capacity and not self._waiters:
+            self.in_flight += 1
+            ADMISSION_WAIT.observe(0.0)
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            ADMISSION_REJECTED.inc(1.0, "queue_full")
+            raise Overloaded(self.retry_after(), "queue full")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # Slot đã được cấp đúng lúc bị hủy -> trả lại
+                self._release_slot()
+            else:
+                try:
+                    self._waiters.remove(future)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                ADMISSION_REJECTED.inc(1.0, "queue_timeout")
+                raise Overloaded(self.retry_after(), "queue timeout")
+            raise
+        ADMISSION_WAIT.observe(time.perf_counter() - start)
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < self.capacity:
+            future = self._waiters.popleft()
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def release(self, latency: Optional[float], ok: bool, kind: str = "complete",
+                held: Optional[float] = None):
+        """
+        Trả slot và cập nhật limit
+        latency=None: không có mẫu (client bỏ đi giữa chừng), chỉ trả slot
+        held: thời gian đã giữ slot
+        """
+        if held is not None:
+            self._hold_time = 0.8 * self._hold_time + 0.2 * held
+
+        if not ok:
+            self._decrease()
+        elif latency is not None:
+            baseline = self._baseline.get(kind)
+            if baseline is None:
+                self._baseline[kind] = baseline = latency
+            self._latency[kind] = 0.8 * self._latency.get(kind, latency) + 0.2 * latency
+
+            if latency > baseline * self.tolerance:
+                self._decrease()
+            elif self.in_flight * 2 >= self.capacity:
+                # Additive increase (chỉ khi limit đang thực sự được dùng):
+                # khoảng +1 sau mỗi `limit` request thành công
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            # Baseline giảm nhanh, tăng chậm -> bám theo latency lúc không tải
+            weight = 0.5 if latency < baseline else 0.01
+            self._baseline[kind] = (1 - weight) * baseline + weight * latency
+
+        self._release_slot()
+
+    def _decrease(self):
+        # Chỉ giảm tối đa một lần mỗi chu kỳ latency để tránh sụp limit dây chuyền
+        now = time.monotonic()
+        if now - self._last_decrease < self._hold_time:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit * self.backoff)
+
+    @asynccontextmanager
+    async def slot(self, kind: str = "complete"):
+        """
+        Giữ một slot trong suốt lời gọi upstream
+        Dùng `slot.latency = ...` để ghi mẫu latency khác thời gian giữ slot (vd. TTFT)
+        """
+        with stage("admission"):
+            await self.acquire()
+        ticket = _SlotTicket(time.perf_counter())
+        try:
+            with stage("upstream"):
+                yield ticket
+        except Exception as e:
+            # Lỗi khác (4xx, deadline): trả slot không kèm mẫu latency, không giảm limit
+            self.release(None, ok=not is_overload_error(e), kind=kind, held=time.perf_counter() - ticket.start)
+            raise
+        except BaseException:
+            # Client hủy (GeneratorExit / CancelledError): không phải lỗi upstream
+            self.release(None, ok=True, kind=kind)
+            raise
+        else:
+            held = time.perf_counter() - ticket.start
+            latency = ticket.latency if ticket.latency is not None else held
+            self.release(latency, ok=True, kind=kind, held=held)
+
+    def info(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "baseline_latency": {k: round(v, 4) for k, v in self._baseline.items()},
+            "recent_latency": {k: round(v, 4) for k, v in self._latency.items()},
+            "avg_hold_time": round(self._hold_time, 4)
+        }
+
+class _SlotTicket:
+    def __init__(self, start: float):
+        self.start = start
+        self.latency: Optional[float] = None
+
+@asynccontextmanager
+async def upstream_slot(kind: str = "complete"):
+    """Slot của admission controller, hoặc không giới hạn nếu admission bị tắt"""
+    if admission is None:
+        with stage("upstream"):
+            yield _SlotTicket(time.perf_counter())
+        return
+    async with admission.slot(kind) as ticket:
+        yield ticket
+
+def _collect_admission_metrics():
+    if admission is None:
+        return []
+    return [
+        "# HELP llm_admission_limit Giới hạn số lời gọi upstream đồng thời hiện tại",
+        "# TYPE llm_admission_limit gauge",
+        f"llm_admission_limit {admission.capacity}",
+        "# HELP llm_admission_in_flight Số lời gọi upstream đang chạy",
+        "# TYPE llm_admission_in_flight gauge",
+        f"llm_admission_in_flight {admission.in_flight}",
+        "# HELP llm_admission_queue_depth Số request đang chờ slot",
+        "# TYPE llm_admission_queue_depth gauge",
+        f"llm_admission_queue_depth {admission.queue_depth}",
+    ]
+
+# Tạo instance global (None nếu tắt admission control)
+# Limit tính theo từng backend: thêm GPU box thì sức chứa tăng tương ứng
+admission = AdmissionController(
+    initial_limit=settings.ADMISSION_INITIAL_LIMIT * len(settings.LLM_BACKENDS),
+    min_limit=settings.ADMISSION_MIN_LIMIT,
+    max_limit=settings.ADMISSION_MAX_LIMIT * len(settings.LLM_BACKENDS),
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+    tolerance=settings.ADMISSION_LATENCY_TOLERANCE,
+    backoff=settings.ADMISSION_BACKOFF
+) if settings.ADMISSION_ENABLED else None
+
+registry.add_collector(_collect_admission_metrics)
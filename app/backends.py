@@ -0,0 +1,203 @@
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from .config import settings
+from .metrics import LLM_ERRORS, registry
+
+BACKEND_FAILOVERS = registry.counter(
+    "llm_backend_failovers_total", "Số lần chuyển sang backend khác do lỗi tạm thời", ("backend",)
+)
+
+class NoBackendAvailable(Exception):
+    """Không còn backend nào để thử"""
+
+def is_retryable_error(error: Exception) -> bool:
+    """Lỗi tạm thời của upstream (timeout, mất kết nối, 429, 5xx) -> thử backend khác"""
+    # openai đã được import khi tạo client (Backend.client), ở đây chỉ lấy lại module
+    import openai
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+class Backend:
+    """Một upstream OpenAI-compatible (Ollama box hoặc gateway) và trạng thái sức khỏe của nó"""
+
+    def __init__(self, name: str, base_url: str, api_key: str, model: str, weight: float,
+                 http_client: httpx.AsyncClient, max_retries: int):
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+        self.weight = max(weight, 0.01)
+        self.api_key = api_key
+        self.http_client = http_client
+        self.max_retries = max_retries
+        self._client = None
+        self.outstanding = 0
+        # EWMA latency theo loại lời gọi (complete: giây/token, stream: TTFT)
+        self.ewma: Dict[str, float] = {}
+        # Circuit breaker: closed -> open (sau N lỗi liên tiếp) -> half_open (sau cooldown)
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.successes = 0
+        self.failures = 0
+
+    @property
+    def client(self):
+        """Client OpenAI, tạo lần đầu dùng: import openai mất khoảng 1s, không nằm trong thời gian import app"""
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(
+                base_url=self.base_url,
+                api_key=self.api_key,
+                http_client=self.http_client,
+                max_retries=self.max_retries
+            )
+        return self._client
+
+    @property
+    def has_client(self) -> bool:
+        return self._client is not None
+
+    def info(self) -> dict:
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "model": self.model,
+            "weight": self.weight,
+            "state": self.state,
+            "outstanding": self.outstanding,
+            "ewma_latency": {k: round(v, 4) for k, v in self.ewma.items()},
+            "successes": self.successes,
+            "failures": self.failures
+        }
+
+class BackendPool:
+    """
+    Chọn backend theo least-outstanding-requests hoặc EWMA latency,
+    theo dõi sức khỏe thụ động (circuit breaker) và failover khi lỗi tạm thời
+    """
+
+    def __init__(self, configs: List[dict], http_client: httpx.AsyncClient, policy: str,
+                 failure_threshold: int, cooldown: float):
+        # Nhiều backend: failover thay cho retry tại chỗ của SDK
+        max_retries = settings.LLM_MAX_RETRIES if len(configs) == 1 else 0
+        self.backends = [
+            Backend(
+                name=config["name"],
+                base_url=config["base_url"],
+                api_key=config["api_key"],
+                model=config["model"],
+                weight=config["weight"],
+                http_client=http_client,
+                max_retries=max_retries
+            )
+            for config in configs
+        ]
+        self.policy = policy
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+    def _available(self, backend: Backend, now: float) -> bool:
+        if backend.state == "open" and now - backend.opened_at >= self.cooldown:
+            backend.state = "half_open"
+        if backend.state == "half_open":
+            # Chỉ cho một request thăm dò tại một thời điểm
+            return backend.outstanding == 0
+        return backend.state == "closed"
+
+    def _score(self, backend: Backend, kind: str) -> float:
+        if self.policy == "ewma":
+            # Backend chưa có số liệu được ưu tiên để thu thập EWMA
+            return backend.ewma.get(kind, 0.0) * (backend.outstanding + 1) / backend.weight
+        return backend.outstanding / backend.weight
+
+    def pick(self, kind: str, exclude: Set[str]) -> Optional[Backend]:
+        now = time.monotonic()
+        candidates = [b for b in self.backends if b.name not in exclude and self._available(b, now)]
+        if not candidates:
+            # Tất cả circuit đều mở: thử backend mở lâu nhất thay vì từ chối hẳn
+            remaining = [b for b in self.backends if b.name not in exclude]
+            if not remaining or exclude:
+                return None
+            return min(remaining, key=lambda b: b.opened_at)
+        return min(candidates, key=lambda b: (self._score(b, kind), random.random()))
+
+    async def connect(self, kind: str, request: Callable[[Backend], Awaitable[Any]],
+                      exclude: Optional[Set[str]] = None) -> Tuple[Any, Backend]:
+        """
+        Gọi request trên backend tốt nhất, failover sang backend khác khi lỗi tạm thời
+        backend.outstanding được giữ cho tới khi caller gọi finish()
+        exclude: các backend không được chọn (vd. backend đang chạy lời gọi cần hedge)
+        """
+        tried: Set[str] = set(exclude or ())
+        last_error: Optional[Exception] = None
+
+        while True:
+            backend = self.pick(kind, tried)
+            if backend is None:
+                if last_error is not None:
+                    raise last_error
+                raise NoBackendAvailable("No LLM backend available")
+            tried.add(backend.name)
+
+            backend.outstanding += 1
+            try:
+                return await request(backend), backend
+            except Exception as e:
+                backend.outstanding -= 1
+                LLM_ERRORS.inc(1.0, backend.model, type(e).__name__)
+                if not is_retryable_error(e):
+                    raise
+                self._record_failure(backend)
+                last_error = e
+                if len(tried) < len(self.backends):
+                    BACKEND_FAILOVERS.inc(1.0, backend.name)
+                    print(f"⚠️  Backend {backend.name} failed ({type(e).__name__}), failing over")
+            except BaseException:
+                backend.outstanding -= 1
+                raise
+
+    def finish(self, backend: Backend, kind: str, latency: Optional[float], ok: bool = True):
+        """Kết thúc request trên backend; latency=None khi không có mẫu (client hủy)"""
+        backend.outstanding -= 1
+        if not ok:
+            self._record_failure(backend)
+            return
+        backend.successes += 1
+        backend.consecutive_failures = 0
+        backend.state = "closed"
+        if latency is not None:
+            previous = backend.ewma.get(kind)
+            backend.ewma[kind] = latency if previous is None else 0.7 * previous + 0.3 * latency
+
+    def _record_failure(self, backend: Backend):
+        backend.failures += 1
+        backend.consecutive_failures += 1
+        if backend.state == "half_open" or backend.consecutive_failures >= self.failure_threshold:
+            if backend.state != "open":
+                print(f"🔌 Circuit opened for backend {backend.name}")
+            backend.state = "open"
+            backend.opened_at = time.monotonic()
+
+    def info(self) -> List[dict]:
+        return [backend.info() for backend in self.backends]
+
+    def collect_metrics(self) -> List[str]:
+        states = {"closed": 0, "half_open": 1, "open": 2}
+        lines = [
+            "# HELP llm_backend_outstanding Số request đang chạy trên backend",
+            "# TYPE llm_backend_outstanding gauge",
+        ]
+        lines += [f'llm_backend_outstanding{{backend="{b.name}"}} {b.outstanding}' for b in self.backends]
+        lines += [
+            "# HELP llm_backend_circuit_state Trạng thái circuit (0=closed, 1=half_open, 2=open)",
+            "# TYPE llm_backend_circuit_state gauge",
+        ]
+        lines += [f'llm_backend_circuit_state{{backend="{b.name}"}} {states[b.state]}' for b in self.backends]
+        return lines
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import anyio
+
+from .config import settings
+
+def make_cache_key(model: str, system_prompt: Optional[str], question: str,
+                   temperature: float, max_tokens: int) -> str:
+    """Tạo key content-addressed từ toàn bộ tham số ảnh hưởng tới câu trả lời"""
+    payload = json.dumps(
+        [model, system_prompt or "", question, temperature, max_tokens],
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class SQLiteCacheTier:
+    """Tầng cache trên đĩa (SQLite), giữ kết quả qua các lần restart"""
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if time.time() - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+
+    def reopen(self):
+        """Mở connection mới sau khi fork (connection SQLite không dùng chung giữa các process)"""
+        self._lock = threading.Lock()
+        self._connect()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class ResponseCache:
+    """
+    Cache câu trả lời LLM: tầng LRU trong bộ nhớ (TTL + giới hạn số entry)
+    và tầng SQLite tùy chọn
+    """
+
+    def __init__(self, max_entries: int, ttl: float, db_path: str = ""):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.disk = SQLiteCacheTier(db_path, ttl) if db_path else None
+        self.stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0}
+
+    def _memory_get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        created_at, value = entry
+        if time.monotonic() - created_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _memory_set(self, key: str, value: dict):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[dict]:
+        """Tìm trong bộ nhớ trước, sau đó tới SQLite (chạy trong thread pool)"""
+        value = self._memory_get(key)
+        if value is not None:
+            self.stats["hits"] += 1
+            self.stats["memory_hits"] += 1
+            return value
+
+        if self.disk is not None:
+            value = await anyio.to_thread.run_sync(self.disk.get, key)
+            if value is not None:
+                self._memory_set(key, value)
+                self.stats["hits"] += 1
+                self.stats["disk_hits"] += 1
+                return value
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: dict):
+        self._memory_set(key, value)
+        if self.disk is not None:
+            await anyio.to_thread.run_sync(self.disk.set, key, value)
+
+    def record_bypass(self):
+        self.stats["bypassed"] += 1
+
+    def info(self) -> dict:
+        """Thông tin cache cho endpoint thống kê"""
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "disk_enabled": self.disk is not None
+        }
+
+    def after_fork(self):
+        """Gọi trong worker process sau khi fork (app được preload ở master)"""
+        if self.disk is not None:
+            self.disk.reopen()
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+# Tạo instance global (None nếu cache bị tắt)
+response_cache = ResponseCache(
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+    ttl=settings.LLM_CACHE_TTL,
+    db_path=settings.LLM_CACHE_DB_PATH
+) if settings.LLM_CACHE_ENABLED else None
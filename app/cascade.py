@@ -0,0 +1,174 @@
+import re
+from collections import deque
+from itertools import islice
+from pathlib import Path
+from typing import Deque, Dict, List, Optional
+
+from .config import settings
+from .metrics import registry
+
+CASCADE_REQUESTS = registry.counter(
+    "llm_cascade_requests_total", "Request theo tầng model (fast / full / escalated)", ("tier",)
+)
+
+# Đếm token ước lượng (từ và dấu câu), cùng cách với prompt_builder của script review
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+# Dòng "FILE: path" trong prompt review (review_prompt.py và .github/scripts/prompt_builder.py)
+FILE_RE = re.compile(r"^\s*FILE: (\S+)", re.M)
+
+# Model nhanh được dặn trả về marker này khi không đủ chắc chắn -> chuyển lên model lớn
+ESCALATE_MARKER = "[ESCALATE]"
+ESCALATE_INSTRUCTION = (
+    f"\n\nNếu thay đổi quá phức tạp để review chắc chắn (logic khó, concurrency, bảo mật, "
+    f"thiếu ngữ cảnh), chỉ trả lời đúng một dòng: {ESCALATE_MARKER}"
+)
+
+def get_file_extension(file_path: str) -> str:
+    """Đuôi file viết thường (cùng cách với get_file_extension của code_review.py)"""
+    return Path(file_path).suffix.lower()
+
+class Route:
+    """Quyết định định tuyến của một request: tầng, model (None = model của backend) và max_tokens"""
+
+    def __init__(self, tier: str, model: Optional[str], max_tokens: int, features: dict):
+        self.tier = tier
+        self.model = model
+        self.max_tokens = max_tokens
+        self.features = features
+
+class _TierStats:
+    def __init__(self, window: int = 500):
+        self.requests = 0
+        self.tokens = 0
+        self.latency_sum = 0.0
+        self._latencies: Deque[float] = deque(maxlen=window)
+
+    def record(self, latency: float, tokens: int):
+        self.requests += 1
+        self.tokens += tokens
+        self.latency_sum += latency
+        self._latencies.append(latency)
+
+    def info(self) -> dict:
+        ordered = sorted(self._latencies)
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4) if ordered else None
+        return {
+            "requests": self.requests,
+            "tokens": self.tokens,
+            "avg_latency": round(self.latency_sum / self.requests, 4) if self.requests else None,
+            "p50_latency": pick(0.5),
+            "p95_latency": pick(0.95)
+        }
+
+class ModelCascade:
+    """
+    Định tuyến theo tầng: request nhỏ / đơn giản (ít dòng diff, ít token, loại file không
+    nằm trong danh sách phức tạp) tới model nhanh với max_tokens nhỏ; còn lại tới model chính.
+    Câu trả lời của model nhanh bị chuyển lên model chính khi nó tự đánh dấu không chắc chắn,
+    bị cắt vì hết max_tokens hoặc rỗng.
+    """
+
+    def __init__(self, fast_model: str, fast_max_tokens: int, full_max_tokens: int,
+                 max_diff_lines: int, max_prompt_tokens: int, full_extensions: List[str],
+                 escalate: bool):
+        self.fast_model = fast_model
+        self.fast_max_tokens = fast_max_tokens
+        self.full_max_tokens = full_max_tokens
+        self.max_diff_lines = max_diff_lines
+        self.max_prompt_tokens = max_prompt_tokens
+        self.full_extensions = frozenset(full_extensions)
+        self.escalate = escalate
+        self.tiers: Dict[str, _TierStats] = {"fast": _TierStats(), "full": _TierStats()}
+        self.stats = {"escalated": 0, "escalation_reasons": {}, "escalation_wasted_tokens": 0}
+
+    def classify(self, question: str) -> dict:
+        """
+        Đặc trưng của request: đuôi file, số token ước lượng, số dòng diff (+/-)
+        Dừng sớm khi đã vượt ngưỡng: prompt lớn không cần đếm hết (token / dòng diff bị chặn ở ngưỡng + 1)
+        """
+        match = FILE_RE.search(question)
+        features = {
+            "extension": get_file_extension(match.group(1)) if match else "",
+            "tokens": sum(1 for _ in islice(TOKEN_RE.finditer(question), self.max_prompt_tokens + 1)),
+            "diff_lines": 0
+        }
+        if features["tokens"] > self.max_prompt_tokens or features["extension"] in self.full_extensions:
+            return features
+        for line in question.splitlines():
+            line = line.lstrip()
+            if line[:1] in ("+", "-") and not line.startswith(("+++", "---")):
+                features["diff_lines"] += 1
+                if features["diff_lines"] > self.max_diff_lines:
+                    break
+        return features
+
+    def route(self, question: str) -> Route:
+        features = self.classify(question)
+        simple = (
+            features["diff_lines"] <= self.max_diff_lines
+            and features["tokens"] <= self.max_prompt_tokens
+            and features["extension"] not in self.full_extensions
+        )
+        if simple:
+            return Route("fast", self.fast_model, self.fast_max_tokens, features)
+        return Route("full", None, self.full_max_tokens, features)
+
+    def fast_messages(self, messages: list) -> list:
+        """Messages cho model nhanh: thêm hướng dẫn escalate vào system prompt"""
+        if not self.escalate:
+            return messages
+        if messages and messages[0]["role"] == "system":
+            return [{"role": "system", "content": messages[0]["content"] + ESCALATE_INSTRUCTION}] + messages[1:]
+        return [{"role": "system", "content": ESCALATE_INSTRUCTION.strip()}] + messages
+
+    def escalation_reason(self, answer: Optional[str], finish_reason: Optional[str]) -> Optional[str]:
+        """Lý do chuyển câu trả lời của model nhanh lên model chính (None = giữ lại)"""
+        if not self.escalate:
+            return None
+        if not answer or not answer.strip():
+            return "empty"
+        if ESCALATE_MARKER in answer:
+            return "low_confidence"
+        if finish_reason == "length":
+            return "truncated"
+        return None
+
+    def record(self, tier: str, latency: float, tokens: int):
+        self.tiers[tier].record(latency, tokens)
+        CASCADE_REQUESTS.inc(1.0, tier)
+
+    def record_escalation(self, reason: str, wasted_tokens: int):
+        self.stats["escalated"] += 1
+        self.stats["escalation_reasons"][reason] = self.stats["escalation_reasons"].get(reason, 0) + 1
+        self.stats["escalation_wasted_tokens"] += wasted_tokens
+        CASCADE_REQUESTS.inc(1.0, "escalated")
+
+    def info(self) -> dict:
+        fast = self.tiers["fast"]
+        # Token do model nhanh xử lý thay model chính (trừ phần phí cho các lần escalate)
+        avoided = fast.tokens - self.stats["escalation_wasted_tokens"]
+        return {
+            "fast_model": self.fast_model,
+            "fast_max_tokens": self.fast_max_tokens,
+            "thresholds": {
+                "max_diff_lines": self.max_diff_lines,
+                "max_prompt_tokens": self.max_prompt_tokens,
+                "full_extensions": sorted(self.full_extensions)
+            },
+            "tiers": {name: tier.info() for name, tier in self.tiers.items()},
+            **self.stats,
+            "escalation_rate": round(self.stats["escalated"] / fast.requests, 4) if fast.requests else 0.0,
+            "full_model_tokens_avoided": avoided,
+            "net_tokens_saved": avoided - self.stats["escalation_wasted_tokens"]
+        }
+
+# Tạo instance global (None nếu không bật cascade hoặc chưa cấu hình model nhanh)
+cascade = ModelCascade(
+    fast_model=settings.LLM_FAST_MODEL,
+    fast_max_tokens=settings.LLM_FAST_MAX_TOKENS,
+    full_max_tokens=settings.AI_MAX_TOKENS,
+    max_diff_lines=settings.LLM_CASCADE_MAX_DIFF_LINES,
+    max_prompt_tokens=settings.LLM_CASCADE_MAX_PROMPT_TOKENS,
+    full_extensions=[e.strip().lower() for e in settings.LLM_CASCADE_FULL_EXTENSIONS.split(",") if e.strip()],
+    escalate=settings.LLM_CASCADE_ESCALATE
+) if settings.LLM_CASCADE_ENABLED and settings.LLM_FAST_MODEL else None
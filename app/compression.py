@@ -0,0 +1,94 @@
+import gzip
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # brotli là tùy chọn, fallback gzip
+    brotli = None
+
+# Stream (SSE / JSON lines) không nén: nén sẽ giữ token lại trong buffer
+STREAMING_TYPES = (b"text/event-stream", b"application/x-ndjson")
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Chọn encoding theo Accept-Encoding của client: ưu tiên br, sau đó gzip"""
+    accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+class CompressionMiddleware:
+    """
+    ASGI middleware nén response (brotli hoặc gzip) cho body lớn
+    Chỉ nén response có body trọn vẹn (JSON review), không đụng tới streaming
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            headers = dict(start_message.get("headers", []))
+            body = message.get("body", b"")
+            content_type = headers.get(b"content-type", b"")
+            if (message.get("more_body", False)
+                    or b"content-encoding" in headers
+                    or content_type.startswith(STREAMING_TYPES)
+                    or len(body) < self.minimum_size):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            if encoding == "br":
+                body = brotli.compress(body, quality=self.brotli_quality)
+            else:
+                body = gzip.compress(body, compresslevel=self.gzip_level)
+
+            response_headers = [
+                (name, value) for name, value in start_message.get("headers", [])
+                if name not in (b"content-length", b"vary")
+            ]
+            response_headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(body)).encode()),
+                (b"vary", headers[b"vary"] + b", Accept-Encoding" if b"vary" in headers else b"Accept-Encoding"),
+            ]
+            await send({**start_message, "headers": response_headers})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
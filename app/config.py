@@ -1,63 +1,183 @@
+import json
 import os
-from pathlib import Path
+from typing import List
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-def read_prompt_file(file_path: str) -> str:
-    """Đọc nội dung prompt từ file"""
-    try:
-        # Nếu đường dẫn tương đối, bắt đầu từ thư mục gốc
-        if not os.path.isabs(file_path):
-            base_dir = Path(__file__).parent.parent
-            file_path = base_dir / file_path
-        
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read().strip()
-        else:
-            print(f"Warning: Prompt file not found: {file_path}")
-            return ""
-    except Exception as e:
-        print(f"Error reading prompt file {file_path}: {e}")
-        return ""
+def parse_backends(raw: str, default_url: str, default_key: str, default_model: str) -> List[dict]:
+    """
+    Đọc danh sách backend LLM từ JSON:
+    [{"name": "gpu-1", "base_url": "...", "api_key": "...", "model": "...", "weight": 1}]
+    Trường thiếu lấy theo cấu hình OLLAMA_*; để trống = một backend duy nhất
+    """
+    entries = []
+    if raw.strip():
+        try:
+            entries = json.loads(raw)
+        except json.JSONDecodeError as e:
+            print(f"Error parsing LLM_BACKENDS: {e}")
+    if not entries:
+        entries = [{}]
+
+    backends = []
+    for i, entry in enumerate(entries):
+        backends.append({
+            "name": entry.get("name") or f"backend-{i}",
+            "base_url": entry.get("base_url") or default_url,
+            "api_key": entry.get("api_key") or default_key,
+            "model": entry.get("model") or default_model,
+            "weight": float(entry.get("weight", 1))
+        })
+    return backends
 
 class Settings:
     # Server
     HOST = os.getenv("HOST", "127.0.0.1")
     PORT = int(os.getenv("PORT", 8000))
     DEBUG = os.getenv("DEBUG", "true").lower() == "true"
+
+    # Production launcher (serve.py)
+    # Mặc định 1 process: admission limit, single-flight, LRU cache và health probe là state trong process,
+    # N worker = N bộ giới hạn độc lập (upstream nhận tới N x ADMISSION_MAX_LIMIT). 0 = số CPU
+    WORKERS = int(os.getenv("WORKERS", "1"))
+    WORKER_MAX_REQUESTS = int(os.getenv("WORKER_MAX_REQUESTS", "1000"))  # 0 = không recycle worker
+    WORKER_MAX_REQUESTS_JITTER = int(os.getenv("WORKER_MAX_REQUESTS_JITTER", "100"))
+    GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "120"))  # Thời gian chờ stream đang chạy khi SIGTERM
+    COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))  # Byte; response nhỏ hơn không nén
     
     # Ollama
     OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1")
     OLLAMA_API_KEY = os.getenv("OLLAMA_API_KEY", "sk-H9RCqvDaG5_NEPEyFOJxHw")
     OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemini/gemini-2.0-flash-lite")
+
+    # Backend pool (nhiều Ollama box / gateway OpenAI-compatible)
+    LLM_BACKENDS = parse_backends(
+        os.getenv("LLM_BACKENDS", ""), OLLAMA_BASE_URL, OLLAMA_API_KEY, OLLAMA_MODEL
+    )
+    LLM_ROUTING_POLICY = os.getenv("LLM_ROUTING_POLICY", "least_outstanding")  # least_outstanding | ewma
+    LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "3"))
+    LLM_CIRCUIT_COOLDOWN = float(os.getenv("LLM_CIRCUIT_COOLDOWN", "30"))
+
+    # Review job queue (POST /api/review/jobs)
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+    JOB_MAX_QUEUE = int(os.getenv("JOB_MAX_QUEUE", "1000"))
+    JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+    JOB_CALLBACK_TIMEOUT = float(os.getenv("JOB_CALLBACK_TIMEOUT", "10"))
+    JOB_CALLBACK_ALLOWED_HOSTS = os.getenv("JOB_CALLBACK_ALLOWED_HOSTS", "127.0.0.1,localhost,::1")
+    JOB_DB_PATH = os.getenv("JOB_DB_PATH", "")  # Cần khi chạy nhiều worker process (poll có thể tới worker khác)
+
+    # Rate limit theo client (API key đã đăng ký hoặc IP): request/giây và token LLM/phút
+    # Tắt mặc định; bật bằng RATE_LIMIT_ENABLED=true. Sau reverse proxy cần RATE_LIMIT_TRUST_FORWARDED=true,
+    # nếu không mọi client dùng chung bucket của IP proxy
+    RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "false").lower() == "true"
+    RATE_LIMIT_REQUESTS_PER_SECOND = float(os.getenv("RATE_LIMIT_REQUESTS_PER_SECOND", "5"))
+    RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "20"))
+    RATE_LIMIT_TOKENS_PER_MINUTE = int(os.getenv("RATE_LIMIT_TOKENS_PER_MINUTE", "200000"))  # 0 = không giới hạn token
+    RATE_LIMIT_API_KEYS = os.getenv("RATE_LIMIT_API_KEYS", "")  # Các key hợp lệ, phân cách bằng dấu phẩy
+    RATE_LIMIT_API_KEY_HEADER = os.getenv("RATE_LIMIT_API_KEY_HEADER", "X-API-Key")
+    RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"  # Sau reverse proxy
+    RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+    RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "")  # SQLite dùng chung để giới hạn đúng khi chạy nhiều worker
+
+    # Request log (JSONL, ghi nền theo lô, xoay vòng + gzip); để trống = tắt
+    # {pid} trong đường dẫn để mỗi worker process ghi file riêng
+    REQUEST_LOG_PATH = os.getenv("REQUEST_LOG_PATH", "")
+    REQUEST_LOG_MAX_BYTES = int(os.getenv("REQUEST_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+    REQUEST_LOG_BACKUPS = int(os.getenv("REQUEST_LOG_BACKUPS", "10"))
+    REQUEST_LOG_BATCH_SIZE = int(os.getenv("REQUEST_LOG_BATCH_SIZE", "200"))
+    REQUEST_LOG_FLUSH_INTERVAL = float(os.getenv("REQUEST_LOG_FLUSH_INTERVAL", "1"))
+    REQUEST_LOG_MAX_QUEUE = int(os.getenv("REQUEST_LOG_MAX_QUEUE", "10000"))
+    REQUEST_LOG_MAX_BODY = int(os.getenv("REQUEST_LOG_MAX_BODY", "65536"))
+
+    # Health probe (chạy nền, /health trả kết quả từ bộ nhớ)
+    HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "10"))
+    HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "3"))
     
     # AI
     AI_MAX_TOKENS = int(os.getenv("AI_MAX_TOKENS", "4000"))
     AI_TEMPERATURE = float(os.getenv("AI_TEMPERATURE", "0.7"))
-    
+    # Giữ model (và KV cache của system prompt) trong bộ nhớ upstream, vd. "30m"; để trống = mặc định của upstream
+    LLM_KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE", "")
+
+    # HTTP connection pool tới LLM upstream
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+    LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+    LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "600"))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    # Tạo client LLM (import openai) trong background ngay khi startup thay vì ở request đầu tiên
+    LLM_WARMUP_ON_STARTUP = os.getenv("LLM_WARMUP_ON_STARTUP", "true").lower() == "true"
+
+    # Deadline mặc định (giây) khi client không gửi X-Request-Timeout / X-Request-Deadline; 0 = không giới hạn
+    LLM_DEFAULT_DEADLINE = float(os.getenv("LLM_DEFAULT_DEADLINE", "0"))
+    # Hedged request: gửi thêm bản sao tới backend / model khác khi lời gọi đầu chậm hơn quantile latency
+    LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+    LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1"))  # Giây, delay tối thiểu trước khi hedge
+    LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))  # Chưa đủ mẫu latency thì không hedge
+    LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))  # Tỷ lệ tối đa request được hedge
+    LLM_HEDGE_MODEL = os.getenv("LLM_HEDGE_MODEL", "")  # Model cho bản sao; để trống = model của backend
+
+    # Model cascade: request nhỏ / đơn giản tới model nhanh, escalate lên model chính khi không chắc chắn
+    LLM_CASCADE_ENABLED = os.getenv("LLM_CASCADE_ENABLED", "false").lower() == "true"
+    LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", "")  # Model nhanh (phải có trên mọi backend)
+    LLM_FAST_MAX_TOKENS = int(os.getenv("LLM_FAST_MAX_TOKENS", "1000"))
+    LLM_CASCADE_MAX_DIFF_LINES = int(os.getenv("LLM_CASCADE_MAX_DIFF_LINES", "40"))  # Số dòng +/- tối đa cho model nhanh
+    LLM_CASCADE_MAX_PROMPT_TOKENS = int(os.getenv("LLM_CASCADE_MAX_PROMPT_TOKENS", "1500"))
+    LLM_CASCADE_FULL_EXTENSIONS = os.getenv("LLM_CASCADE_FULL_EXTENSIONS", ".c,.cpp,.h,.hpp,.rs")  # Luôn dùng model chính
+    LLM_CASCADE_ESCALATE = os.getenv("LLM_CASCADE_ESCALATE", "true").lower() == "true"
+
+    # Profiling cho admin: request chậm nhất theo giai đoạn, sampling profiler theo header X-Profile
+    PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILING_ADMIN_TOKEN = os.getenv("PROFILING_ADMIN_TOKEN", "")  # Gửi qua header X-Admin-Token; để trống = không ai truy cập được
+    PROFILING_SAMPLE_INTERVAL = float(os.getenv("PROFILING_SAMPLE_INTERVAL", "0.005"))  # Giây giữa hai mẫu stack
+    PROFILING_MAX_PROFILES = int(os.getenv("PROFILING_MAX_PROFILES", "20"))  # Số profile gần nhất được giữ
+    PROFILING_SLOW_REQUESTS = int(os.getenv("PROFILING_SLOW_REQUESTS", "20"))  # N request chậm nhất
+    PROFILING_SLOW_WINDOW = float(os.getenv("PROFILING_SLOW_WINDOW", "3600"))  # Giây, cửa sổ của danh sách request chậm
+
+    # Admission control (giới hạn lời gọi upstream đồng thời, AIMD)
+    ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    ADMISSION_INITIAL_LIMIT = int(os.getenv("ADMISSION_INITIAL_LIMIT", "4"))
+    ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", "1"))
+    ADMISSION_MAX_LIMIT = int(os.getenv("ADMISSION_MAX_LIMIT", "32"))
+    ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+    ADMISSION_LATENCY_TOLERANCE = float(os.getenv("ADMISSION_LATENCY_TOLERANCE", "2.0"))
+    ADMISSION_BACKOFF = float(os.getenv("ADMISSION_BACKOFF", "0.8"))
+
+    # Batch review
+    BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+    BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+    # Response cache (LRU trong bộ nhớ + SQLite tùy chọn)
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+    LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+    LLM_CACHE_DB_PATH = os.getenv("LLM_CACHE_DB_PATH", "")  # Để trống = không dùng tầng đĩa
+    # Cache gần trùng lặp: file chỉ đổi khoảng trắng / comment / tên biến dùng lại review cũ
+    LLM_SIMILARITY_CACHE_ENABLED = os.getenv("LLM_SIMILARITY_CACHE_ENABLED", "false").lower() == "true"
+    LLM_SIMILARITY_MAX_ENTRIES = int(os.getenv("LLM_SIMILARITY_MAX_ENTRIES", "20000"))
+
     # Prompt file paths
     AI_SYSTEM_PROMPT_FILE = os.getenv("AI_SYSTEM_PROMPT_FILE", "prompt.txt")
     AI_CODE_REVIEW_PROMPT_FILE = os.getenv("AI_CODE_REVIEW_PROMPT_FILE", "prompt.txt")
-    
-    # Lazy-loaded prompts
-    _system_prompt = None
-    _code_review_prompt = None
+    # Prompt đặt tên thêm, chọn theo request: "security=prompts/security.txt,style=prompts/style.txt"
+    PROMPT_FILES = os.getenv("PROMPT_FILES", "")
+    PROMPT_RELOAD_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", "2"))
     
     @property
     def AI_SYSTEM_PROMPT(self) -> str:
-        """Lấy system prompt từ file (lazy loading)"""
-        if self._system_prompt is None:
-            self._system_prompt = read_prompt_file(self.AI_SYSTEM_PROMPT_FILE)
-        return self._system_prompt
+        """Lấy system prompt từ prompt store (tự nạp lại khi file thay đổi)"""
+        from .prompt_store import prompt_store
+        return prompt_store.get("system").content
     
     @property
     def AI_CODE_REVIEW_PROMPT(self) -> str:
-        """Lấy code review prompt từ file (lazy loading)"""
-        if self._code_review_prompt is None:
-            self._code_review_prompt = read_prompt_file(self.AI_CODE_REVIEW_PROMPT_FILE)
-        return self._code_review_prompt
+        """Lấy code review prompt từ prompt store (tự nạp lại khi file thay đổi)"""
+        from .prompt_store import prompt_store
+        return prompt_store.get("code_review").content
 
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,61 @@
+import contextvars
+import time
+from typing import Optional
+
+from fastapi import HTTPException, Request
+
+from .config import settings
+from .metrics import registry
+
+DEADLINE_EXCEEDED = registry.counter(
+    "llm_deadline_exceeded_total", "Request hết deadline trước khi upstream trả lời xong", ("outcome",)
+)
+
+class Deadline:
+    """Thời điểm hết hạn (monotonic) của request hiện tại và client có nhận kết quả dở dang không"""
+
+    def __init__(self, at: float, allow_partial: bool):
+        self.at = at
+        self.allow_partial = allow_partial
+
+    def remaining(self) -> float:
+        return max(0.0, self.at - time.monotonic())
+
+# Deadline của request hiện tại, điền bởi apply_deadline (None = không giới hạn)
+current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("current_deadline", default=None)
+
+class DeadlineExceeded(HTTPException):
+    """Hết deadline của client: trả 504, lời gọi upstream đã bị hủy"""
+
+    def __init__(self):
+        super().__init__(status_code=504, detail="Request deadline exceeded")
+
+    def __str__(self) -> str:
+        # Lỗi của item batch / job được ghi bằng str(e)
+        return self.detail
+
+def parse_deadline(headers) -> Optional[float]:
+    """
+    Số giây còn lại theo header của client:
+    - X-Request-Timeout: số giây (tương đối, không phụ thuộc lệch đồng hồ)
+    - X-Request-Deadline: unix timestamp (giây) tuyệt đối
+    Không có header -> LLM_DEFAULT_DEADLINE (0 = không giới hạn)
+    """
+    try:
+        timeout = headers.get("x-request-timeout")
+        if timeout:
+            return max(0.0, float(timeout))
+        deadline = headers.get("x-request-deadline")
+        if deadline:
+            return max(0.0, float(deadline) - time.time())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid X-Request-Timeout / X-Request-Deadline header")
+    return settings.LLM_DEFAULT_DEADLINE or None
+
+async def apply_deadline(request: Request):
+    """Dependency cho các endpoint gọi LLM: ghi nhận deadline của request hiện tại"""
+    seconds = parse_deadline(request.headers)
+    if seconds is None:
+        return
+    allow_partial = request.headers.get("x-allow-partial", "").lower() in ("1", "true", "yes")
+    current_deadline.set(Deadline(time.monotonic() + seconds, allow_partial))
@@ -0,0 +1,99 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+import anyio
+import httpx
+
+from .config import settings
+
+class HealthProber:
+    """
+    Kiểm tra các LLM backend định kỳ trong background task (httpx async)
+    và giữ kết quả trong bộ nhớ, để /health không phải gọi upstream
+    """
+
+    def __init__(self, backends: list, interval: float, timeout: float):
+        self.backends = backends
+        self.interval = interval
+        self.timeout = timeout
+        self.results: Dict[str, dict] = {}
+        self.last_probe: Optional[float] = None  # time.time() của lần probe gần nhất
+        self._task: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def start(self):
+        """Chạy prober nếu chưa chạy (gọi lúc startup hoặc lần đầu có request health)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _run(self):
+        if self._client is None:
+            # Tạo client (nạp SSL context, ~0.2s lần đầu) trong thread để không chặn startup
+            self._client = await anyio.to_thread.run_sync(lambda: httpx.AsyncClient(timeout=self.timeout))
+        while True:
+            await self.probe_all()
+            await asyncio.sleep(self.interval)
+
+    async def probe_all(self):
+        """Probe song song mọi backend, một backend chậm không làm trễ các backend khác"""
+        await asyncio.gather(*(self._probe(backend) for backend in self.backends))
+        self.last_probe = time.time()
+
+    async def _probe(self, backend: dict):
+        # /models có ở cả Ollama (/v1) lẫn các gateway OpenAI-compatible
+        url = backend["base_url"].rstrip("/") + "/models"
+        start = time.perf_counter()
+        try:
+            response = await self._client.get(url, headers={"Authorization": f"Bearer {backend['api_key']}"})
+            ok = response.status_code == 200
+            error = None if ok else f"HTTP {response.status_code}"
+        except Exception as e:
+            ok = False
+            error = f"{type(e).__name__}: {e}"
+
+        self.results[backend["name"]] = {
+            "name": backend["name"],
+            "ok": ok,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            "error": error,
+            "checked_at": time.time()
+        }
+
+    def staleness(self) -> Optional[float]:
+        """Số giây kể từ lần probe gần nhất (None nếu chưa probe lần nào)"""
+        if self.last_probe is None:
+            return None
+        return round(time.time() - self.last_probe, 3)
+
+    def snapshot(self) -> dict:
+        """Kết quả gần nhất từ bộ nhớ, kèm độ cũ của số liệu"""
+        staleness = self.staleness()
+        backends = [self.results[b["name"]] for b in self.backends if b["name"] in self.results]
+        return {
+            "upstream_ok": any(b["ok"] for b in backends),
+            "backends": backends,
+            "probe_interval": self.interval,
+            "staleness_seconds": staleness,
+            # Quá 3 chu kỳ chưa có kết quả mới -> prober có thể đã chết
+            "stale": staleness is None or staleness > 3 * self.interval
+        }
+
+# Tạo instance global
+health_prober = HealthProber(
+    settings.LLM_BACKENDS,
+    interval=settings.HEALTH_PROBE_INTERVAL,
+    timeout=settings.HEALTH_PROBE_TIMEOUT
+)
@@ -0,0 +1,161 @@
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from .backends import Backend, BackendPool
+from .config import settings
+from .metrics import registry
+
+HEDGED_REQUESTS = registry.counter(
+    "llm_hedged_requests_total", "Request gửi thêm bản sao (hedge) tới backend / model khác", ("outcome",)
+)
+
+class LatencyWindow:
+    """Latency gần đây của một loại lời gọi (một model / tầng cascade) và quantile đã tính"""
+
+    def __init__(self, window: int):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self._delay: Optional[float] = None
+        self._stale = 0
+
+    def observe(self, latency: float):
+        self.latencies.append(latency)
+        self._stale += 1
+
+    def quantile(self, quantile: float, min_samples: int, min_delay: float) -> Optional[float]:
+        """None khi chưa đủ mẫu; tính lại sau mỗi 20 mẫu mới"""
+        if len(self.latencies) < min_samples:
+            return None
+        if self._delay is None or self._stale >= 20:
+            ordered = sorted(self.latencies)
+            index = min(len(ordered) - 1, int(quantile * len(ordered)))
+            self._delay = max(min_delay, ordered[index])
+            self._stale = 0
+        return self._delay
+
+class Hedger:
+    """
+    Hedged request cho lời gọi upstream không stream:
+    nếu lời gọi đầu chưa xong sau delay (quantile latency gần đây, mặc định p95),
+    gửi thêm một bản sao tới backend khác (hoặc model hedge), lấy kết quả về trước
+    và hủy lời gọi còn lại. Số bản sao bị giới hạn bởi budget (tỷ lệ trên tổng request).
+    Latency được theo dõi riêng theo key (model của tầng cascade): model nhanh và model chính
+    có phân phối latency khác nhau nên mỗi loại có delay riêng.
+    """
+
+    def __init__(self, quantile: float, min_delay: float, min_samples: int,
+                 budget: float, model: str, window: int = 500):
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.budget = budget
+        self.model = model
+        self.window = window
+        self._windows: Dict[str, LatencyWindow] = {}
+        self.stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "over_budget": 0}
+
+    def observe(self, latency: float, key: str = ""):
+        """Ghi một mẫu latency của loại lời gọi `key` ("" = model của backend)"""
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = LatencyWindow(self.window)
+        window.observe(latency)
+
+    def delay(self, key: str = "") -> Optional[float]:
+        """Delay trước khi hedge lời gọi loại `key`; None khi chưa đủ mẫu"""
+        window = self._windows.get(key)
+        if window is None:
+            return None
+        return window.quantile(self.quantile, self.min_samples, self.min_delay)
+
+    async def run(self, pool: BackendPool, request: Callable[[Backend, str], Awaitable[Any]],
+                  key: str = "") -> Tuple[Any, Backend, str]:
+        """
+        Gọi request(backend, model) qua pool, hedge khi cần (delay theo latency của loại `key`)
+        Trả về (response, backend, model) của lời gọi thắng; backend.outstanding được giữ như pool.connect
+        """
+        self.stats["requests"] += 1
+        used: List[str] = []
+
+        def primary_request(backend: Backend):
+            used.append(backend.name)
+            return request(backend, backend.model)
+
+        primary = asyncio.create_task(pool.connect("complete", primary_request))
+        tasks = [primary]
+        winner: Optional[asyncio.Task] = None
+        try:
+            delay = self.delay(key)
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    if self.stats["hedged"] < self.budget * self.stats["requests"]:
+                        tasks.append(asyncio.create_task(self._hedge(pool, request, used)))
+                        self.stats["hedged"] += 1
+                        HEDGED_REQUESTS.inc(1.0, "fired")
+                    else:
+                        self.stats["over_budget"] += 1
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in tasks:
+                    if task in done and not task.cancelled() and task.exception() is None:
+                        winner = task
+                        break
+                if winner is not None:
+                    break
+
+            if winner is None:
+                # Tất cả đều lỗi: trả lỗi của lời gọi đầu
+                return primary.result()
+            if winner is not primary:
+                self.stats["hedge_wins"] += 1
+                HEDGED_REQUESTS.inc(1.0, "won")
+            response, backend = winner.result()
+            return response, backend, self.model if winner is not primary and self.model else backend.model
+        finally:
+            await self._cancel_losers(pool, tasks, winner)
+
+    async def _hedge(self, pool: BackendPool, request: Callable[[Backend, str], Awaitable[Any]],
+                     used: List[str]) -> Tuple[Any, Backend]:
+        # Ưu tiên backend khác; chỉ có một backend thì gửi lại chính nó (model hedge nếu có)
+        exclude = set(used) if len(set(used)) < len(pool.backends) else set()
+        return await pool.connect(
+            "complete", lambda b: request(b, self.model or b.model), exclude=exclude
+        )
+
+    @staticmethod
+    async def _cancel_losers(pool: BackendPool, tasks: List[asyncio.Task], winner: Optional[asyncio.Task]):
+        losers = [task for task in tasks if task is not winner]
+        for task in losers:
+            task.cancel()
+        for result in await asyncio.gather(*losers, return_exceptions=True):
+            # Lời gọi thua xong cùng lúc với lời gọi thắng: trả backend lại cho pool
+            if isinstance(result, tuple):
+                pool.finish(result[1], "complete", None)
+
+    def info(self) -> dict:
+        delays = {}
+        for key, window in self._windows.items():
+            delay = self.delay(key)
+            delays[key or "default"] = {
+                "delay": round(delay, 4) if delay is not None else None,
+                "samples": len(window.latencies)
+            }
+        return {
+            **self.stats,
+            "quantile": self.quantile,
+            "delays": delays,
+            "budget": self.budget,
+            "model": self.model or None
+        }
+
+# Tạo instance global (None nếu không bật hedging)
+hedger = Hedger(
+    quantile=settings.LLM_HEDGE_QUANTILE,
+    min_delay=settings.LLM_HEDGE_MIN_DELAY,
+    min_samples=settings.LLM_HEDGE_MIN_SAMPLES,
+    budget=settings.LLM_HEDGE_BUDGET,
+    model=settings.LLM_HEDGE_MODEL
+) if settings.LLM_HEDGE_ENABLED else None
@@ -0,0 +1,313 @@
+import asyncio
+import itertools
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import anyio
+import httpx
+
+from .config import settings
+from .admission import Overloaded
+from .llm_client import llm_client
+from .metrics import registry
+from .responses import compact_result
+from .rate_limit import current_client
+from .deadline import current_deadline
+
+JOB_QUEUE_WAIT = registry.histogram(
+    "review_job_queue_wait_seconds", "Thời gian job nằm trong hàng đợi trước khi được xử lý"
+)
+JOBS_FINISHED = registry.counter(
+    "review_jobs_finished_total", "Số job review đã xong theo trạng thái", ("status",)
+)
+
+class Job:
+    """Một job review: trạng thái queued -> running -> succeeded / failed"""
+
+    def __init__(self, question: str, system_prompt: str, prompt_source: str,
+                 priority: int, callback_url: Optional[str], use_cache: bool):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.priority = priority
+        self.question = question
+        self.system_prompt = system_prompt
+        self.prompt_source = prompt_source
+        self.callback_url = callback_url
+        self.use_cache = use_cache
+        # Client gửi job: token LLM của job được trừ vào quota của client này
+        self.client = current_client.get()
+        # Deadline của request tạo job (tính cả thời gian chờ trong hàng đợi)
+        self.deadline = current_deadline.get()
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def info(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error
+        }
+
+class SQLiteJobStore:
+    """Lưu trạng thái job trong SQLite để mọi worker process đều trả lời được khi poll"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS review_jobs ("
+            "id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def save(self, info: dict, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO review_jobs (id, data, expires_at) VALUES (?, ?, ?)",
+                (info["job_id"], json.dumps(info, ensure_ascii=False), expires_at)
+            )
+            self._conn.commit()
+
+    def load(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, expires_at FROM review_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def prune(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM review_jobs WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+
+    def reopen(self):
+        """Mở connection mới sau khi fork"""
+        self._lock = threading.Lock()
+        self._connect()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class JobQueue:
+    """
+    Hàng đợi job review có độ ưu tiên, xử lý bởi một nhóm worker async
+    Kết quả giữ trong bộ nhớ (và SQLite nếu có) tới khi hết TTL
+    """
+
+    def __init__(self, workers: int, max_queue: int, result_ttl: float,
+                 callback_timeout: float, callback_hosts: List[str], db_path: str = ""):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self.callback_timeout = callback_timeout
+        self.callback_hosts = set(callback_hosts)
+        self.store = SQLiteJobStore(db_path) if db_path else None
+        self.jobs: Dict[str, Job] = {}
+        self.stats = {"submitted": 0, "succeeded": 0, "failed": 0, "callbacks_failed": 0}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._sequence = itertools.count()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def start(self):
+        """Chạy worker nếu chưa chạy (gọi lúc startup hoặc khi có job đầu tiên)"""
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, drain_timeout: float = 0):
+        """
+        Dừng worker; chờ tối đa drain_timeout giây cho các job chưa xong
+        Job còn lại (đang chạy hoặc chưa tới lượt) được đánh dấu failed để client poll không chờ mãi
+        """
+        deadline = time.monotonic() + drain_timeout
+        while any(not job.done for job in self.jobs.values()) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        for job in [job for job in self.jobs.values() if not job.done]:
+            job.error = "Server shutting down, job was not finished; resubmit it"
+            job.status = "failed"
+            await self._finish(job)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self.store is not None:
+            self.store.close()
+
+    def after_fork(self):
+        if self.store is not None:
+            self.store.reopen()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def callback_allowed(self, url: str) -> bool:
+        """Chỉ gọi callback tới host nội bộ được cho phép (tránh server gọi ra URL tùy ý)"""
+        parsed = urlparse(url)
+        return parsed.scheme in ("http", "https") and parsed.hostname in self.callback_hosts
+
+    async def submit(self, question: str, system_prompt: str, prompt_source: str,
+                     priority: int = 0, callback_url: Optional[str] = None,
+                     use_cache: bool = True) -> Job:
+        self.start()
+        self._prune()
+        if self.queue_depth >= self.max_queue:
+            raise Overloaded(max(1, int(self.queue_depth / self.workers)), "job queue full")
+
+        job = Job(question, system_prompt, prompt_source, priority, callback_url, use_cache)
+        self.jobs[job.id] = job
+        self.stats["submitted"] += 1
+        await self._persist(job)
+        # Số lớn hơn = ưu tiên cao hơn; cùng ưu tiên thì FIFO
+        self._queue.put_nowait((-priority, next(self._sequence), job.id))
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        """Trạng thái job: trong bộ nhớ của process này, hoặc từ SQLite (job của worker khác)"""
+        self._prune()
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.info()
+        if self.store is not None:
+            return await anyio.to_thread.run_sync(self.store.load, job_id)
+        return None
+
+    async def _persist(self, job: Job):
+        if self.store is None:
+            return
+        await anyio.to_thread.run_sync(self.store.save, job.info(), time.time() + self.result_ttl)
+        if job.done:
+            await anyio.to_thread.run_sync(self.store.prune)
+
+    def _prune(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.done and now - job.finished_at > self.result_ttl]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            if job is None:
+                continue
+            try:
+                await self._run(job)
+            except Exception as e:
+                print(f"❌ Job worker error ({job_id}): {str(e)}")
+
+    async def _run(self, job: Job):
+        job.status = "running"
+        job.started_at = time.time()
+        JOB_QUEUE_WAIT.observe(job.started_at - job.created_at)
+        await self._persist(job)
+
+        token = current_client.set(job.client)
+        deadline_token = current_deadline.set(job.deadline)
+        try:
+            result = await llm_client.ask(
+                question=job.question,
+                system_prompt=job.system_prompt,
+                prompt_source=job.prompt_source,
+                use_cache=job.use_cache
+            )
+            job.result = compact_result(result)
+            job.status = "succeeded"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+            print(f"❌ Review job {job.id} failed: {str(e)}")
+        finally:
+            current_client.reset(token)
+            current_deadline.reset(deadline_token)
+
+        await self._finish(job)
+
+    async def _finish(self, job: Job):
+        """Ghi trạng thái cuối (succeeded / failed) của job và gọi callback"""
+        job.finished_at = time.time()
+        # Không cần giữ input sau khi xong
+        job.question = job.system_prompt = ""
+        self.stats[job.status] += 1
+        JOBS_FINISHED.inc(1.0, job.status)
+        await self._persist(job)
+
+        if job.callback_url:
+            await self._callback(job)
+
+    async def _callback(self, job: Job):
+        try:
+            if self._client is None:
+                # Tạo lúc có callback đầu tiên: nạp SSL context mất ~0.2s, không tính vào startup
+                self._client = httpx.AsyncClient(timeout=self.callback_timeout)
+            response = await self._client.post(job.callback_url, json=job.info())
+            response.raise_for_status()
+        except Exception as e:
+            self.stats["callbacks_failed"] += 1
+            print(f"⚠️  Callback for job {job.id} failed: {str(e)}")
+
+    def info(self) -> dict:
+        running = sum(1 for job in self.jobs.values() if job.status == "running")
+        return {
+            **self.stats,
+            "workers": self.workers,
+            "queued": self.queue_depth,
+            "running": running,
+            "max_queue": self.max_queue,
+            "result_ttl": self.result_ttl,
+            "shared_store": self.store is not None
+        }
+
+def _collect_job_metrics():
+    return [
+        "# HELP review_jobs_queued Số job review đang chờ",
+        "# TYPE review_jobs_queued gauge",
+        f"review_jobs_queued {job_queue.queue_depth}",
+    ]
+
+# Tạo instance global
+job_queue = JobQueue(
+    workers=settings.JOB_WORKERS,
+    max_queue=settings.JOB_MAX_QUEUE,
+    result_ttl=settings.JOB_RESULT_TTL,
+    callback_timeout=settings.JOB_CALLBACK_TIMEOUT,
+    callback_hosts=[h.strip() for h in settings.JOB_CALLBACK_ALLOWED_HOSTS.split(",") if h.strip()],
+    db_path=settings.JOB_DB_PATH
+)
+
+registry.add_collector(_collect_job_metrics)
@@ -1,51 +1,430 @@
-from openai import OpenAI
+import asyncio
+import threading
+import time
+import anyio
+import httpx
 from .config import settings
-from typing import Optional
+from .backends import BackendPool
+from .cache import make_cache_key, response_cache
+from .similarity_cache import similarity_cache
+from .singleflight import SingleFlight, StreamSingleFlight
+from .admission import upstream_slot
+from .request_log import record_llm_result
+from .rate_limit import charge_tokens
+from .deadline import DEADLINE_EXCEEDED, Deadline, DeadlineExceeded, current_deadline
+from .hedging import hedger
+from .cascade import Route, cascade
+from .metrics import LLM_ERRORS, registry, LLM_UPSTREAM_DURATION, LLM_UPSTREAM_TTFT, record_usage
+from .profiling import stage
+from typing import AsyncIterator, List, Optional, Tuple
 
 class LLMClient:
     def __init__(self):
-        self.client = OpenAI(
-            base_url=settings.OLLAMA_BASE_URL,
-            api_key=settings.OLLAMA_API_KEY
-        )
-        self.model = settings.OLLAMA_MODEL
-    
-    def ask(self, question: str, system_prompt: Optional[str] = None, 
-            prompt_source: str = "unknown") -> dict:
+        # Pool kết nối và client OpenAI được tạo lần đầu dùng hoặc bởi warm_up() lúc startup
+        # (httpx + openai mất hơn 1s, không tính vào thời gian import app)
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self._pool: Optional[BackendPool] = None
+        self._pool_lock = threading.Lock()
+        # Warm-up trong thread: request chờ event này thay vì chặn event loop trên _pool_lock
+        self._warm_up_task: Optional[asyncio.Task] = None
+        self._ready_event = asyncio.Event()
+        # Model logic (dùng cho cache key), backend thực tế được ghi trong kết quả
+        self.model = settings.LLM_BACKENDS[0]["model"]
+        # Tham số riêng của upstream (Ollama keep_alive) gửi kèm mọi request
+        self.extra_body = {"keep_alive": settings.LLM_KEEP_ALIVE} if settings.LLM_KEEP_ALIVE else None
+
+        # Gộp các request giống hệt nhau đang chạy đồng thời
+        self.inflight = SingleFlight()
+        self.stream_inflight = StreamSingleFlight()
+
+    @property
+    def pool(self) -> BackendPool:
+        """Các backend dùng chung pool kết nối; mỗi request được định tuyến tới một backend"""
+        if self._pool is None:
+            # warm_up chạy trong thread, request đầu tiên có thể tới cùng lúc
+            with self._pool_lock:
+                if self._pool is None:
+                    # Pool kết nối dùng chung (keep-alive) để một worker giữ được nhiều request song song
+                    self.http_client = httpx.AsyncClient(
+                        limits=httpx.Limits(
+                            max_connections=settings.LLM_MAX_CONNECTIONS,
+                            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY
+                        ),
+                        timeout=httpx.Timeout(settings.LLM_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT)
+                    )
+                    self._pool = BackendPool(
+                        settings.LLM_BACKENDS,
+                        http_client=self.http_client,
+                        policy=settings.LLM_ROUTING_POLICY,
+                        failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+                        cooldown=settings.LLM_CIRCUIT_COOLDOWN
+                    )
+        return self._pool
+
+    @property
+    def ready(self) -> bool:
+        """Pool kết nối và client OpenAI đã được tạo (warm-up xong hoặc đã có request)"""
+        return self._pool is not None and all(b.has_client for b in self._pool.backends)
+
+    def warm_up(self) -> float:
+        """Tạo pool kết nối và client OpenAI của mọi backend trước request đầu tiên, trả về số giây"""
+        start = time.perf_counter()
+        for backend in self.pool.backends:
+            # Lần đầu truy cập chat.completions mới import các module resource của openai (~0.9s)
+            backend.client.chat.completions
+        return time.perf_counter() - start
+
+    def start_warm_up(self) -> asyncio.Task:
+        """Chạy warm_up trong thread (một lần); task trả về số giây, event ready được set khi xong"""
+        if self._warm_up_task is None:
+            self._warm_up_task = asyncio.create_task(self._run_warm_up())
+        return self._warm_up_task
+
+    async def _run_warm_up(self) -> float:
+        try:
+            seconds = await anyio.to_thread.run_sync(self.warm_up)
+        except BaseException:
+            # Lỗi khi tạo client: request sau thử lại
+            self._warm_up_task = None
+            raise
+        self._ready_event.set()
+        return seconds
+
+    async def wait_ready(self):
+        """Chờ pool và client OpenAI sẵn sàng mà không chặn event loop (tự bắt đầu warm-up nếu chưa có)"""
+        if self._ready_event.is_set():
+            return
+        task = self.start_warm_up()
+        # shield: request bị hủy (deadline, client ngắt kết nối) không hủy warm-up của các request khác
+        await asyncio.shield(task)
+
+    def collect_metrics(self) -> List[str]:
+        # Chưa có request nào: không tạo pool chỉ để scrape metrics
+        return self._pool.collect_metrics() if self._pool is not None else []
+
+    def _build_messages(self, question: str, system_prompt: Optional[str] = None):
         """
-        Gửi câu hỏi đến LLM và nhận câu trả lời
-        Trả về dict chứa cả answer và prompt được sử dụng
+        Tạo danh sách messages, trả về (messages, prompt được sử dụng)
+        System prompt luôn đứng đầu và giữ nguyên từng byte giữa các request
+        để upstream tái sử dụng prefix/KV cache thay vì encode lại
         """
-        
         messages = []
-        
+
         # Sử dụng prompt được truyền vào, hoặc default từ settings
         final_system_prompt = system_prompt or settings.AI_SYSTEM_PROMPT
-        used_prompt = final_system_prompt
-        
+
         if final_system_prompt:
             messages.append({"role": "system", "content": final_system_prompt})
-        
+
         # Thêm user question
         messages.append({"role": "user", "content": question})
-        
-        # Gọi API
-        response = self.client.chat.completions.create(
-            model=self.model,
+
+        return messages, final_system_prompt
+
+    def _cache_key(self, question: str, used_prompt: Optional[str], route: Optional[Route] = None) -> str:
+        if route is not None:
+            return make_cache_key(route.model or self.model, used_prompt, question,
+                                  settings.AI_TEMPERATURE, route.max_tokens)
+        return make_cache_key(self.model, used_prompt, question,
+                              settings.AI_TEMPERATURE, settings.AI_MAX_TOKENS)
+
+    def _find_similar(self, question: str, used_prompt: Optional[str], use_cache: bool):
+        """
+        Tra cache gần trùng lặp; trả về (kết quả hoặc None, (signature, context) để ghi sau lời gọi upstream)
+        Context gồm mọi tham số trừ question: chỉ dùng lại review của cùng model / system prompt
+        """
+        signature = similarity_cache.signature(question)
+        context = self._cache_key("", used_prompt)
+        match = similarity_cache.lookup(signature, context) if use_cache else None
+        return match, (signature, context)
+
+    async def ask(self, question: str, system_prompt: Optional[str] = None,
+                  prompt_source: str = "unknown", use_cache: bool = True) -> dict:
+        """
+        Gửi câu hỏi đến LLM và nhận câu trả lời (không block event loop)
+        Trả về dict chứa cả answer và prompt được sử dụng
+        Request giống hệt nhau được trả từ response cache
+        (use_cache=False: bỏ qua bước đọc cache nhưng vẫn ghi kết quả mới),
+        request giống hệt nhau đang chạy đồng thời dùng chung một lời gọi upstream
+        Deadline của request (current_deadline): hết hạn thì hủy lời gọi upstream và trả 504,
+        hoặc trả phần câu trả lời đã sinh (partial=True) nếu client cho phép
+        Cascade (nếu bật): request nhỏ / đơn giản tới model nhanh, escalate lên model chính khi cần
+        """
+
+        messages, used_prompt = self._build_messages(question, system_prompt)
+        route = cascade.route(question) if cascade is not None else None
+        cache_key = self._cache_key(question, used_prompt, route)
+
+        if response_cache is not None:
+            if use_cache:
+                with stage("cache"):
+                    cached = await response_cache.get(cache_key)
+                if cached is not None:
+                    result = {
+                        **cached,
+                        "used_prompt": used_prompt,
+                        "prompt_source": prompt_source,
+                        "cached": True,
+                        "cache_match": "exact"
+                    }
+                    record_llm_result(result)
+                    return result
+            else:
+                response_cache.record_bypass()
+
+        similar_key = None
+        if similarity_cache is not None:
+            with stage("cache"):
+                match, similar_key = self._find_similar(question, used_prompt, use_cache)
+            if match is not None:
+                result = {
+                    **match,
+                    "used_prompt": used_prompt,
+                    "prompt_source": prompt_source,
+                    "cached": True,
+                    "cache_match": "normalized"
+                }
+                record_llm_result(result)
+                return result
+
+        deadline = current_deadline.get()
+        if deadline is not None and deadline.allow_partial:
+            result = await self._complete_partial(messages, cache_key, deadline, similar_key, route)
+        else:
+            try:
+                result = await self.inflight.do(
+                    cache_key,
+                    lambda: self._complete(messages, cache_key, similar_key, route),
+                    timeout=deadline.remaining() if deadline is not None else None
+                )
+            except asyncio.TimeoutError:
+                DEADLINE_EXCEEDED.inc(1.0, "timeout")
+                raise DeadlineExceeded()
+        result = {
+            **result,
+            "used_prompt": used_prompt,
+            "prompt_source": prompt_source,
+            "cached": False
+        }
+        record_llm_result(result)
+        await charge_tokens(result)
+        return result
+
+    def _create(self, backend, model: str, messages: list, max_tokens: Optional[int] = None, **kwargs):
+        return backend.client.chat.completions.create(
+            model=model,
             messages=messages,
-            max_tokens=settings.AI_MAX_TOKENS,
-            temperature=settings.AI_TEMPERATURE
+            max_tokens=max_tokens or settings.AI_MAX_TOKENS,
+            temperature=settings.AI_TEMPERATURE,
+            extra_body=self.extra_body,
+            **kwargs
         )
-        
-        answer = response.choices[0].message.content
-        
-        return {
-            "answer": answer,
+
+    async def _complete(self, messages: list, cache_key: str, similar_key: Optional[tuple] = None,
+                        route: Optional[Route] = None) -> dict:
+        """Một lời gọi upstream (không stream), kết quả được ghi vào cache (và cache gần trùng lặp)"""
+        if route is None:
+            result, _, _ = await self._call_upstream(messages)
+        elif route.tier == "full":
+            result, duration, _ = await self._call_upstream(messages)
+            cascade.record("full", duration, result["tokens_used"])
+        else:
+            result, duration, finish_reason = await self._call_upstream(
+                cascade.fast_messages(messages), route.model, route.max_tokens
+            )
+            cascade.record("fast", duration, result["tokens_used"])
+            reason = cascade.escalation_reason(result["answer"], finish_reason)
+            if reason is not None:
+                print(f"⤴️  Escalating to the main model ({reason})")
+                cascade.record_escalation(reason, result["tokens_used"])
+                fast_tokens = result["tokens_used"]
+                result, duration, _ = await self._call_upstream(messages)
+                cascade.record("full", duration, result["tokens_used"])
+                # Token của lần thử với model nhanh vẫn tính vào quota của client
+                result["tokens_used"] += fast_tokens
+
+        if response_cache is not None:
+            await response_cache.set(cache_key, result)
+        if similar_key is not None:
+            similarity_cache.add(*similar_key, result)
+
+        return result
+
+    async def _call_upstream(self, messages: list, model: Optional[str] = None,
+                             max_tokens: Optional[int] = None) -> Tuple[dict, float, Optional[str]]:
+        """
+        Một lời gọi chat completion qua admission, backend pool và hedging
+        model=None: model của backend; trả về (kết quả, thời gian, finish_reason)
+        """
+        await self.wait_ready()
+        async with upstream_slot("complete") as slot:
+            start = time.perf_counter()
+            # Failover sang backend khác khi timeout / 5xx (lỗi được đếm trong pool)
+            if hedger is None:
+                response, backend = await self.pool.connect(
+                    "complete", lambda b: self._create(b, model or b.model, messages, max_tokens)
+                )
+                used_model = model or backend.model
+            else:
+                # Lời gọi chậm hơn p95 được gửi thêm tới backend / model khác, lấy kết quả về trước
+                # Delay theo latency của chính tầng này (model nhanh của cascade hoặc model của backend)
+                response, backend, hedged_model = await hedger.run(
+                    self.pool, lambda b, m: self._create(b, model or m, messages, max_tokens), model or ""
+                )
+                used_model = model or hedged_model
+            duration = time.perf_counter() - start
+            if hedger is not None:
+                hedger.observe(duration, model or "")
+            # Mẫu latency cho admission: thời gian trên mỗi token sinh ra (không phụ thuộc độ dài câu trả lời)
+            completion_tokens = response.usage.completion_tokens if response.usage else 0
+            slot.latency = duration / max(completion_tokens or 1, 1)
+            self.pool.finish(backend, "complete", slot.latency)
+
+        LLM_UPSTREAM_DURATION.observe(duration, used_model, "complete")
+        record_usage(used_model, response.usage)
+
+        result = {
+            "answer": response.choices[0].message.content,
+            "model": used_model,
+            "tokens_used": response.usage.total_tokens if response.usage else 0,
+            "usage": {
+                "prompt_tokens": response.usage.prompt_tokens if response.usage else 0,
+                "completion_tokens": response.usage.completion_tokens if response.usage else 0
+            }
+        }
+        return result, duration, response.choices[0].finish_reason
+
+    async def _complete_partial(self, messages: list, cache_key: str, deadline: Deadline,
+                                similar_key: Optional[tuple] = None, route: Optional[Route] = None) -> dict:
+        """
+        Lời gọi upstream qua stream để giữ lại phần đã sinh khi hết deadline
+        Kết quả dở dang (partial=True) không được ghi vào cache
+        Theo tầng của cascade nhưng không escalate (không còn thời gian cho lời gọi thứ hai)
+        """
+        parts = []
+        done = None
+        model, max_tokens = (route.model, route.max_tokens) if route is not None else (None, None)
+        with anyio.move_on_after(deadline.remaining()) as scope:
+            async for event in self._stream(messages, model, max_tokens):
+                if event["type"] == "delta":
+                    parts.append(event["content"])
+                else:
+                    done = event
+
+        if scope.cancel_called:
+            if not parts:
+                DEADLINE_EXCEEDED.inc(1.0, "timeout")
+                raise DeadlineExceeded()
+            DEADLINE_EXCEEDED.inc(1.0, "partial")
+            # Upstream chưa gửi usage: ước lượng mỗi delta một token
+            return {
+                "answer": "".join(parts),
+                "model": model or self.model,
+                "tokens_used": len(parts),
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(parts)},
+                "partial": True
+            }
+
+        result = {
+            "answer": "".join(parts),
+            "model": done["model"],
+            "tokens_used": done["tokens_used"],
+            "usage": done["usage"]
+        }
+        if response_cache is not None:
+            await response_cache.set(cache_key, result)
+        if similar_key is not None:
+            similarity_cache.add(*similar_key, result)
+        return result
+
+    async def ask_stream(self, question: str, system_prompt: Optional[str] = None,
+                         prompt_source: str = "unknown") -> AsyncIterator[dict]:
+        """
+        Chế độ streaming của ask: yield từng event khi upstream sinh token
+        - {"type": "delta", "content": "..."} cho mỗi đoạn text
+        - {"type": "done", ...} ở cuối, kèm model và tokens_used
+        Các subscriber cùng request dùng chung một stream upstream; khi tất cả
+        đều dừng (client ngắt kết nối), stream upstream bị đóng ngay
+        để upstream ngừng sinh token.
+        """
+        messages, used_prompt = self._build_messages(question, system_prompt)
+        cache_key = self._cache_key(question, used_prompt)
+
+        tokens_used = 0
+        model = self.model
+        async for event in self.stream_inflight.subscribe(cache_key, lambda: self._stream(messages)):
+            if event["type"] == "usage":
+                tokens_used = event["tokens_used"]
+                model = event["model"]
+            else:
+                yield event
+
+        done = {
+            "type": "done",
             "used_prompt": used_prompt,
             "prompt_source": prompt_source,
-            "model": self.model,
-            "tokens_used": response.usage.total_tokens if response.usage else 0
+            "model": model,
+            "tokens_used": tokens_used
         }
+        record_llm_result(done)
+        await charge_tokens(done)
+        yield done
+
+    async def _stream(self, messages: list, model: Optional[str] = None,
+                      max_tokens: Optional[int] = None) -> AsyncIterator[dict]:
+        """Một stream upstream: yield các event delta và cuối cùng là usage (model=None: model của backend)"""
+        await self.wait_ready()
+        async with upstream_slot("stream") as slot:
+            start = time.perf_counter()
+            # Chỉ failover lúc mở stream; token đã gửi cho client thì không thể gửi lại
+            stream, backend = await self.pool.connect(
+                "stream",
+                lambda b: self._create(
+                    b, model or b.model, messages, max_tokens,
+                    stream=True, stream_options={"include_usage": True}
+                )
+            )
+            used_model = model or backend.model
+
+            tokens_used = 0
+            usage = {"prompt_tokens": 0, "completion_tokens": 0}
+            ok = True
+            try:
+                async for chunk in stream:
+                    if chunk.usage:
+                        tokens_used = chunk.usage.total_tokens
+                        usage = {
+                            "prompt_tokens": chunk.usage.prompt_tokens,
+                            "completion_tokens": chunk.usage.completion_tokens
+                        }
+                        record_usage(used_model, chunk.usage)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if slot.latency is None:
+                            # Mẫu latency cho admission là time-to-first-token
+                            slot.latency = time.perf_counter() - start
+                            LLM_UPSTREAM_TTFT.observe(slot.latency, used_model)
+                        yield {"type": "delta", "content": chunk.choices[0].delta.content}
+                LLM_UPSTREAM_DURATION.observe(time.perf_counter() - start, used_model, "stream")
+            except Exception as e:
+                ok = False
+                LLM_ERRORS.inc(1.0, used_model, type(e).__name__)
+                raise
+            finally:
+                # Đóng kết nối HTTP: upstream dừng generate khi client bỏ đi giữa chừng
+                with anyio.CancelScope(shield=True):
+                    await stream.close()
+                self.pool.finish(backend, "stream", slot.latency, ok)
+
+        yield {"type": "usage", "tokens_used": tokens_used, "usage": usage, "model": used_model}
+
+    async def close(self):
+        """Đóng connection pool (và cache trên đĩa) khi server tắt"""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+        if response_cache is not None:
+            response_cache.close()
 
 # Tạo instance global
-llm_client = LLMClient()
\ No newline at end of file
+llm_client = LLMClient()
+registry.add_collector(llm_client.collect_metrics)
\ No newline at end of file
@@ -1,14 +1,31 @@
+# Import đầu tiên: mốc bắt đầu đo thời gian import / khởi động
+from .startup import startup_report
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from .config import settings
 from .routers import api
+from .llm_client import llm_client
+from .cache import response_cache
+from .similarity_cache import similarity_cache
+from .metrics import MetricsMiddleware, registry
+from .health import health_prober
+from .jobs import job_queue
+from .request_log import RequestLogMiddleware, request_logger
+from .compression import CompressionMiddleware
+from .responses import FastJSONResponse
+from .profiling import ProfilingMiddleware, request_profiler
+
+startup_report.mark("import")
 
 # Khởi tạo FastAPI app
 app = FastAPI(
     title="LLM API Server với Prompt từ File",
     description="Server kết nối với LLM nội bộ, prompt được đọc từ file",
     version="1.0.0",
-    debug=settings.DEBUG
+    debug=settings.DEBUG,
+    default_response_class=FastJSONResponse
 )
 
 # CORS middleware (nếu cần gọi từ web)
@@ -20,9 +37,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Nén gzip/brotli cho response lớn (không áp dụng cho streaming)
+app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_SIZE)
+
+# Request log (tùy chọn): ghi request/response để replay làm benchmark
+if request_logger is not None:
+    app.add_middleware(RequestLogMiddleware, logger=request_logger, max_body=settings.REQUEST_LOG_MAX_BODY)
+
+# Metrics middleware: đo latency cho mọi router
+app.add_middleware(MetricsMiddleware)
+
+# Profiling (tùy chọn, ngoài cùng): thời gian theo giai đoạn và sampling profiler cho admin
+if request_profiler is not None:
+    app.add_middleware(ProfilingMiddleware, profiler=request_profiler)
+
 # Đăng ký routers
 app.include_router(api.router)
 
+startup_report.mark("create_app")
+
+async def _warm_up_llm_client():
+    # Trong thread: import openai không chặn event loop, /health trả lời được ngay
+    with startup_report.phase("llm_warmup"):
+        seconds = await llm_client.start_warm_up()
+    print(f"⏱️  LLM client ready ({seconds:.3f}s)")
+
+@app.on_event("startup")
+async def start_health_prober():
+    """Bắt đầu probe LLM upstream định kỳ và worker xử lý job review trong background"""
+    with startup_report.phase("startup_hooks"):
+        health_prober.start()
+        job_queue.start()
+    if settings.LLM_WARMUP_ON_STARTUP:
+        # Giữ tham chiếu để task không bị garbage collect giữa chừng
+        app.state.llm_warmup = asyncio.create_task(_warm_up_llm_client())
+    print(f"⏱️  Startup: {startup_report.summary()}")
+
+@app.on_event("shutdown")
+async def shutdown_llm_client():
+    """Đóng connection pool tới LLM khi tắt server"""
+    await health_prober.stop()
+    # Cho job đang chạy/đang chờ cơ hội hoàn thành trước khi tắt
+    await job_queue.stop(drain_timeout=settings.GRACEFUL_TIMEOUT / 2)
+    if request_logger is not None:
+        await request_logger.stop()
+    await llm_client.close()
+
 # Health check endpoint
 @app.get("/")
 async def root():
@@ -37,7 +97,39 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    # Liveness: luôn trả 200 từ bộ nhớ, kèm trạng thái upstream và độ cũ của số liệu
+    health_prober.start()
+    upstream = health_prober.snapshot()
     return {
         "status": "healthy",
         "model": settings.OLLAMA_MODEL,
-    }
\ No newline at end of file
+        "upstream_ok": upstream["upstream_ok"],
+        "staleness_seconds": upstream["staleness_seconds"]
+    }
+
+def _collect_runtime_metrics():
+    """Số liệu cache và coalescing, đọc lúc scrape"""
+    lines = []
+    if response_cache is not None:
+        lines += [
+            "# HELP llm_cache_requests_total Lookup response cache theo kết quả",
+            "# TYPE llm_cache_requests_total counter",
+        ]
+        for result in ("memory_hits", "disk_hits", "misses", "bypassed"):
+            lines.append(f'llm_cache_requests_total{{result="{result}"}} {response_cache.stats[result]}')
+        if similarity_cache is not None:
+            lines.append(f'llm_cache_requests_total{{result="similar_hits"}} {similarity_cache.stats["hits"]}')
+    lines += [
+        "# HELP llm_coalesced_requests_total Request dùng chung lời gọi upstream đang chạy",
+        "# TYPE llm_coalesced_requests_total counter",
+        f'llm_coalesced_requests_total{{mode="complete"}} {llm_client.inflight.stats["shared"]}',
+        f'llm_coalesced_requests_total{{mode="stream"}} {llm_client.stream_inflight.stats["shared"]}',
+    ]
+    return lines
+
+registry.add_collector(_collect_runtime_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Metrics dạng Prometheus text exposition"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
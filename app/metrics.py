@@ -0,0 +1,159 @@
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Bucket mặc định (giây): từ request cache hit (ms) tới review dài (phút)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    """Counter kiểu Prometheus (chỉ tăng)"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, *labelvalues: str):
+        self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for values, total in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {total}")
+        return lines
+
+class Histogram:
+    """Histogram kiểu Prometheus; observe() là O(log số bucket)"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labelvalues -> [count theo bucket (không cộng dồn) + bucket +Inf, sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labelvalues: str):
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = [[0] * (len(self.buckets) + 1), 0.0]
+            self._series[labelvalues] = series
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for values, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labelnames, values, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """Tập hợp metric của process; collector được gọi lúc scrape để lấy số liệu dạng gauge"""
+
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], List[str]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+# HTTP
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "Thời gian xử lý HTTP request (tới byte cuối cùng)",
+    ("method", "route", "status")
+)
+HTTP_EXCEPTIONS = registry.counter(
+    "http_exceptions_total", "Exception không được xử lý trong handler", ("type",)
+)
+
+# LLM upstream
+LLM_UPSTREAM_DURATION = registry.histogram(
+    "llm_upstream_duration_seconds", "Tổng thời gian một lời gọi LLM upstream", ("model", "mode")
+)
+LLM_UPSTREAM_TTFT = registry.histogram(
+    "llm_upstream_time_to_first_token_seconds", "Thời gian tới token đầu tiên (streaming)", ("model",)
+)
+LLM_TOKENS = registry.counter(
+    "llm_tokens_total", "Số token theo response.usage", ("model", "direction")
+)
+LLM_ERRORS = registry.counter(
+    "llm_upstream_errors_total", "Lỗi khi gọi LLM upstream theo loại exception", ("model", "type")
+)
+
+def record_usage(model: str, usage) -> None:
+    """Cộng token vào/ra từ response.usage (nếu upstream trả về)"""
+    if usage is None:
+        return
+    LLM_TOKENS.inc(usage.prompt_tokens or 0, model, "in")
+    LLM_TOKENS.inc(usage.completion_tokens or 0, model, "out")
+
+class MetricsMiddleware:
+    """ASGI middleware đo latency của mọi route (không dùng BaseHTTPMiddleware để giữ overhead thấp)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception as e:
+            HTTP_EXCEPTIONS.inc(1.0, type(e).__name__)
+            raise
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status)
+            )
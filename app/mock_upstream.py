@@ -0,0 +1,209 @@
+"""
+Mock upstream OpenAI-compatible để benchmark / kiểm thử offline (không cần Ollama thật)
+
+- Latency theo phân phối: fixed:0.3, uniform:0.1,0.5, normal:0.3,0.05, lognormal:-1.2,0.4, exp:0.3
+- Stream token theo tokens/giây
+- Bơm lỗi theo tỷ lệ: 500, 429, timeout (treo), disconnect (cắt stream giữa chừng)
+- Đếm usage (prompt/completion token) và thời gian phục vụ từng request
+
+Chạy riêng: python -m app.mock_upstream --port 11434 --latency lognormal:-1.2,0.4 --tps 30
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+ERROR_KINDS = ("500", "429", "timeout", "disconnect")
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Đọc phân phối latency dạng "tên:tham số" thành hàm sinh mẫu (giây, không âm)"""
+    name, _, raw = spec.partition(":")
+    params = [float(p) for p in raw.split(",") if p]
+    if name == "fixed":
+        value = params[0] if params else 0.0
+        sample = lambda rng: value
+    elif name == "uniform":
+        sample = lambda rng: rng.uniform(params[0], params[1])
+    elif name == "normal":
+        sample = lambda rng: rng.gauss(params[0], params[1])
+    elif name == "lognormal":
+        sample = lambda rng: rng.lognormvariate(params[0], params[1])
+    elif name == "exp":
+        sample = lambda rng: rng.expovariate(1.0 / params[0])
+    else:
+        raise ValueError(f"Unknown latency distribution: {spec}")
+    return lambda rng: max(0.0, sample(rng))
+
+def count_tokens(messages: List[dict]) -> int:
+    """Ước lượng prompt token (từ và dấu câu) của các message"""
+    return sum(len(TOKEN_RE.findall(str(m.get("content") or ""))) for m in messages)
+
+def create_mock_upstream(latency: str = "fixed:0.5", tokens: int = 20, tokens_per_second: float = 20.0,
+                         error_rate: float = 0.0, errors: str = "500", seed: Optional[int] = None,
+                         answer: str = "LGTM", hang_time: float = 3600.0) -> FastAPI:
+    """
+    Tạo app giả lập /v1/chat/completions
+    - latency: phân phối độ trễ trước token đầu tiên
+    - tokens, tokens_per_second: số token sinh ra và tốc độ sinh (0 = tức thì)
+    - error_rate, errors: tỷ lệ request bị lỗi và các loại lỗi (phân cách bằng dấu phẩy)
+    - seed: cố định chuỗi ngẫu nhiên để kết quả lặp lại được
+    """
+    sample_latency = parse_latency(latency)
+    error_kinds = [kind.strip() for kind in errors.split(",") if kind.strip()]
+    for kind in error_kinds:
+        if kind not in ERROR_KINDS:
+            raise ValueError(f"Unknown error kind: {kind}")
+    token_delay = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+    rng = random.Random(seed)
+
+    app = FastAPI()
+    app.state.stats = {
+        "requests": 0, "errors_injected": 0, "tokens_sent": 0, "cancelled_streams": 0,
+        "prompt_tokens": 0, "completion_tokens": 0
+    }
+    # Thời gian phục vụ của các request gần nhất (giây), để tách overhead của server khỏi upstream
+    app.state.service_times = deque(maxlen=10000)
+
+    def _usage(prompt_tokens: int):
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": tokens,
+                "total_tokens": prompt_tokens + tokens}
+
+    def _pick_error() -> Optional[str]:
+        if error_kinds and rng.random() < error_rate:
+            app.state.stats["errors_injected"] += 1
+            return rng.choice(error_kinds)
+        return None
+
+    def _error_response(kind: str):
+        if kind == "429":
+            return JSONResponse({"error": {"message": "mock rate limit", "type": "rate_limit"}},
+                                status_code=429, headers={"Retry-After": "1"})
+        return JSONResponse({"error": {"message": "mock upstream error", "type": "server_error"}},
+                            status_code=500 if kind == "500" else 502)
+
+    async def _stream(model: str, prompt_tokens: int, delay: float, error: Optional[str], start: float):
+        created = int(time.time())
+
+        def chunk(delta: dict, finish_reason=None, usage=None):
+            data = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                "usage": usage
+            }
+            return f"data: {json.dumps(data)}\n\n"
+
+        try:
+            await asyncio.sleep(delay)
+            for i in range(tokens):
+                if error == "disconnect" and i == tokens // 2:
+                    # Cắt kết nối giữa chừng: stream kết thúc không có [DONE]
+                    raise ConnectionResetError("mock disconnect")
+                yield chunk({"content": f"tok{i} "})
+                app.state.stats["tokens_sent"] += 1
+                if token_delay:
+                    await asyncio.sleep(token_delay)
+            yield chunk({}, finish_reason="stop")
+            yield chunk({}, usage=_usage(prompt_tokens))
+            yield "data: [DONE]\n\n"
+            app.state.stats["completion_tokens"] += tokens
+            app.state.service_times.append(time.perf_counter() - start)
+        except asyncio.CancelledError:
+            app.state.stats["cancelled_streams"] += 1
+            raise
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        start = time.perf_counter()
+        body = await request.json()
+        app.state.stats["requests"] += 1
+        model = body.get("model", "mock")
+        prompt_tokens = count_tokens(body.get("messages", []))
+        app.state.stats["prompt_tokens"] += prompt_tokens
+        delay = sample_latency(rng)
+        error = _pick_error()
+
+        if error == "timeout":
+            await asyncio.sleep(hang_time)
+        if body.get("stream"):
+            if error in ("500", "429"):
+                await asyncio.sleep(delay)
+                return _error_response(error)
+            return StreamingResponse(_stream(model, prompt_tokens, delay, error, start),
+                                     media_type="text/event-stream")
+
+        # Không stream: client phải chờ toàn bộ thời gian sinh token
+        await asyncio.sleep(delay + tokens * token_delay)
+        if error is not None:
+            return _error_response(error)
+        app.state.stats["completion_tokens"] += tokens
+        app.state.service_times.append(time.perf_counter() - start)
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop"
+            }],
+            "usage": _usage(prompt_tokens)
+        }
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": "mock"}]}
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "mock", "object": "model"}]}
+
+    @app.get("/mock/stats")
+    async def stats():
+        return app.state.stats
+
+    return app
+
+def start_mock_upstream(port: int, app: Optional[FastAPI] = None, **kwargs) -> uvicorn.Server:
+    """Chạy mock upstream trong thread riêng, trả về server (server.config.app là FastAPI app)"""
+    config = uvicorn.Config(app or create_mock_upstream(**kwargs),
+                            host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible LLM upstream")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", default="fixed:0.5", help="Phân phối latency, vd. lognormal:-1.2,0.4")
+    parser.add_argument("--tokens", type=int, default=20, help="Số token mỗi câu trả lời")
+    parser.add_argument("--tps", type=float, default=20.0, help="Tokens/giây khi stream (0 = tức thì)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Tỷ lệ request bị lỗi (0..1)")
+    parser.add_argument("--errors", default="500", help="Loại lỗi: " + ",".join(ERROR_KINDS))
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    app = create_mock_upstream(args.latency, args.tokens, args.tps, args.error_rate, args.errors, args.seed)
+    print(f"🧪 Mock upstream on http://{args.host}:{args.port}/v1 (latency={args.latency}, tps={args.tps})")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import contextvars
+import heapq
+import hmac
+import itertools
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from starlette.datastructures import Headers
+
+from .config import settings
+from .request_log import SKIP_PATHS
+
+# Thời gian theo giai đoạn của request hiện tại (giây), điền bởi stage(); None = không đo
+request_stages: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("request_stages", default=None)
+
+@contextmanager
+def stage(name: str):
+    """Cộng thời gian của khối lệnh vào giai đoạn `name` của request hiện tại (rate_limit, cache, admission, upstream)"""
+    stages = request_stages.get()
+    if stages is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+
+class SamplingProfiler:
+    """
+    Lấy mẫu stack của thread event loop theo chu kỳ, trong thread riêng
+    Kết quả dạng folded stacks ("f1;f2;f3 count"), đọc được bởi flamegraph.pl, speedscope, inferno.
+    Đây là mẫu wall-clock của cả event loop: thời gian chờ upstream hiện ra ở select()
+    (với uvloop: chỉ còn stack gốc của loop), request khác chạy đồng thời trên cùng worker
+    cũng xuất hiện trong profile.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> str:
+        """Dừng lấy mẫu, trả về profile dạng folded"""
+        self._stop.set()
+        self._thread.join()
+        return "\n".join(f"{stack} {count}" for stack, count in self.counts.most_common())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+class SlowRequestLog:
+    """N request chậm nhất trong cửa sổ thời gian gần nhất (min-heap theo thời gian xử lý)"""
+
+    def __init__(self, size: int, window: float):
+        self.size = size
+        self.window = window
+        self._heap: List[Tuple[float, int, dict]] = []
+        self._seq = itertools.count()
+
+    def _expire(self):
+        cutoff = time.time() - self.window
+        if any(entry["ts"] < cutoff for _, _, entry in self._heap):
+            self._heap = [item for item in self._heap if item[2]["ts"] >= cutoff]
+            heapq.heapify(self._heap)
+
+    def record(self, duration: float, entry: dict):
+        self._expire()
+        item = (duration, next(self._seq), entry)
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, item)
+        elif duration > self._heap[0][0]:
+            heapq.heapreplace(self._heap, item)
+
+    def entries(self) -> List[dict]:
+        self._expire()
+        return [entry for _, _, entry in sorted(self._heap, key=lambda item: item[0], reverse=True)]
+
+class RequestProfiler:
+    """
+    Bề mặt profiling cho admin:
+    - Mọi request: thời gian theo giai đoạn, giữ N request chậm nhất (GET /api/debug/slow)
+    - Request có header X-Profile và X-Admin-Token hợp lệ: sampling profiler chạy trong suốt request,
+      response có header X-Profile-Id, profile lấy ở GET /api/debug/profiles/{id}
+    """
+
+    def __init__(self, admin_token: str, sample_interval: float, max_profiles: int,
+                 slow_requests: int, slow_window: float):
+        self.admin_token = admin_token
+        self.sample_interval = sample_interval
+        self.max_profiles = max_profiles
+        self.slow_log = SlowRequestLog(slow_requests, slow_window)
+        self.profiles: "OrderedDict[str, dict]" = OrderedDict()
+        self.stats = {"requests": 0, "profiled": 0}
+
+    def is_admin(self, headers) -> bool:
+        token = headers.get("x-admin-token", "")
+        return bool(self.admin_token and token) and hmac.compare_digest(token, self.admin_token)
+
+    def save_profile(self, profile_id: str, entry: dict):
+        self.profiles[profile_id] = entry
+        while len(self.profiles) > self.max_profiles:
+            self.profiles.popitem(last=False)
+
+    def info(self) -> dict:
+        return {
+            **self.stats,
+            "sample_interval": self.sample_interval,
+            "slow_requests": self.slow_log.size,
+            "slow_window": self.slow_log.window,
+            "profiles": [
+                {"id": profile_id, **{k: v for k, v in entry.items() if k != "folded"}}
+                for profile_id, entry in reversed(self.profiles.items())
+            ]
+        }
+
+class ProfilingMiddleware:
+    """ASGI middleware đo thời gian theo giai đoạn của mỗi request và chạy sampling profiler khi được yêu cầu"""
+
+    def __init__(self, app, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        # Không đo các endpoint được poll liên tục
+        if scope["type"] != "http" or scope["path"] in SKIP_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        sampler = None
+        profile_id = None
+        if headers.get("x-profile") and self.profiler.is_admin(headers):
+            profile_id = uuid.uuid4().hex[:16]
+            sampler = SamplingProfiler(threading.get_ident(), self.profiler.sample_interval)
+            sampler.start()
+
+        status = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profile_id is not None:
+                    message["headers"] = [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        start = time.perf_counter()
+        stages: Dict[str, float] = {}
+        token = request_stages.set(stages)
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            request_stages.reset(token)
+            duration = time.perf_counter() - start
+            entry = {
+                "ts": time.time(),
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "duration_ms": round(duration * 1000, 2),
+                # Giai đoạn của các lời gọi song song (batch) được cộng dồn, có thể vượt duration
+                "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in stages.items()},
+                "other_ms": round(max(0.0, duration - sum(stages.values())) * 1000, 2),
+                "profile_id": profile_id
+            }
+            self.profiler.stats["requests"] += 1
+            self.profiler.slow_log.record(duration, entry)
+            if sampler is not None:
+                self.profiler.stats["profiled"] += 1
+                folded = sampler.stop()
+                self.profiler.save_profile(profile_id, {
+                    "ts": entry["ts"],
+                    "path": entry["path"],
+                    "duration_ms": entry["duration_ms"],
+                    "samples": sampler.samples,
+                    "folded": folded
+                })
+
+async def require_admin(request: Request):
+    """Dependency cho các endpoint debug: cần bật PROFILING_ENABLED và gửi đúng X-Admin-Token"""
+    if request_profiler is None:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if not request_profiler.is_admin(request.headers):
+        raise HTTPException(status_code=403, detail="Invalid or missing X-Admin-Token")
+
+# Tạo instance global (None nếu không bật profiling)
+request_profiler = RequestProfiler(
+    admin_token=settings.PROFILING_ADMIN_TOKEN,
+    sample_interval=settings.PROFILING_SAMPLE_INTERVAL,
+    max_profiles=settings.PROFILING_MAX_PROFILES,
+    slow_requests=settings.PROFILING_SLOW_REQUESTS,
+    slow_window=settings.PROFILING_SLOW_WINDOW
+) if settings.PROFILING_ENABLED else None
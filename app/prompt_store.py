@@ -0,0 +1,124 @@
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from .config import settings
+
+class PromptVersion:
+    """Một phiên bản prompt (bất biến), định danh bằng hash nội dung"""
+
+    def __init__(self, name: str, path: str, content: str, mtime: float):
+        self.name = name
+        self.path = path
+        self.content = content
+        self.version = hashlib.sha256(content.encode("utf-8")).hexdigest()[:12]
+        self.mtime = mtime
+        self.loaded_at = time.time()
+
+    def info(self) -> dict:
+        return {
+            "name": self.name,
+            "path": self.path,
+            "version": self.version,
+            "length": len(self.content),
+            "mtime": self.mtime,
+            "loaded_at": self.loaded_at
+        }
+
+class PromptStore:
+    """
+    Prompt đặt tên, đọc từ file và tự nạp lại khi file thay đổi (theo mtime)
+    Phiên bản mới được thay bằng một phép gán nên request đang chạy
+    luôn thấy trọn vẹn bản cũ hoặc bản mới.
+    """
+
+    def __init__(self, files: Dict[str, str], check_interval: float, history: int = 5):
+        self.check_interval = check_interval
+        self.history = history
+        self._paths: Dict[str, str] = {}
+        self._current: Dict[str, PromptVersion] = {}
+        self._versions: Dict[str, List[str]] = {}
+        self._stat: Dict[str, tuple] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        for name, path in files.items():
+            self.register(name, path)
+
+    def register(self, name: str, path: str):
+        # Nếu đường dẫn tương đối, bắt đầu từ thư mục gốc
+        if not os.path.isabs(path):
+            path = str(Path(__file__).parent.parent / path)
+        self._paths[name] = path
+
+    def get(self, name: str) -> PromptVersion:
+        """Phiên bản hiện tại của prompt; KeyError nếu tên không tồn tại"""
+        path = self._paths[name]
+        now = time.monotonic()
+        # Chỉ stat file tối đa một lần mỗi check_interval
+        if name not in self._current or now - self._checked_at.get(name, 0.0) >= self.check_interval:
+            self._checked_at[name] = now
+            self._reload(name, path)
+        return self._current[name]
+
+    def _reload(self, name: str, path: str):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            if name not in self._current:
+                print(f"Warning: Prompt file not found: {path}")
+                self._current[name] = PromptVersion(name, path, "", 0.0)
+            return
+
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if self._stat.get(name) == signature:
+            return
+
+        with self._lock:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    content = f.read().strip()
+            except Exception as e:
+                print(f"Error reading prompt file {path}: {e}")
+                return
+
+            self._stat[name] = signature
+            previous = self._current.get(name)
+            if previous is not None and previous.content == content:
+                return
+
+            version = PromptVersion(name, path, content, stat.st_mtime)
+            self._current[name] = version
+            versions = self._versions.setdefault(name, [])
+            versions.append(version.version)
+            del versions[:-self.history]
+            if previous is not None:
+                print(f"🔄 Prompt '{name}' reloaded: {previous.version} -> {version.version}")
+
+    def info(self) -> List[dict]:
+        prompts = []
+        for name in self._paths:
+            current = self.get(name)
+            prompts.append({**current.info(), "versions": list(self._versions.get(name, []))})
+        return prompts
+
+def _parse_prompt_files(raw: str) -> Dict[str, str]:
+    """PROMPT_FILES dạng "name=path,name2=path2" """
+    files = {}
+    for entry in raw.split(","):
+        if "=" in entry:
+            name, path = entry.split("=", 1)
+            files[name.strip()] = path.strip()
+    return files
+
+# Tạo instance global: system và code_review luôn có, thêm prompt đặt tên từ PROMPT_FILES
+prompt_store = PromptStore(
+    {
+        "system": settings.AI_SYSTEM_PROMPT_FILE,
+        "code_review": settings.AI_CODE_REVIEW_PROMPT_FILE,
+        **_parse_prompt_files(settings.PROMPT_FILES)
+    },
+    check_interval=settings.PROMPT_RELOAD_INTERVAL
+)
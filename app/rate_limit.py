@@ -0,0 +1,288 @@
+import contextvars
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import anyio
+from fastapi import HTTPException, Request
+
+from .config import settings
+from .metrics import registry
+from .profiling import stage
+
+RATE_LIMITED = registry.counter(
+    "rate_limited_requests_total", "Request bị từ chối do vượt giới hạn của client", ("bucket",)
+)
+RATE_LIMIT_TOKENS = registry.counter(
+    "rate_limit_tokens_charged_total", "Số token LLM đã trừ vào quota của các client"
+)
+
+# Client của request hiện tại, điền bởi enforce_rate_limit (token LLM được trừ vào client này)
+current_client: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_client", default=None)
+
+# Một thao tác trên bucket: (key, tốc độ nạp mỗi giây, dung lượng, số lượng trừ, mức tối thiểu cần có)
+BucketOp = Tuple[str, float, float, float, float]
+
+class RateLimited(HTTPException):
+    """Client vượt giới hạn: trả 429 kèm Retry-After"""
+
+    def __init__(self, retry_after: int, bucket: str):
+        super().__init__(
+            status_code=429,
+            detail=f"Rate limit exceeded ({bucket}), retry later",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+def _apply(ops: List[BucketOp], levels: List[Tuple[float, float]], now: float):
+    """
+    Nạp lại và kiểm tra tất cả bucket; chỉ trừ khi mọi bucket đều đủ
+    Trả về (số giây cần chờ, vị trí bucket chặn hoặc None, mức mới của từng bucket)
+    """
+    refilled = []
+    wait = 0.0
+    blocked = None
+    for i, ((_, rate, capacity, _, required), (level, updated)) in enumerate(zip(ops, levels)):
+        level = min(capacity, level + (now - updated) * rate)
+        refilled.append(level)
+        if level < required and (required - level) / rate > wait:
+            wait = (required - level) / rate
+            blocked = i
+    if blocked is not None:
+        return wait, blocked, refilled
+    # Trừ token LLM sau khi có kết quả có thể làm bucket âm (nợ), tối đa một lần dung lượng
+    return 0.0, None, [max(-op[2], level - op[3]) for op, level in zip(ops, refilled)]
+
+class MemoryBucketStore:
+    """Token bucket trong bộ nhớ của process; giữ tối đa max_keys bucket (LRU)"""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    def take(self, ops: List[BucketOp]) -> Tuple[float, Optional[int]]:
+        now = time.monotonic()
+        levels = []
+        for key, _, capacity, _, _ in ops:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [capacity, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            levels.append((bucket[0], bucket[1]))
+
+        wait, blocked, new_levels = _apply(ops, levels, now)
+        for (key, *_), level in zip(ops, new_levels):
+            if key in self._buckets:
+                self._buckets[key][:] = [level, now]
+        return wait, blocked
+
+    def peek(self, key: str, rate: float, capacity: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return capacity
+        return min(capacity, bucket[0] + (time.monotonic() - bucket[1]) * rate)
+
+    def size(self) -> int:
+        return len(self._buckets)
+
+    def after_fork(self):
+        pass
+
+    def close(self):
+        pass
+
+class SQLiteBucketStore:
+    """
+    Token bucket trong SQLite dùng chung giữa các worker process trên cùng máy
+    Mỗi lần kiểm tra là một transaction (BEGIN IMMEDIATE) đọc-sửa-ghi các bucket liên quan
+    """
+
+    def __init__(self, path: str, idle_ttl: float = 3600):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self._connect()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            "key TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def take(self, ops: List[BucketOp]) -> Tuple[float, Optional[int]]:
+        with self._lock:
+            # Dùng đồng hồ wall-clock: các process khác nhau có monotonic clock khác nhau
+            now = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                levels = []
+                for key, _, capacity, _, _ in ops:
+                    row = self._conn.execute(
+                        "SELECT level, updated FROM rate_buckets WHERE key = ?", (key,)
+                    ).fetchone()
+                    levels.append(row if row is not None else (capacity, now))
+                wait, blocked, new_levels = _apply(ops, levels, now)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO rate_buckets (key, level, updated) VALUES (?, ?, ?)",
+                    [(op[0], level, now) for op, level in zip(ops, new_levels)]
+                )
+                if now - self._last_prune > self.idle_ttl:
+                    self._last_prune = now
+                    self._conn.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - self.idle_ttl,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait, blocked
+
+    def peek(self, key: str, rate: float, capacity: float) -> float:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT level, updated FROM rate_buckets WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return capacity
+        return min(capacity, row[0] + (time.time() - row[1]) * rate)
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM rate_buckets").fetchone()[0]
+
+    def after_fork(self):
+        """Mở connection mới sau khi fork"""
+        self._lock = threading.Lock()
+        self._connect()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class RateLimiter:
+    """
+    Giới hạn theo client (API key đã đăng ký, hoặc IP) bằng hai token bucket:
+    - requests: requests_per_second, cho phép burst
+    - tokens: token LLM mỗi phút, trừ theo usage.total_tokens sau mỗi lời gọi upstream
+    Request bị chặn khi hết request hoặc quota token đang âm (đã dùng quá)
+    """
+
+    def __init__(self, requests_per_second: float, burst: int, tokens_per_minute: int,
+                 api_keys: List[str], api_key_header: str, trust_forwarded: bool,
+                 max_clients: int, db_path: str = ""):
+        self.requests_per_second = requests_per_second
+        self.burst = max(1, burst)
+        self.tokens_per_minute = tokens_per_minute
+        self.api_keys = set(api_keys)
+        self.api_key_header = api_key_header.lower()
+        self.trust_forwarded = trust_forwarded
+        self.store = SQLiteBucketStore(db_path) if db_path else MemoryBucketStore(max_clients * 2)
+        self.stats = {"allowed": 0, "limited_requests": 0, "limited_tokens": 0, "tokens_charged": 0}
+
+    def client_id(self, request: Request) -> str:
+        """API key nằm trong danh sách đăng ký -> key:<hash>; còn lại theo IP (key lạ không tạo quota mới)"""
+        key = request.headers.get(self.api_key_header, "")
+        if not key:
+            auth = request.headers.get("authorization", "")
+            if auth.lower().startswith("bearer "):
+                key = auth[7:].strip()
+        if key and key in self.api_keys:
+            return "key:" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+        if self.trust_forwarded:
+            forwarded = request.headers.get("x-forwarded-for", "")
+            if forwarded:
+                return "ip:" + forwarded.split(",")[0].strip()
+        return "ip:" + (request.client.host if request.client else "unknown")
+
+    async def _take(self, ops: List[BucketOp]) -> Tuple[float, Optional[int]]:
+        if isinstance(self.store, MemoryBucketStore):
+            return self.store.take(ops)
+        return await anyio.to_thread.run_sync(self.store.take, ops)
+
+    def _token_op(self, client: str, cost: float, required: float) -> BucketOp:
+        return (f"{client}:tokens", self.tokens_per_minute / 60.0, float(self.tokens_per_minute), cost, required)
+
+    async def check(self, client: str):
+        """Trừ một request; chặn nếu hết request hoặc quota token đang âm"""
+        ops = [(f"{client}:requests", self.requests_per_second, float(self.burst), 1.0, 1.0)]
+        if self.tokens_per_minute > 0:
+            ops.append(self._token_op(client, 0.0, 0.0))
+
+        wait, blocked = await self._take(ops)
+        if blocked is None:
+            self.stats["allowed"] += 1
+            return
+
+        bucket = "requests" if blocked == 0 else "tokens"
+        self.stats[f"limited_{bucket}"] += 1
+        RATE_LIMITED.inc(1.0, bucket)
+        raise RateLimited(min(3600, max(1, math.ceil(wait))), bucket)
+
+    async def charge(self, client: str, tokens: int):
+        """Trừ token LLM đã dùng (luôn thành công, có thể làm quota âm)"""
+        if self.tokens_per_minute <= 0 or tokens <= 0:
+            return
+        await self._take([self._token_op(client, float(tokens), -math.inf)])
+        self.stats["tokens_charged"] += tokens
+        RATE_LIMIT_TOKENS.inc(float(tokens))
+
+    def after_fork(self):
+        self.store.after_fork()
+
+    def info(self) -> dict:
+        return {
+            **self.stats,
+            "requests_per_second": self.requests_per_second,
+            "burst": self.burst,
+            "tokens_per_minute": self.tokens_per_minute,
+            "registered_keys": len(self.api_keys),
+            "tracked_buckets": self.store.size(),
+            "shared_store": isinstance(self.store, SQLiteBucketStore)
+        }
+
+    def client_info(self, client: str) -> dict:
+        """Mức còn lại của một client"""
+        info = {
+            "client": client,
+            "requests_remaining": round(self.store.peek(
+                f"{client}:requests", self.requests_per_second, float(self.burst)), 2)
+        }
+        if self.tokens_per_minute > 0:
+            info["tokens_remaining"] = round(self.store.peek(*self._token_op(client, 0, 0)[:3]))
+        return info
+
+async def enforce_rate_limit(request: Request):
+    """Dependency cho các endpoint gọi LLM: kiểm tra giới hạn và ghi nhận client hiện tại"""
+    if rate_limiter is None:
+        return
+    client = rate_limiter.client_id(request)
+    current_client.set(client)
+    with stage("rate_limit"):
+        await rate_limiter.check(client)
+
+async def charge_tokens(result: dict):
+    """Trừ token của một kết quả LLM vào quota của client hiện tại (kết quả từ cache không tính)"""
+    client = current_client.get()
+    if rate_limiter is None or client is None or result.get("cached"):
+        return
+    await rate_limiter.charge(client, result.get("tokens_used") or 0)
+
+# Tạo instance global (None nếu tắt rate limit)
+rate_limiter = RateLimiter(
+    requests_per_second=settings.RATE_LIMIT_REQUESTS_PER_SECOND,
+    burst=settings.RATE_LIMIT_BURST,
+    tokens_per_minute=settings.RATE_LIMIT_TOKENS_PER_MINUTE,
+    api_keys=[k.strip() for k in settings.RATE_LIMIT_API_KEYS.split(",") if k.strip()],
+    api_key_header=settings.RATE_LIMIT_API_KEY_HEADER,
+    trust_forwarded=settings.RATE_LIMIT_TRUST_FORWARDED,
+    max_clients=settings.RATE_LIMIT_MAX_CLIENTS,
+    db_path=settings.RATE_LIMIT_DB_PATH
+) if settings.RATE_LIMIT_ENABLED else None
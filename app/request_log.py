@@ -0,0 +1,192 @@
+import asyncio
+import contextvars
+import glob
+import gzip
+import json
+import os
+import shutil
+import time
+from collections import deque
+from typing import Deque, List, Optional
+
+import anyio
+
+from .config import settings
+
+# Thông tin LLM của request hiện tại (model, token, cache), điền bởi LLMClient
+request_stats: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("request_stats", default=None)
+
+# Không ghi các endpoint được poll liên tục
+SKIP_PATHS = ("/metrics", "/health", "/api/health")
+
+def record_llm_result(result: dict):
+    """Ghi model / token / cache của lời gọi LLM vào log entry của request hiện tại"""
+    stats = request_stats.get()
+    if stats is None:
+        return
+    usage = result.get("usage") or {}
+    stats.update({
+        "model": result.get("model"),
+        "prompt_source": result.get("prompt_source"),
+        "cached": result.get("cached", False),
+        "prompt_tokens": stats.get("prompt_tokens", 0) + usage.get("prompt_tokens", 0),
+        "completion_tokens": stats.get("completion_tokens", 0) + usage.get("completion_tokens", 0),
+        "tokens_used": stats.get("tokens_used", 0) + (result.get("tokens_used") or 0)
+    })
+
+class RequestLogger:
+    """
+    Log request/response dạng JSONL, append-only
+    Hot path chỉ đưa entry vào hàng đợi; background task ghi theo lô trong thread,
+    xoay vòng file khi vượt max_bytes (file cũ được nén gzip).
+    """
+
+    def __init__(self, path: str, max_bytes: int, backups: int, batch_size: int,
+                 flush_interval: float, max_queue: int):
+        self.path_template = path
+        self.path = ""
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.stats = {"logged": 0, "written": 0, "dropped": 0, "rotations": 0}
+        self._entries: Deque[dict] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            # {pid} trong đường dẫn: mỗi worker process ghi file riêng
+            self.path = self.path_template.format(pid=os.getpid())
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Dừng writer và ghi nốt các entry còn trong hàng đợi"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._entries:
+            await anyio.to_thread.run_sync(self._write_batch, self._drain())
+
+    def log(self, entry: dict):
+        """Không block: hàng đợi đầy thì bỏ entry (đếm vào dropped)"""
+        if len(self._entries) >= self.max_queue:
+            self.stats["dropped"] += 1
+            return
+        self._entries.append(entry)
+        self.stats["logged"] += 1
+        if len(self._entries) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _drain(self) -> List[dict]:
+        batch = []
+        while self._entries and len(batch) < self.batch_size:
+            batch.append(self._entries.popleft())
+        return batch
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._entries:
+                batch = self._drain()
+                try:
+                    await anyio.to_thread.run_sync(self._write_batch, batch)
+                except Exception as e:
+                    print(f"❌ Request log write error: {str(e)}")
+
+    def _write_batch(self, batch: List[dict]):
+        lines = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in batch)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        self.stats["written"] += len(batch)
+        if os.path.getsize(self.path) >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        """Nén file hiện tại thành <path>.<timestamp>.gz và chỉ giữ `backups` file gần nhất"""
+        rotated = f"{self.path}.{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 1000000:06d}.gz"
+        with open(self.path, "rb") as src, gzip.open(rotated, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(self.path)
+        self.stats["rotations"] += 1
+        for old in sorted(glob.glob(f"{glob.escape(self.path)}.*.gz"))[:-self.backups or None]:
+            os.remove(old)
+
+    def info(self) -> dict:
+        return {**self.stats, "path": self.path, "queued": len(self._entries)}
+
+class RequestLogMiddleware:
+    """ASGI middleware ghi method, path, body, status, thời gian và số token của mỗi request"""
+
+    def __init__(self, app, logger: RequestLogger, max_body: int):
+        self.app = app
+        self.logger = logger
+        self.max_body = max_body
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in SKIP_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        self.logger.start()
+        start = time.perf_counter()
+        body = bytearray()
+        status = 500
+        response_bytes = 0
+        first_byte: Optional[float] = None
+
+        async def receive_and_capture():
+            message = await receive()
+            if message["type"] == "http.request" and len(body) < self.max_body:
+                body.extend(message.get("body", b"")[:self.max_body - len(body)])
+            return message
+
+        async def send_and_capture(message):
+            nonlocal status, response_bytes, first_byte
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                if first_byte is None:
+                    first_byte = time.perf_counter() - start
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        stats: dict = {}
+        token = request_stats.set(stats)
+        try:
+            await self.app(scope, receive_and_capture, send_and_capture)
+        finally:
+            request_stats.reset(token)
+            self.logger.log({
+                "ts": time.time(),
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope["query_string"].decode("latin-1"),
+                "body": body.decode("utf-8", errors="replace"),
+                "status": status,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+                "ttfb_ms": round(first_byte * 1000, 2) if first_byte is not None else None,
+                "response_bytes": response_bytes,
+                **stats
+            })
+
+# Tạo instance global (None nếu không bật request log)
+request_logger = RequestLogger(
+    path=settings.REQUEST_LOG_PATH,
+    max_bytes=settings.REQUEST_LOG_MAX_BYTES,
+    backups=settings.REQUEST_LOG_BACKUPS,
+    batch_size=settings.REQUEST_LOG_BATCH_SIZE,
+    flush_interval=settings.REQUEST_LOG_FLUSH_INTERVAL,
+    max_queue=settings.REQUEST_LOG_MAX_QUEUE
+) if settings.REQUEST_LOG_PATH else None
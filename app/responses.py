@@ -0,0 +1,30 @@
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+except ImportError:  # orjson là tùy chọn, fallback json chuẩn
+    FastJSONResponse = JSONResponse
+
+# Client chọn response gọn bằng ?compact=true hoặc header Accept này
+COMPACT_MEDIA_TYPE = "application/vnd.llm-review.compact+json"
+
+def compact_requested(compact: bool, accept: str) -> bool:
+    return compact or COMPACT_MEDIA_TYPE in accept
+
+def compact_result(result: dict) -> dict:
+    """Response gọn: chỉ answer, model, usage và version của prompt (không echo prompt/question)"""
+    usage = result.get("usage") or {}
+    return {
+        "answer": result["answer"],
+        "model": result["model"],
+        "usage": {
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "total_tokens": result.get("tokens_used", 0)
+        },
+        "prompt_version": result.get("prompt_source"),
+        "cached": result.get("cached", False),
+        "cache_match": result.get("cache_match"),
+        "partial": result.get("partial", False)
+    }
@@ -0,0 +1,41 @@
+from pathlib import Path
+
+# Giới hạn ký tự của nội dung / diff trong prompt dựng từ path/content/diff
+# (file lớn hơn: client nên gửi question dựng sẵn theo từng phần, xem .github/scripts/review_reduce.py)
+MAX_SECTION_CHARS = 5000
+
+def _clip(text: str) -> str:
+    """Cắt text dài, ghi rõ số ký tự bị bỏ để LLM (và người đọc) biết review không đầy đủ"""
+    if len(text) <= MAX_SECTION_CHARS:
+        return text
+    return f"{text[:MAX_SECTION_CHARS]}\n... [truncated {len(text) - MAX_SECTION_CHARS} characters]"
+
+def build_file_review_prompt(path: str, content: str, diff: str) -> str:
+    """Tạo prompt review cho một file (cùng mẫu với .github/scripts/code_review.py)"""
+    language = Path(path).suffix.lower().replace('.', '')
+
+    return f"""
+        Please review the following {language.upper()} code changes:
+
+        FILE: {path}
+
+        CODE CONTENT:
+        ```
+        {_clip(content)}
+        ```
+
+        CHANGES (diff):
+        ```
+        {_clip(diff)}
+        ```
+
+        Please provide a code review focusing on:
+        1. Code quality and readability
+        2. Potential bugs or issues
+        3. Performance considerations
+        4. Security concerns
+        5. Best practices violations
+        6. Suggestions for improvement
+
+        Keep the review concise and actionable.
+        """
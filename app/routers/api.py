@@ -1,8 +1,26 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+import json
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional, Tuple
 from ..llm_client import llm_client
+from ..cache import response_cache
+from ..similarity_cache import similarity_cache
+from ..admission import admission
 from ..config import settings
+from ..review_prompt import build_file_review_prompt
+from ..health import health_prober
+from ..prompt_store import prompt_store
+from ..responses import FastJSONResponse, compact_requested, compact_result
+from ..jobs import job_queue
+from ..rate_limit import enforce_rate_limit, rate_limiter
+from ..deadline import DEADLINE_EXCEEDED, DeadlineExceeded, apply_deadline, current_deadline
+from ..hedging import hedger
+from ..cascade import cascade
+from ..profiling import request_profiler, require_admin
+from ..startup import startup_report
 
 router = APIRouter(prefix="/api", tags=["LLM API"])
 
@@ -16,29 +34,91 @@ class LLMResponse(BaseModel):
     model: str
     used_prompt: str  # PROMPT ĐƯỢC SỬ DỤNG
     prompt_length: int  # ĐỘ DÀI PROMPT
+    cached: bool = False  # TRẢ VỀ TỪ CACHE
+    prompt_source: Optional[str] = None  # TÊN@VERSION CỦA PROMPT
+    cache_match: Optional[str] = None  # exact: PROMPT GIỐNG HỆT, normalized: CHỈ KHÁC COMMENT / TÊN BIẾN
+    partial: bool = False  # CÂU TRẢ LỜI DỞ DANG DO HẾT DEADLINE (X-Allow-Partial)
 
-@router.get("/test/", response_model=LLMResponse)
-async def test_llm_get(question: str):
-    """API GET: nhận question qua query parameter - dùng prompt từ file"""
+class TokenUsage(BaseModel):
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+
+class CompactLLMResponse(BaseModel):
+    """Response gọn (?compact=true): không echo lại prompt và question"""
+    answer: str
+    model: str
+    usage: TokenUsage
+    prompt_version: Optional[str] = None
+    cached: bool = False
+    cache_match: Optional[str] = None
+    partial: bool = False
+
+class ReviewItem(BaseModel):
+    path: str
+    content: str = ""
+    diff: str = ""
+    question: Optional[str] = None  # Prompt dựng sẵn từ client; nếu có thì bỏ qua content/diff
+
+class BatchReviewRequest(BaseModel):
+    items: List[ReviewItem]
+
+class ReviewJobRequest(BaseModel):
+    question: Optional[str] = None  # Prompt dựng sẵn; nếu không có thì dựng từ path/content/diff
+    path: str = ""
+    content: str = ""
+    diff: str = ""
+    priority: int = 0  # Lớn hơn = được xử lý trước
+    callback_url: Optional[str] = None  # POST kết quả tới URL này khi job xong
+
+# Giới hạn số lời gọi LLM đồng thời của tất cả batch request
+_batch_semaphore = asyncio.Semaphore(settings.BATCH_MAX_CONCURRENCY)
+
+def _cache_bypassed(http_request: Request) -> bool:
+    """Client bỏ qua cache bằng header X-Cache-Bypass: 1 hoặc Cache-Control: no-cache"""
+    bypass = http_request.headers.get("x-cache-bypass", "").lower() in ("1", "true", "yes")
+    return bypass or "no-cache" in http_request.headers.get("cache-control", "").lower()
+
+def _get_review_prompt(name: Optional[str] = None,
+                       fallback: str = "Bạn là một chuyên gia review code.") -> Tuple[str, str]:
+    """
+    Lấy prompt theo tên từ prompt store (mặc định code_review), fallback khi file rỗng
+    Trả về (nội dung prompt, nguồn dạng tên@version)
+    """
+    try:
+        prompt = prompt_store.get(name or "code_review")
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown prompt: {name}")
+    if not prompt.content:
+        print("⚠️  Warning: Prompt is empty!")
+        return fallback, f"{prompt.name}@fallback"
+    return prompt.content, f"{prompt.name}@{prompt.version}"
+
+@router.get("/test/", response_model=LLMResponse,
+            dependencies=[Depends(enforce_rate_limit), Depends(apply_deadline)],
+            responses={200: {"model": CompactLLMResponse, "description": "Response gọn khi ?compact=true"}})
+async def test_llm_get(question: str, http_request: Request, prompt: Optional[str] = None,
+                       compact: bool = False):
+    """API GET: nhận question qua query parameter - dùng prompt từ file (?prompt=tên để chọn prompt)"""
     try:
         # Log để debug
         print(f"📥 GET request received: {question[:50]}...")
-        print(f"📝 Using prompt from: {settings.AI_CODE_REVIEW_PROMPT}")
         
         # Lấy prompt từ file
-        review_prompt = settings.AI_CODE_REVIEW_PROMPT
-        
-        # Kiểm tra xem có prompt không
-        if not review_prompt or review_prompt == "":
-            print("⚠️  Warning: Prompt is empty!")
-            review_prompt = "Bạn là một trợ lý AI hữu ích."
+        review_prompt, prompt_source = _get_review_prompt(prompt, "Bạn là một trợ lý AI hữu ích.")
+        print(f"📝 Using prompt: {prompt_source}")
         
-        result = llm_client.ask(
+        result = await llm_client.ask(
             question=question,
-            system_prompt=review_prompt
+            system_prompt=review_prompt,
+            prompt_source=prompt_source,
+            use_cache=not _cache_bypassed(http_request)
         )
         
-        print(f"✅ Response generated successfully")
+        print("✅ Response generated successfully")
+        
+        if compact_requested(compact, http_request.headers.get("accept", "")):
+            return FastJSONResponse(compact_result(result))
         
         return {
             "success": True,
@@ -46,36 +126,43 @@ async def test_llm_get(question: str):
             "answer": result["answer"],
             "model": result["model"],
             "used_prompt": result["used_prompt"],  # HIỂN THỊ PROMPT
-            "prompt_length": len(result["used_prompt"])
+            "prompt_length": len(result["used_prompt"]),
+            "cached": result["cached"],
+            "prompt_source": result["prompt_source"],
+            "cache_match": result.get("cache_match"),
+            "partial": result.get("partial", False)
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error in GET /test/: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/review/", response_model=LLMResponse)
-async def code_review(request: QuestionRequest):
-    """API đặc biệt cho review code - dùng prompt từ file"""
+@router.post("/review/", response_model=LLMResponse,
+             dependencies=[Depends(enforce_rate_limit), Depends(apply_deadline)],
+             responses={200: {"model": CompactLLMResponse, "description": "Response gọn khi ?compact=true"}})
+async def code_review(request: QuestionRequest, http_request: Request, prompt: Optional[str] = None,
+                      compact: bool = False):
+    """API đặc biệt cho review code - dùng prompt từ file (?prompt=tên để chọn prompt)"""
     try:
         # Log để debug
         print(f"📥 POST /review request received: {request.question[:50]}...")
-        print(f"📝 Using prompt from: {settings.AI_CODE_REVIEW_PROMPT}")
         
         # Lấy prompt từ file
-        review_prompt = settings.AI_CODE_REVIEW_PROMPT
-        print(review_prompt)
-        # console.log(review_prompt)
+        review_prompt, prompt_source = _get_review_prompt(prompt)
+        print(f"📝 Using prompt: {prompt_source}")
         
-        # Kiểm tra xem có prompt không
-        if not review_prompt or review_prompt == "":
-            print("⚠️  Warning: Prompt is empty!")
-            review_prompt = "Bạn là một chuyên gia review code."
-        
-        result = llm_client.ask(
+        result = await llm_client.ask(
             question=request.question,
-            system_prompt=review_prompt
+            system_prompt=review_prompt,
+            prompt_source=prompt_source,
+            use_cache=not _cache_bypassed(http_request)
         )
         
-        print(f"✅ Code review completed successfully")
+        print("✅ Code review completed successfully")
+        
+        if compact_requested(compact, http_request.headers.get("accept", "")):
+            return FastJSONResponse(compact_result(result))
         
         return {
             "success": True,
@@ -83,48 +170,321 @@ async def code_review(request: QuestionRequest):
             "answer": result["answer"],
             "model": result["model"],
             "used_prompt": result["used_prompt"],  # HIỂN THỊ PROMPT
-            "prompt_length": len(result["used_prompt"])
+            "prompt_length": len(result["used_prompt"]),
+            "cached": result["cached"],
+            "prompt_source": result["prompt_source"],
+            "cache_match": result.get("cache_match"),
+            "partial": result.get("partial", False)
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error in POST /review/: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _format_stream_event(event: str, data: dict, ndjson: bool) -> str:
+    """Đóng gói một event theo định dạng SSE hoặc JSON lines"""
+    if ndjson:
+        return json.dumps({"event": event, **data}, ensure_ascii=False) + "\n"
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/review/stream", dependencies=[Depends(enforce_rate_limit), Depends(apply_deadline)])
+async def code_review_stream(request: QuestionRequest, http_request: Request,
+                             format: Optional[str] = None, prompt: Optional[str] = None):
+    """
+    API review code dạng streaming - forward token ngay khi upstream sinh ra
+    Mặc định là Server-Sent Events; dùng ?format=ndjson hoặc
+    Accept: application/x-ndjson để nhận JSON lines.
+    Hết deadline (X-Request-Timeout) trước token đầu tiên -> 504; giữa chừng -> event error
+    với partial=true, các token đã gửi là câu trả lời dở dang.
+    """
+    deadline = current_deadline.get()
+    ndjson = format == "ndjson" or "application/x-ndjson" in http_request.headers.get("accept", "")
+    print(f"📥 POST /review/stream request received: {request.question[:50]}...")
+    review_prompt, prompt_source = _get_review_prompt(prompt)
+
+    events = llm_client.ask_stream(
+        question=request.question,
+        system_prompt=review_prompt,
+        prompt_source=prompt_source
+    )
+
+    # Chờ event đầu tiên trước khi trả response: lỗi kết nối upstream vẫn thành HTTP 500
+    try:
+        with anyio.fail_after(deadline.remaining() if deadline is not None else None):
+            first_event = await events.__anext__()
+    except TimeoutError:
+        await events.aclose()
+        DEADLINE_EXCEEDED.inc(1.0, "timeout")
+        raise DeadlineExceeded()
+    except HTTPException:
+        await events.aclose()
+        raise
+    except Exception as e:
+        await events.aclose()
+        print(f"❌ Error in POST /review/stream: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def event_stream():
+        try:
+            event = first_event
+            while True:
+                if event["type"] == "delta":
+                    yield _format_stream_event("token", {"content": event["content"]}, ndjson)
+                else:
+                    yield _format_stream_event("done", {
+                        "success": True,
+                        "model": event["model"],
+                        "tokens_used": event["tokens_used"],
+                        "prompt_length": len(event["used_prompt"] or ""),
+                        "prompt_source": event["prompt_source"]
+                    }, ndjson)
+                    print("✅ Streamed code review completed")
+                    break
+                with anyio.move_on_after(deadline.remaining() if deadline is not None else None) as scope:
+                    event = await events.__anext__()
+                if scope.cancel_called:
+                    DEADLINE_EXCEEDED.inc(1.0, "partial")
+                    yield _format_stream_event("error", {
+                        "success": False,
+                        "partial": True,
+                        "error": "Request deadline exceeded"
+                    }, ndjson)
+                    break
+        except StopAsyncIteration:
+            pass
+        except Exception as e:
+            print(f"❌ Error in POST /review/stream: {str(e)}")
+            yield _format_stream_event("error", {"success": False, "error": str(e)}, ndjson)
+        finally:
+            # Client ngắt kết nối -> đóng stream upstream (shield để không bị cancel giữa chừng)
+            with anyio.CancelScope(shield=True):
+                await events.aclose()
+
+    media_type = "application/x-ndjson" if ndjson else "text/event-stream"
+    return StreamingResponse(
+        event_stream(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _review_batch_item(index: int, item: ReviewItem, review_prompt: str,
+                             prompt_source: str, use_cache: bool) -> dict:
+    """Review một file trong batch; lỗi của item không làm hỏng cả batch"""
+    async with _batch_semaphore:
+        try:
+            result = await llm_client.ask(
+                question=item.question or build_file_review_prompt(item.path, item.content, item.diff),
+                system_prompt=review_prompt,
+                prompt_source=prompt_source,
+                use_cache=use_cache
+            )
+            return {
+                "index": index,
+                "path": item.path,
+                "success": True,
+                "answer": result["answer"],
+                "model": result["model"],
+                "tokens_used": result["tokens_used"],
+                "cached": result["cached"],
+                "cache_match": result.get("cache_match"),
+                "partial": result.get("partial", False)
+            }
+        except Exception as e:
+            print(f"❌ Error reviewing {item.path} in batch: {str(e)}")
+            return {"index": index, "path": item.path, "success": False, "error": str(e)}
+
+@router.post("/review/batch", dependencies=[Depends(enforce_rate_limit), Depends(apply_deadline)])
+async def code_review_batch(request: BatchReviewRequest, http_request: Request,
+                            stream: bool = False, prompt: Optional[str] = None):
+    """
+    API review nhiều file trong một request
+    Các item được gửi tới LLM song song (giới hạn bởi BATCH_MAX_CONCURRENCY).
+    Mặc định trả về toàn bộ kết quả theo thứ tự item; ?stream=true trả về
+    JSON lines, mỗi dòng là kết quả của một item ngay khi item đó xong.
+    """
+    if len(request.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(request.items)} items (max {settings.BATCH_MAX_ITEMS})"
+        )
+
+    print(f"📥 POST /review/batch request received: {len(request.items)} items")
+    review_prompt, prompt_source = _get_review_prompt(prompt)
+    use_cache = not _cache_bypassed(http_request)
+
+    tasks = [
+        asyncio.create_task(_review_batch_item(i, item, review_prompt, prompt_source, use_cache))
+        for i, item in enumerate(request.items)
+    ]
+
+    if not stream:
+        results = await asyncio.gather(*tasks)
+        print(f"✅ Batch review completed ({len(results)} items)")
+        return {
+            "success": all(r["success"] for r in results),
+            "results": results
+        }
+
+    async def result_stream():
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done, ensure_ascii=False) + "\n"
+            print(f"✅ Batch review streamed ({len(tasks)} items)")
+        finally:
+            # Client ngắt kết nối -> hủy các item chưa xong
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+@router.post("/review/jobs", status_code=202,
+             dependencies=[Depends(enforce_rate_limit), Depends(apply_deadline)])
+async def submit_review_job(request: ReviewJobRequest, http_request: Request,
+                            prompt: Optional[str] = None):
+    """
+    API tạo job review bất đồng bộ: trả job_id ngay, worker xử lý theo độ ưu tiên
+    Lấy kết quả bằng GET /api/review/jobs/{job_id} hoặc qua callback_url
+    """
+    if not request.question and not (request.content or request.diff):
+        raise HTTPException(status_code=422, detail="Either question or content/diff is required")
+    if request.callback_url and not job_queue.callback_allowed(request.callback_url):
+        raise HTTPException(status_code=400, detail="callback_url host is not allowed")
+
+    review_prompt, prompt_source = _get_review_prompt(prompt)
+    job = await job_queue.submit(
+        question=request.question or build_file_review_prompt(request.path, request.content, request.diff),
+        system_prompt=review_prompt,
+        prompt_source=prompt_source,
+        priority=request.priority,
+        callback_url=request.callback_url,
+        use_cache=not _cache_bypassed(http_request)
+    )
+    print(f"📥 Review job {job.id} queued (priority {job.priority})")
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/review/jobs/{job.id}"
+    }
+
+@router.get("/review/jobs")
+async def review_jobs_stats():
+    """API thống kê hàng đợi job review"""
+    return job_queue.info()
+
+@router.get("/review/jobs/{job_id}")
+async def get_review_job(job_id: str):
+    """API lấy trạng thái / kết quả job review (404 nếu không tồn tại hoặc đã hết hạn)"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
 @router.get("/prompts/")
 async def get_prompts():
     """API lấy thông tin về prompt đang được sử dụng"""
     try:
-        prompt_content = settings.AI_CODE_REVIEW_PROMPT
+        current = prompt_store.get("code_review")
+        prompt_content = current.content
         
         return {
             "success": True,
             "prompt_info": {
-                "source_file": settings.AI_CODE_REVIEW_PROMPT,
+                "source_file": current.path,
+                "version": current.version,
                 "content": prompt_content,
                 "length": len(prompt_content),
                 "preview": prompt_content[:200] + "..." if len(prompt_content) > 200 else prompt_content
             },
             "model": settings.OLLAMA_MODEL,
-            "ollama_url": settings.OLLAMA_BASE_URL
+            "ollama_url": settings.OLLAMA_BASE_URL,
+            "prompts": prompt_store.info()
         }
     except Exception as e:
         print(f"❌ Error in /prompts/: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/cache/stats")
+async def cache_stats():
+    """API thống kê response cache (hit/miss) và request coalescing"""
+    coalescing = {
+        "requests": {**llm_client.inflight.stats, "in_flight": llm_client.inflight.in_flight()},
+        "streams": {**llm_client.stream_inflight.stats, "in_flight": llm_client.stream_inflight.in_flight()}
+    }
+    similarity = {"enabled": False} if similarity_cache is None else {"enabled": True, **similarity_cache.info()}
+    if response_cache is None:
+        return {"enabled": False, "coalescing": coalescing, "similarity": similarity}
+    return {"enabled": True, **response_cache.info(), "coalescing": coalescing, "similarity": similarity}
+
+@router.get("/admission/stats")
+async def admission_stats():
+    """API thống kê admission control (limit, hàng đợi, latency)"""
+    if admission is None:
+        return {"enabled": False}
+    return {"enabled": True, **admission.info()}
+
+@router.get("/cascade/stats")
+async def cascade_stats():
+    """API thống kê model cascade: số request, latency và token theo tầng, tỷ lệ escalate"""
+    if cascade is None:
+        return {"enabled": False}
+    return {"enabled": True, **cascade.info()}
+
+@router.get("/ratelimit/stats")
+async def rate_limit_stats(http_request: Request):
+    """API thống kê rate limit và quota còn lại của client đang gọi"""
+    if rate_limiter is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        **rate_limiter.info(),
+        "you": rate_limiter.client_info(rate_limiter.client_id(http_request))
+    }
+
+@router.get("/backends")
+async def backends_stats():
+    """API trạng thái các LLM backend (outstanding, EWMA latency, circuit breaker)"""
+    await llm_client.wait_ready()
+    return {
+        "policy": llm_client.pool.policy,
+        "backends": llm_client.pool.info(),
+        "hedging": {"enabled": False} if hedger is None else {"enabled": True, **hedger.info()}
+    }
+
+@router.get("/startup/stats")
+async def startup_stats():
+    """API thời gian khởi động theo giai đoạn (import, tạo app, startup hook, warm-up client LLM)"""
+    return {
+        **startup_report.info(),
+        "llm_client_ready": llm_client.ready
+    }
+
+@router.get("/debug/slow", dependencies=[Depends(require_admin)])
+async def slow_requests():
+    """API (admin) N request chậm nhất gần đây, thời gian theo giai đoạn (rate_limit, cache, admission, upstream)"""
+    return {**request_profiler.info(), "slowest": request_profiler.slow_log.entries()}
+
+@router.get("/debug/profiles/{profile_id}", response_class=PlainTextResponse,
+            dependencies=[Depends(require_admin)])
+async def get_profile(profile_id: str):
+    """API (admin) profile của một request (gửi kèm header X-Profile), dạng folded stacks cho flamegraph"""
+    profile = request_profiler.profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profile["folded"] + "\n")
+
 @router.get("/health")
 async def health_check():
-    """Health check endpoint cho server"""
+    """Health check endpoint cho server (kết quả probe upstream lấy từ bộ nhớ)"""
     try:
         # Kiểm tra prompt
         prompt_content = settings.AI_CODE_REVIEW_PROMPT
         prompt_ok = bool(prompt_content and prompt_content.strip())
         
-        # Kiểm tra kết nối LLM (cơ bản)
-        import requests
-        try:
-            ollama_response = requests.get(settings.OLLAMA_BASE_URL.replace('/v1', '/api/tags'), timeout=5)
-            ollama_ok = ollama_response.status_code == 200
-        except:
-            ollama_ok = False
+        # Kết nối LLM: kết quả gần nhất của background prober, không gọi upstream tại đây
+        health_prober.start()
+        upstream = health_prober.snapshot()
+        ollama_ok = upstream["upstream_ok"]
         
         return {
             "status": "healthy" if prompt_ok and ollama_ok else "degraded",
@@ -132,7 +492,8 @@ async def health_check():
             "prompt_length": len(prompt_content) if prompt_content else 0,
             "ollama_connected": ollama_ok,
             "model": settings.OLLAMA_MODEL,
-            "server_time": "OK"
+            "server_time": "OK",
+            **upstream
         }
     except Exception as e:
         print(f"❌ Health check error: {str(e)}")
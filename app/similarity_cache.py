@@ -0,0 +1,239 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from pathlib import PurePosixPath
+from typing import Dict, List, Optional, Set, Tuple
+
+from .config import settings
+
+# Prompt quá ngắn: để cache exact-match xử lý
+MIN_TOKENS = 18
+
+# Đường dẫn file trong prompt review (dòng "FILE: path"), dùng để chọn cú pháp comment
+FILE_RE = re.compile(r"^[ \t]*FILE:[ \t]*(\S+)", re.M)
+# Cột số dòng của CODE CONTEXT ("  12 | code"): dịch chuyển khi thêm dòng phía trên
+GUTTER_RE = re.compile(r"^[ \t]*\d+ \| ", re.M)
+
+# Literal chuỗi được khớp trước comment nên "#fff" hay "http://x" không bị cắt
+STRING_SRC = (r'"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\'|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\''
+              r'|(?<!`)`(?!``)(?:\\.|[^`\\])*`')
+HASH_COMMENT = r"#[^\n]*"
+SLASH_COMMENT = r"//[^\n]*|/\*[\s\S]*?\*/"
+BLOCK_COMMENT = r"/\*[\s\S]*?\*/"
+DASH_COMMENT = r"--[^\n]*"
+# Docstring Python: chuỗi ba dấu nháy đứng đầu câu lệnh (không phải giá trị gán)
+DOCSTRING = r'^[+\- ]?[ \t]*(?:"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\')'
+# Hunk header của diff (số dòng thay đổi khi file dịch chuyển)
+HUNK_HEADER = r"^@@[^\n]*@@"
+
+def _comment_re(*comments: str) -> "re.Pattern":
+    return re.compile("|".join([f"(?P<string>{STRING_SRC})", *comments]), re.M)
+
+_HASH_RE = _comment_re(HASH_COMMENT, HUNK_HEADER)
+_SLASH_RE = _comment_re(SLASH_COMMENT, HUNK_HEADER)
+COMMENT_SYNTAX = {
+    **dict.fromkeys(("rb", "sh", "bash", "zsh", "yml", "yaml", "toml", "r", "pl", "ps1", "cfg"), _HASH_RE),
+    **dict.fromkeys(("c", "h", "cc", "cpp", "cxx", "hpp", "cs", "java", "js", "jsx", "mjs", "ts", "tsx",
+                     "go", "rs", "kt", "kts", "swift", "scala", "dart", "scss", "less"), _SLASH_RE),
+    "py": _comment_re(DOCSTRING, HASH_COMMENT, HUNK_HEADER),
+    "php": _comment_re(SLASH_COMMENT, HASH_COMMENT, HUNK_HEADER),
+    "css": _comment_re(BLOCK_COMMENT, HUNK_HEADER),
+    **dict.fromkeys(("sql", "lua", "hs"), _comment_re(DASH_COMMENT, HUNK_HEADER)),
+}
+# Ngôn ngữ không rõ: chỉ bỏ hunk header, giữ nguyên mọi thứ có thể là code
+DEFAULT_RE = _comment_re(HUNK_HEADER)
+
+TOKEN_RE = re.compile(r"[A-Za-z_]\w*|\d+(?:\.\d+)?|\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*'|[^\s\w]")
+# Khối top-level: dòng không thụt lề (bỏ qua dấu +/-/space của diff)
+BLOCK_RE = re.compile(r"\n(?=[+\- ]?[^\s+\-])")
+# Dòng mở đầu một hàm: từ khóa (def, function, ...) hoặc khai báo kiểu C/Java "int add(int a) {"
+FUNC_HEADER_RE = re.compile(
+    r"^\s*(?:(?:export|public|private|protected|static|async|pub|final|override)\s+)*"
+    r"(?:def|function|func|fn)\b"
+    r"|^\s*(?!(?:return|else|new|throw|await|yield|delete|case|if|while|for|switch|catch)\b)"
+    r"(?:[A-Za-z_][\w:<>,]*[\s*&]+)+[A-Za-z_][\w:~]*\s*\([^;=]*\)\s*(?:const\s*)?\{?\s*$"
+)
+# Ngôn ngữ khai báo kiểu trước tên (tham số "int a"), còn lại tên trước kiểu ("a: int", "a int")
+TYPE_FIRST = frozenset(("c", "h", "cc", "cpp", "cxx", "hpp", "cs", "java"))
+# Toán tử gán kết hợp: "+=", "-=", ...
+AUGMENTED = frozenset("+-*/%&|^")
+
+# Từ khóa được giữ nguyên
+KEYWORDS = frozenset("""
+and as assert async await auto bool break case catch char class const continue def default defer
+del do double elif else enum except export extends false final finally float for from func function
+global go if implements import in int interface is lambda let long match mut new nil none nonlocal
+not null of or package pass private protected public raise return self short signed static struct
+super switch this throw throws true try type typeof unsigned var void while with yield
+""".split())
+
+def _language(text: str) -> str:
+    match = FILE_RE.search(text)
+    return PurePosixPath(match.group(1)).suffix.lower().lstrip(".") if match else ""
+
+def strip_comments(text: str, language: str) -> str:
+    """Bỏ comment (theo cú pháp của ngôn ngữ) và hunk header, giữ nguyên literal chuỗi"""
+    pattern = COMMENT_SYNTAX.get(language, DEFAULT_RE)
+    return pattern.sub(lambda m: m.group(0) if m.lastgroup == "string" else " ", GUTTER_RE.sub("", text))
+
+def _is_name(token: str) -> bool:
+    return (token[0].isalpha() or token[0] == "_") and token.lower() not in KEYWORDS
+
+def _code(line: str) -> str:
+    """Dòng code không có dấu +/-/space của diff"""
+    return line[1:] if line[:1] in "+- " else line
+
+def _bound_names(lines: List[str], type_first: bool) -> Set[str]:
+    """
+    Tên được gán trong thân hàm của khối: tham số, vế trái phép gán, biến vòng lặp, "as x", "let x"
+    Tên ở cấp module, tên import và tên khai báo global/nonlocal không được tính
+    """
+    bound: Set[str] = set()
+    excluded: Set[str] = set()
+    header_indent = None
+    for line in lines:
+        if not line.strip():
+            continue
+        code = _code(line)
+        indent = len(code) - len(code.lstrip())
+        is_header = bool(FUNC_HEADER_RE.match(code))
+        if is_header and (header_indent is None or indent <= header_indent):
+            header_indent = indent
+        elif header_indent is None or indent <= header_indent:
+            # Ngoài thân hàm (code cấp module / thân class)
+            header_indent = None
+            continue
+
+        tokens = TOKEN_RE.findall(code)
+        if tokens and tokens[0] in ("global", "nonlocal"):
+            excluded.update(t for t in tokens[1:] if _is_name(t))
+            continue
+        if tokens and tokens[0] in ("import", "from"):
+            continue
+        depth = 0
+        params = is_header
+        in_for = False
+        for i, token in enumerate(tokens):
+            prev = tokens[i - 1] if i else ""
+            after = tokens[i + 1] if i + 1 < len(tokens) else ""
+            if token in "([{" and len(token) == 1:
+                depth += 1
+                continue
+            if token in ")]}" and len(token) == 1:
+                depth -= 1
+                if params and depth == 0:
+                    params = False
+                continue
+            if token == "for":
+                in_for = True
+            elif token in ("in", "of"):
+                in_for = False
+            if not _is_name(token) or prev == "." or after == "(":
+                continue
+            if params and depth == 1:
+                if (after in (",", ")", "=", ":") and prev not in (":", ">")) if type_first \
+                        else prev in ("(", ",", "*", "&", "mut"):
+                    bound.add(token)
+            elif in_for or prev in ("as", "let", "var", "const", "auto", "mut"):
+                bound.add(token)
+            elif depth == 0 and after == "=" and tokens[i + 2:i + 3] != ["="]:
+                bound.add(token)
+            elif depth == 0 and after in AUGMENTED and tokens[i + 2:i + 3] == ["="]:
+                bound.add(token)
+            elif depth == 0 and after == "," and "=" in tokens[i + 1:] and not params:
+                # Gán tuple: "a, b = f()"
+                rest = tokens[i + 1:]
+                eq = rest.index("=")
+                if rest[eq + 1:eq + 2] != ["="] and not any(t in "([{" for t in rest[:eq]):
+                    bound.add(token)
+    return bound - excluded
+
+def normalize_tokens(text: str) -> List[str]:
+    """
+    Bỏ comment / docstring / khoảng trắng và chuẩn hóa tên biến cục bộ
+    Comment được nhận theo ngôn ngữ của file (dòng "FILE:" trong prompt), chỉ ngoài literal chuỗi.
+    Chỉ tên được gán trong thân hàm mới được đánh số theo thứ tự xuất hiện trong khối top-level;
+    tên cấp module, tên import, tên hàm được gọi và thuộc tính (sau dấu chấm) giữ nguyên
+    vì đổi chúng là đổi hành vi.
+    """
+    language = _language(text)
+    tokens = []
+    for block in BLOCK_RE.split(strip_comments(text, language)):
+        bound = _bound_names(block.split("\n"), language in TYPE_FIRST)
+        names: Dict[str, str] = {}
+        block_tokens = TOKEN_RE.findall(block)
+        for i, token in enumerate(block_tokens):
+            if token[0].isalpha() or token[0] == "_":
+                lowered = token.lower()
+                if lowered in KEYWORDS:
+                    token = lowered
+                elif token in bound and not (i and block_tokens[i - 1] == "."):
+                    token = names.setdefault(token, f"v{len(names)}")
+            tokens.append(token)
+    return tokens
+
+def signature(tokens: List[str]) -> Optional[bytes]:
+    """
+    Digest của chuỗi token đã chuẩn hóa (None nếu quá ngắn)
+    Khớp chính xác chứ không ước lượng độ tương đồng: đổi một token logic
+    (">" thành ">=") phải cho review mới dù phần còn lại của file giống hệt
+    """
+    if len(tokens) < MIN_TOKENS:
+        return None
+    return hashlib.blake2b("\x00".join(tokens).encode(), digest_size=16).digest()
+
+class SimilarityCache:
+    """
+    Cache gần trùng lặp: trả review đã có khi prompt mới chỉ khác về khoảng trắng,
+    comment hoặc tên biến (chuỗi token giống hệt sau normalize_tokens)
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # (signature, context) -> (created_at, value), thứ tự LRU
+        self._entries: "OrderedDict[Tuple[bytes, str], tuple]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "skipped": 0}
+
+    def signature(self, question: str) -> Optional[bytes]:
+        return signature(normalize_tokens(question))
+
+    def lookup(self, signature: Optional[bytes], context: str) -> Optional[dict]:
+        """Tìm review cùng chuỗi token chuẩn hóa và cùng context (model, system prompt)"""
+        if signature is None:
+            self.stats["skipped"] += 1
+            return None
+        key = (signature, context)
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] > self.ttl:
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def add(self, signature: Optional[bytes], context: str, value: dict):
+        if signature is None:
+            return
+        key = (signature, context)
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def info(self) -> dict:
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries
+        }
+
+# Tạo instance global (None nếu không bật)
+similarity_cache = SimilarityCache(
+    max_entries=settings.LLM_SIMILARITY_MAX_ENTRIES,
+    ttl=settings.LLM_CACHE_TTL
+) if settings.LLM_SIMILARITY_CACHE_ENABLED else None
@@ -0,0 +1,131 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+class SingleFlight:
+    """
+    Gộp các request giống hệt nhau đang chạy đồng thời thành một lời gọi upstream
+    Tất cả caller cùng key nhận chung một kết quả (hoặc cùng một exception)
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        # Số caller còn chờ mỗi lời gọi (để hủy khi caller cuối cùng hết deadline)
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self.stats = {"leaders": 0, "shared": 0}
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[dict]],
+                 timeout: Optional[float] = None) -> dict:
+        """
+        timeout: deadline của caller; hết hạn -> asyncio.TimeoutError,
+        lời gọi upstream bị hủy nếu không còn caller nào khác chờ
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(factory())
+            self._calls[key] = task
+            self._waiters[task] = 0
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.stats["leaders"] += 1
+        else:
+            self.stats["shared"] += 1
+
+        # shield: một caller bị hủy (client ngắt kết nối) không hủy lời gọi của các caller khác
+        self._waiters[task] += 1
+        try:
+            if timeout is None:
+                return await asyncio.shield(task)
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            if self._waiters.get(task) == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            if task in self._waiters:
+                self._waiters[task] -= 1
+
+    def _forget(self, key: str, task: asyncio.Task):
+        self._waiters.pop(task, None)
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Đánh dấu exception đã được xử lý khi mọi caller đều đã bỏ đi
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+class _Broadcast:
+    """Trạng thái của một stream đang được chia sẻ"""
+
+    def __init__(self):
+        self.events: List[dict] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+class StreamSingleFlight:
+    """
+    Single-flight cho streaming: subscriber đến sau dùng chung stream upstream đang chạy,
+    nhận lại các event đã phát (replay từ đầu) rồi tiếp tục nhận event mới.
+    Khi subscriber cuối cùng rời đi, stream upstream bị hủy.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Broadcast] = {}
+        self.stats = {"leaders": 0, "shared": 0}
+
+    async def subscribe(self, key: str,
+                        factory: Callable[[], AsyncIterator[dict]]) -> AsyncIterator[dict]:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Broadcast()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._produce(key, flight, factory))
+            self.stats["leaders"] += 1
+        else:
+            self.stats["shared"] += 1
+
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(flight.events):
+                    yield flight.events[index]
+                    index += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.changed.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # Không còn ai đọc -> hủy generation upstream
+                self._detach(key, flight)
+                flight.task.cancel()
+
+    async def _produce(self, key: str, flight: _Broadcast,
+                       factory: Callable[[], AsyncIterator[dict]]):
+        try:
+            async for event in factory():
+                flight.events.append(event)
+                flight.notify()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            self._detach(key, flight)
+            flight.notify()
+
+    def _detach(self, key: str, flight: _Broadcast):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def in_flight(self) -> int:
+        return len(self._flights)
@@ -0,0 +1,47 @@
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+class StartupReport:
+    """
+    Thời gian khởi động theo giai đoạn: import app, tạo app, các hook startup, warm-up client LLM
+    Module chỉ dùng thư viện chuẩn để được import đầu tiên (mốc bắt đầu đo)
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases: List[Tuple[str, float]] = []
+        self.modules_at_start = len(sys.modules)
+        self.modules_loaded = 0
+
+    def mark(self, name: str):
+        """Kết thúc giai đoạn `name`: thời gian tính từ mốc trước đó"""
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+        self.modules_loaded = len(sys.modules) - self.modules_at_start
+
+    @contextmanager
+    def phase(self, name: str):
+        """Giai đoạn có thể chạy xen kẽ (hook startup, warm-up trong thread), không ảnh hưởng mốc của mark()"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def info(self) -> dict:
+        phases: Dict[str, float] = {name: round(seconds, 4) for name, seconds in self.phases}
+        return {
+            "phases": phases,
+            "total": round(self._last - self.started, 4),
+            "modules_loaded": self.modules_loaded
+        }
+
+    def summary(self) -> str:
+        return ", ".join(f"{name} {seconds:.3f}s" for name, seconds in self.phases)
+
+# Tạo instance global: mốc bắt đầu là lúc app.main import module này
+startup_report = StartupReport()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark: chứng minh các request /api/review/ đồng thời chạy chồng lên nhau
+(không block event loop) khi gọi tới một fake upstream cục bộ.
+
+Chạy: python -m benchmarks.bench_async_client --requests 50 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load benchmark cho async LLM client")
+    parser.add_argument("--requests", type=int, default=50, help="Số request đồng thời")
+    parser.add_argument("--latency", type=float, default=0.5, help="Độ trễ upstream (giây)")
+    parser.add_argument("--port", type=int, default=18081, help="Port của fake upstream")
+    return parser.parse_args()
+
+async def run(args):
+    import httpx
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(i: int) -> float:
+            start = time.perf_counter()
+            response = await client.post("/api/review/", json={"question": f"review #{i}"})
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        # Warm-up: import lazy của openai, mở kết nối đầu tiên
+        await one(-1)
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(one(i) for i in range(args.requests)))
+        wall = time.perf_counter() - start
+
+    serial = args.requests * args.latency
+    print(f"Requests:        {args.requests}")
+    print(f"Upstream delay:  {args.latency:.3f}s")
+    print(f"Wall clock:      {wall:.3f}s")
+    print(f"Serial estimate: {serial:.3f}s")
+    print(f"Max latency:     {max(latencies):.3f}s")
+    print(f"Overlap factor:  {serial / wall:.1f}x")
+
+def main():
+    args = parse_args()
+
+    # Cấu hình phải được set trước khi import app
+    os.environ["OLLAMA_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ["OLLAMA_API_KEY"] = "fake"
+    os.environ.setdefault("LLM_MAX_CONNECTIONS", str(max(args.requests, 100)))
+
+    from benchmarks.fake_upstream import start_fake_upstream
+    server = start_fake_upstream(args.port, args.latency)
+    try:
+        asyncio.run(run(args))
+    finally:
+        server.should_exit = True
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark: thời gian chạy .github/scripts/code_review.py tuần tự và song song
+trên một git repo tạm, gọi tới stub server /api/review/ cục bộ.
+
+Chạy: python -m benchmarks.bench_code_review --files 20 --latency 0.3 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import uvicorn
+from fastapi import FastAPI
+
+SCRIPT = Path(__file__).resolve().parent.parent / ".github" / "scripts" / "code_review.py"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark cho CI code review script")
+    parser.add_argument("--files", type=int, default=20, help="Số file thay đổi trong commit")
+    parser.add_argument("--latency", type=float, default=0.3, help="Độ trễ của stub /api/review/ (giây)")
+    parser.add_argument("--concurrency", type=int, default=8, help="REVIEW_MAX_CONCURRENCY cho lần chạy song song")
+    parser.add_argument("--batch-size", type=int, default=10, help="REVIEW_BATCH_SIZE cho lần chạy batch (0 = bỏ qua)")
+    parser.add_argument("--port", type=int, default=18084, help="Port của stub server")
+    return parser.parse_args()
+
+def start_stub_server(port: int, latency: float) -> uvicorn.Server:
+    """Stub của /api/review/ trả về review cố định sau một độ trễ"""
+    app = FastAPI()
+
+    @app.post("/api/review/")
+    async def review(body: dict):
+        await asyncio.sleep(latency)
+        return {"success": True, "answer": f"Looks fine ({len(body['question'])} chars)"}
+
+    @app.post("/api/review/batch")
+    async def review_batch(body: dict):
+        # Server thật fan-out các item song song, stub chỉ chờ một lần
+        await asyncio.sleep(latency)
+        return {"success": True, "results": [
+            {"index": i, "path": item["path"], "success": True, "answer": "Looks fine"}
+            for i, item in enumerate(body["items"])
+        ]}
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+def create_repo(path: Path, files: int):
+    """Tạo git repo với 2 commit, commit cuối sửa `files` file Python"""
+    def git(*args):
+        subprocess.run(["git", *args], cwd=path, check=True, capture_output=True)
+
+    git("init", "-q")
+    git("config", "user.email", "bench@example.com")
+    git("config", "user.name", "bench")
+    for i in range(files):
+        (path / f"module_{i}.py").write_text(f"def f{i}():\n    return {i}\n")
+    git("add", ".")
+    git("commit", "-qm", "base")
+    for i in range(files):
+        (path / f"module_{i}.py").write_text(f"def f{i}():\n    return {i} * 2\n")
+    git("commit", "-qam", "change")
+
+def run_review(repo: Path, port: int, concurrency: int, batch_size: int = 0) -> float:
+    env = {
+        **os.environ,
+        "LLM_API_URL": f"http://127.0.0.1:{port}/api/review/",
+        "GITHUB_OUTPUT": str(repo / "github_output.txt"),
+        "REVIEW_MAX_CONCURRENCY": str(concurrency),
+        "REVIEW_BATCH_SIZE": str(batch_size),
+    }
+    start = time.perf_counter()
+    subprocess.run([sys.executable, str(SCRIPT)], cwd=repo, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+def main():
+    args = parse_args()
+    server = start_stub_server(args.port, args.latency)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            repo = Path(tmp)
+            create_repo(repo, args.files)
+            sequential = run_review(repo, args.port, 1)
+            concurrent = run_review(repo, args.port, args.concurrency)
+            batched = run_review(repo, args.port, args.concurrency, args.batch_size) if args.batch_size > 0 else None
+    finally:
+        server.should_exit = True
+
+    print(f"Files:                    {args.files}")
+    print(f"Stub latency:             {args.latency:.3f}s")
+    print(f"Sequential (1 worker):    {sequential:.3f}s")
+    print(f"Concurrent ({args.concurrency} workers):   {concurrent:.3f}s")
+    print(f"Speedup:                  {sequential / concurrent:.1f}x")
+    if batched is not None:
+        print(f"Batched ({args.batch_size} files/request): {batched:.3f}s")
+
+if __name__ == "__main__":
+    main()
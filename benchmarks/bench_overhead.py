@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark: overhead phía server trên mỗi request, đo qua mock upstream (app.mock_upstream)
+
+Với endpoint gọi LLM: overhead = latency phía client - thời gian phục vụ của mock upstream
+(request chạy tuần tự nên mỗi request khớp đúng một mẫu của mock).
+Endpoint health / cache hit không gọi upstream: overhead = toàn bộ latency.
+
+Dùng trong CI để bắt regression: --max-overhead-ms đặt ngưỡng p50, vượt thì exit 1.
+
+Chạy: python -m benchmarks.bench_overhead --requests 200 --max-overhead-ms 15
+"""
+
+import argparse
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Server-side overhead benchmark")
+    parser.add_argument("--requests", type=int, default=100, help="Số request mỗi endpoint")
+    parser.add_argument("--latency", default="fixed:0.02", help="Phân phối latency của mock upstream")
+    parser.add_argument("--tokens", type=int, default=20, help="Số token mock upstream sinh ra")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Tỷ lệ lỗi bơm vào mock upstream")
+    parser.add_argument("--seed", type=int, default=42, help="Seed của mock upstream")
+    parser.add_argument("--max-overhead-ms", type=float, default=0.0, help="> 0: ngưỡng p50 overhead (ms)")
+    parser.add_argument("--port", type=int, default=18181, help="Port của mock upstream")
+    parser.add_argument("--app-port", type=int, default=18182, help="Port của app server")
+    return parser.parse_args()
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """p50/p95 (nearest-rank) và max, đơn vị ms"""
+    ordered = sorted(samples)
+    rank = lambda p: ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+    return {"p50": rank(50) * 1000, "p95": rank(95) * 1000, "max": ordered[-1] * 1000}
+
+def main():
+    args = parse_args()
+
+    os.environ["OLLAMA_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ["OLLAMA_API_KEY"] = "mock"
+    os.environ["RATE_LIMIT_ENABLED"] = "false"  # Đo server, không đo rate limit
+    os.environ["HEALTH_PROBE_INTERVAL"] = "1"
+
+    import requests
+    import uvicorn
+    from app.mock_upstream import start_mock_upstream
+
+    upstream = start_mock_upstream(args.port, latency=args.latency, tokens=args.tokens,
+                                   tokens_per_second=0, error_rate=args.error_rate,
+                                   errors="500,429", seed=args.seed)
+    service_times = upstream.config.app.state.service_times
+
+    app_server = uvicorn.Server(uvicorn.Config("app.main:app", host="127.0.0.1",
+                                               port=args.app_port, log_level="warning"))
+    threading.Thread(target=app_server.run, daemon=True).start()
+    while not app_server.started:
+        time.sleep(0.01)
+
+    base = f"http://127.0.0.1:{args.app_port}"
+    # (tên, method, path, body, headers, có gọi upstream không)
+    scenarios = [
+        ("POST /api/review/ (miss)", "POST", "/api/review/?compact=true", {"question": "review"},
+         {"X-Cache-Bypass": "1"}, True),
+        ("POST /api/review/ (hit)", "POST", "/api/review/?compact=true", {"question": "review"}, {}, False),
+        ("GET /api/test/ (miss)", "GET", "/api/test/?question=hello", None, {"X-Cache-Bypass": "1"}, True),
+        ("GET /health", "GET", "/health", None, {}, False),
+        ("GET /api/health", "GET", "/api/health", None, {}, False),
+    ]
+
+    results = {}
+    failed = False
+    try:
+        with requests.Session() as session:
+            # Warm-up: import lazy, kết nối đầu tiên, cache entry cho kịch bản hit
+            for _, method, path, body, headers, _ in scenarios:
+                session.request(method, base + path, json=body, headers=headers)
+
+            for name, method, path, body, headers, calls_upstream in scenarios:
+                overheads: List[float] = []
+                statuses: Counter = Counter()
+                for _ in range(args.requests):
+                    before = len(service_times)
+                    start = time.perf_counter()
+                    response = session.request(method, base + path, json=body, headers=headers)
+                    elapsed = time.perf_counter() - start
+                    statuses[response.status_code] += 1
+                    if response.status_code != 200:
+                        continue
+                    if calls_upstream:
+                        if len(service_times) == before:
+                            continue
+                        elapsed -= service_times[-1]
+                    overheads.append(elapsed)
+                results[name] = (summarize(overheads) if overheads else None, statuses)
+    finally:
+        app_server.should_exit = True
+        upstream.should_exit = True
+
+    print(f"{'Endpoint':<28} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}  statuses")
+    for name, (summary, statuses) in results.items():
+        if summary is None:
+            print(f"{name:<28} {'-':>8} {'-':>8} {'-':>8}  {dict(statuses)}")
+            failed = True
+            continue
+        print(f"{name:<28} {summary['p50']:>8.2f} {summary['p95']:>8.2f} {summary['max']:>8.2f}  {dict(statuses)}")
+        if args.max_overhead_ms and summary["p50"] > args.max_overhead_ms:
+            print(f"❌ {name}: p50 overhead {summary['p50']:.2f}ms > {args.max_overhead_ms}ms")
+            failed = True
+
+    print(f"Mock upstream: {upstream.config.app.state.stats}")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark: thời gian khởi động server
+
+- Import app.main trong process mới (median của nhiều lần), các module import chậm nhất (-X importtime)
+- Time-to-ready (tới khi /health trả 200) của run.py và serve.py với N worker
+- SIGTERM giữa một stream đang chạy: stream phải chạy hết (graceful drain)
+
+Chạy: python -m benchmarks.bench_startup --workers 4
+"""
+
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Startup-time benchmark")
+    parser.add_argument("--workers", type=int, default=4, help="Số worker của serve.py")
+    parser.add_argument("--runs", type=int, default=5, help="Số lần đo import")
+    parser.add_argument("--top-imports", type=int, default=10, help="Số module import chậm nhất cần in (0 = bỏ qua)")
+    parser.add_argument("--port", type=int, default=18141, help="Port của fake upstream")
+    parser.add_argument("--app-port", type=int, default=18142, help="Port của app server")
+    return parser.parse_args()
+
+def measure_import(env: dict, runs: int) -> float:
+    code = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+def slowest_imports(env: dict, count: int) -> list:
+    """(thời gian tích lũy, module) của các module app.main import trực tiếp, theo python -X importtime"""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stderr
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line[13:]:
+            continue
+        _, cumulative, name = line[13:].split("|")
+        # Tên module thụt lề 2 dấu cách mỗi cấp, app.main ở cấp 0
+        if (len(name) - len(name.lstrip())) // 2 == 1:
+            totals[name.strip()] = int(cumulative) / 1e6
+    return sorted(((seconds, name) for name, seconds in totals.items()), reverse=True)[:count]
+
+def wait_ready(url: str, timeout: float = 60) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return time.perf_counter() - start
+        except requests.RequestException:
+            pass
+        time.sleep(0.02)
+    raise RuntimeError(f"Server not ready after {timeout}s")
+
+def launch(script: str, env: dict) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, script], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def measure_ready(script: str, env: dict, port: int) -> float:
+    process = launch(script, env)
+    try:
+        return wait_ready(f"http://127.0.0.1:{port}/health")
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+
+def check_drain(env: dict, port: int) -> dict:
+    """Gửi SIGTERM khi một stream đang chạy, đo xem stream có nhận đủ event done không"""
+    process = launch("serve.py", env)
+    result = {"completed": False, "tokens": 0}
+    try:
+        wait_ready(f"http://127.0.0.1:{port}/health")
+
+        def consume():
+            with requests.post(f"http://127.0.0.1:{port}/api/review/stream",
+                               json={"question": "drain check"}, stream=True, timeout=60) as response:
+                for line in response.iter_lines():
+                    if line.startswith(b"event: token"):
+                        result["tokens"] += 1
+                    elif line.startswith(b"event: done"):
+                        result["completed"] = True
+
+        consumer = threading.Thread(target=consume)
+        consumer.start()
+        while result["tokens"] == 0 and consumer.is_alive():
+            time.sleep(0.01)
+
+        start = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        consumer.join(timeout=60)
+        process.wait(timeout=60)
+        result["shutdown_seconds"] = time.perf_counter() - start
+    finally:
+        if process.poll() is None:
+            process.kill()
+    return result
+
+def main():
+    args = parse_args()
+
+    from benchmarks.fake_upstream import start_fake_upstream
+    upstream = start_fake_upstream(args.port, latency=0.1, tokens=40, token_delay=0.05)
+
+    env = {
+        **os.environ,
+        "OLLAMA_BASE_URL": f"http://127.0.0.1:{args.port}/v1",
+        "OLLAMA_API_KEY": "fake",
+        "HOST": "127.0.0.1",
+        "PORT": str(args.app_port),
+        "DEBUG": "false",
+        "WORKERS": str(args.workers),
+        "PYTHONPATH": str(ROOT),
+    }
+
+    try:
+        import_time = measure_import(env, args.runs)
+        top_imports = slowest_imports(env, args.top_imports) if args.top_imports > 0 else []
+        run_ready = measure_ready("run.py", env, args.app_port)
+        serve_ready = measure_ready("serve.py", env, args.app_port)
+        drain = check_drain(env, args.app_port)
+    finally:
+        upstream.should_exit = True
+
+    print(f"{'Import app.main (median of ' + str(args.runs) + '):':<34} {import_time * 1000:.0f}ms")
+    for seconds, name in top_imports:
+        print(f"  {name:<32} {seconds * 1000:.0f}ms")
+    print(f"{'run.py ready:':<34} {run_ready:.2f}s")
+    print(f"{'serve.py ready (' + str(args.workers) + ' workers):':<34} {serve_ready:.2f}s")
+    print(f"SIGTERM during stream: completed={drain['completed']} "
+          f"tokens={drain['tokens']} shutdown={drain.get('shutdown_seconds', 0):.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark: so sánh time-to-first-byte của /api/review/ và /api/review/stream,
+và kiểm tra client ngắt kết nối thì upstream cũng bị hủy.
+
+Chạy: python -m benchmarks.bench_stream --latency 0.3 --tokens 40 --token-delay 0.05
+"""
+
+import argparse
+import os
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="TTFB benchmark cho streaming review")
+    parser.add_argument("--latency", type=float, default=0.3, help="Độ trễ tới token đầu tiên (giây)")
+    parser.add_argument("--tokens", type=int, default=40, help="Số token upstream sinh ra")
+    parser.add_argument("--token-delay", type=float, default=0.05, help="Khoảng cách giữa các token (giây)")
+    parser.add_argument("--port", type=int, default=18082, help="Port của fake upstream")
+    parser.add_argument("--app-port", type=int, default=18083, help="Port của app server")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    os.environ["OLLAMA_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ["OLLAMA_API_KEY"] = "fake"
+    os.environ["RATE_LIMIT_ENABLED"] = "false"  # Đo server, không đo rate limit
+
+    import threading
+    import requests
+    import uvicorn
+    from benchmarks.fake_upstream import start_fake_upstream
+
+    upstream = start_fake_upstream(args.port, args.latency, args.tokens, args.token_delay)
+    app_server = uvicorn.Server(uvicorn.Config("app.main:app", host="127.0.0.1",
+                                               port=args.app_port, log_level="warning"))
+    threading.Thread(target=app_server.run, daemon=True).start()
+    while not app_server.started:
+        time.sleep(0.01)
+
+    base = f"http://127.0.0.1:{args.app_port}/api"
+    payload = {"question": "review this"}
+    try:
+        with requests.Session() as session:
+            # Warm-up: import lazy của openai, mở kết nối đầu tiên
+            session.get(f"{base}/prompts/").raise_for_status()
+            session.post(f"{base}/review/", json=payload).raise_for_status()
+
+            start = time.perf_counter()
+            session.post(f"{base}/review/", json=payload).raise_for_status()
+            blocking_total = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with session.post(f"{base}/review/stream", json=payload, stream=True) as response:
+                response.raise_for_status()
+                lines = response.iter_lines()
+                next(line for line in lines if line)
+                stream_ttfb = time.perf_counter() - start
+                for _ in lines:
+                    pass
+            stream_total = time.perf_counter() - start
+
+            # Ngắt kết nối sau token đầu tiên -> upstream phải bị hủy
+            stats = upstream.config.app.state.stats
+            cancelled_before = stats["cancelled_streams"]
+            with session.post(f"{base}/review/stream", json=payload, stream=True) as response:
+                next(line for line in response.iter_lines() if line)
+            time.sleep(args.latency + 5 * args.token_delay)
+            cancelled = stats["cancelled_streams"] - cancelled_before
+
+        print(f"Blocking /review/ total:      {blocking_total:.3f}s")
+        print(f"Streaming TTFB:               {stream_ttfb:.3f}s")
+        print(f"Streaming total:              {stream_total:.3f}s")
+        print(f"Upstream cancelled on abort:  {'yes' if cancelled else 'no'}")
+    finally:
+        app_server.should_exit = True
+        upstream.should_exit = True
+
+if __name__ == "__main__":
+    main()
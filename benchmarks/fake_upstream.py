@@ -0,0 +1,30 @@
+"""
+Fake OpenAI-compatible upstream cho benchmark (không cần Ollama thật)
+Giữ API cũ (latency cố định, token_delay); triển khai nằm ở app.mock_upstream.
+"""
+
+import uvicorn
+from fastapi import FastAPI
+
+from app.mock_upstream import create_mock_upstream, start_mock_upstream
+
+def create_fake_upstream(latency: float = 0.5, tokens: int = 20,
+                         token_delay: float = 0.05) -> FastAPI:
+    """
+    Tạo app giả lập /v1/chat/completions
+    - latency: độ trễ trước token đầu tiên (hoặc trước cả response khi không stream)
+    - tokens, token_delay: số token và khoảng cách giữa các token khi stream
+    """
+    return create_mock_upstream(
+        latency=f"fixed:{latency}",
+        tokens=tokens,
+        tokens_per_second=1.0 / token_delay if token_delay > 0 else 0.0
+    )
+
+def start_fake_upstream(port: int, latency: float = 0.5, tokens: int = 20,
+                        token_delay: float = 0.05, factory=create_fake_upstream) -> uvicorn.Server:
+    """
+    Chạy fake upstream trong thread riêng, trả về server để dừng sau
+    factory: hàm tạo ASGI app nhận (latency, tokens, token_delay), mặc định create_fake_upstream
+    """
+    return start_mock_upstream(port, app=factory(latency, tokens, token_delay))
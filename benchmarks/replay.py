@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Replay request log (REQUEST_LOG_PATH) vào server ở một RPS mục tiêu
+và báo cáo p50/p95/p99 latency và throughput.
+
+- Không có --target: tự chạy app + fake upstream cục bộ (chọn bằng --upstream-factory)
+- Open loop (mặc định): gửi request đều đặn ở --rps, không chờ response
+- Closed loop (--users N): N user ảo, mỗi user chờ response rồi nghỉ --think-time giây
+
+Chạy: python -m benchmarks.replay --log "logs/requests-*.jsonl*" --rps 20 --duration 30
+"""
+
+import argparse
+import asyncio
+import glob
+import gzip
+import importlib
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter
+from typing import List, Optional
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay request log làm load benchmark")
+    parser.add_argument("--log", required=True, help="File log (glob, hỗ trợ .gz)")
+    parser.add_argument("--target", default=None, help="URL server, vd. http://127.0.0.1:8000")
+    parser.add_argument("--rps", type=float, default=10, help="Số request mỗi giây (open loop)")
+    parser.add_argument("--duration", type=float, default=30, help="Thời gian chạy (giây)")
+    parser.add_argument("--users", type=int, default=0, help="> 0: closed loop với N user ảo")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Thời gian nghỉ giữa các request của một user")
+    parser.add_argument("--bypass-cache", action="store_true", help="Gửi X-Cache-Bypass để mọi request tới upstream")
+    parser.add_argument("--timeout", type=float, default=120, help="Timeout mỗi request (giây)")
+    # Fake upstream (chỉ dùng khi không có --target)
+    parser.add_argument("--upstream-factory", default="benchmarks.fake_upstream:create_fake_upstream",
+                        help="module:hàm tạo ASGI app của upstream giả (latency, tokens, token_delay)")
+    parser.add_argument("--latency", type=float, default=0.3, help="Độ trễ của upstream giả (giây)")
+    parser.add_argument("--tokens", type=int, default=40, help="Số token upstream giả sinh ra")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Khoảng cách giữa các token (giây)")
+    parser.add_argument("--port", type=int, default=18171, help="Port của upstream giả")
+    parser.add_argument("--app-port", type=int, default=18172, help="Port của app server cục bộ")
+    return parser.parse_args()
+
+def load_entries(pattern: str) -> List[dict]:
+    """Đọc các entry có thể replay (request /api, bỏ các lần poll job theo id)"""
+    entries = []
+    for path in sorted(glob.glob(pattern)):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if not entry["path"].startswith("/api/") or "/review/jobs/" in entry["path"]:
+                    continue
+                entries.append(entry)
+    return entries
+
+def percentile(values: List[float], p: float) -> float:
+    """Percentile theo nearest-rank"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(p / 100 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+def start_local_server(args) -> tuple:
+    """Chạy upstream giả + app server trong thread, trả về (base_url, servers)"""
+    os.environ["OLLAMA_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ["OLLAMA_API_KEY"] = "fake"
+    os.environ["RATE_LIMIT_ENABLED"] = "false"  # Đo server, không đo rate limit
+    os.environ.pop("REQUEST_LOG_PATH", None)  # Không ghi log của chính lần replay
+
+    import uvicorn
+    from benchmarks.fake_upstream import start_fake_upstream
+
+    module_name, factory_name = args.upstream_factory.split(":")
+    factory = getattr(importlib.import_module(module_name), factory_name)
+    upstream = start_fake_upstream(args.port, args.latency, args.tokens, args.token_delay, factory=factory)
+
+    app_server = uvicorn.Server(uvicorn.Config("app.main:app", host="127.0.0.1",
+                                               port=args.app_port, log_level="warning"))
+    threading.Thread(target=app_server.run, daemon=True).start()
+    while not app_server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{args.app_port}", [upstream, app_server]
+
+async def replay(args, base_url: str, entries: List[dict]) -> dict:
+    import httpx
+
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    headers = {"Content-Type": "application/json"}
+    if args.bypass_cache:
+        headers["X-Cache-Bypass"] = "1"
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        async def send(entry: dict):
+            url = entry["path"] + (f"?{entry['query']}" if entry.get("query") else "")
+            start = time.perf_counter()
+            try:
+                response = await client.request(entry["method"], url, content=entry.get("body") or None,
+                                                headers=headers)
+                await response.aread()
+                statuses[response.status_code] += 1
+                if response.status_code < 400:
+                    latencies.append(time.perf_counter() - start)
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+
+        start = time.perf_counter()
+        deadline = start + args.duration
+
+        if args.users > 0:
+            async def user(offset: int):
+                i = offset
+                while time.perf_counter() < deadline:
+                    await send(entries[i % len(entries)])
+                    i += args.users
+                    if args.think_time:
+                        await asyncio.sleep(args.think_time)
+
+            await asyncio.gather(*(user(u) for u in range(args.users)))
+        else:
+            tasks = []
+            total = int(args.rps * args.duration)
+            for i in range(total):
+                # Lịch gửi cố định: request chậm không làm giảm tải (tránh coordinated omission)
+                delay = start + i / args.rps - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(send(entries[i % len(entries)])))
+            await asyncio.gather(*tasks)
+
+        wall = time.perf_counter() - start
+
+    return {"latencies": latencies, "statuses": statuses, "wall": wall}
+
+def main():
+    args = parse_args()
+    entries = load_entries(args.log)
+    if not entries:
+        raise SystemExit(f"No replayable entries in {args.log}")
+
+    servers: Optional[list] = None
+    base_url = args.target
+    if base_url is None:
+        base_url, servers = start_local_server(args)
+
+    try:
+        result = asyncio.run(replay(args, base_url, entries))
+    finally:
+        for server in servers or []:
+            server.should_exit = True
+
+    latencies = result["latencies"]
+    completed = sum(result["statuses"].values())
+    mode = f"closed loop, {args.users} users, think {args.think_time}s" if args.users else f"open loop, {args.rps} rps"
+    print(f"Log entries:   {len(entries)}")
+    print(f"Mode:          {mode}")
+    print(f"Requests:      {completed} in {result['wall']:.2f}s")
+    print(f"Throughput:    {len(latencies) / result['wall']:.2f} req/s (successful)")
+    print(f"Statuses:      {dict(result['statuses'])}")
+    print(f"Latency p50:   {percentile(latencies, 50) * 1000:.1f}ms")
+    print(f"Latency p95:   {percentile(latencies, 95) * 1000:.1f}ms")
+    print(f"Latency p99:   {percentile(latencies, 99) * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Production launcher: gunicorn master + N uvicorn worker
+
+- App và settings được import một lần ở master trước khi fork (preload)
+- Worker dùng uvloop + httptools nếu có
+- SIGTERM: ngừng nhận kết nối mới, chờ request/stream đang chạy xong (GRACEFUL_TIMEOUT)
+- Worker được thay mới sau WORKER_MAX_REQUESTS request để giới hạn memory
+Dev vẫn dùng run.py (một process, auto-reload).
+
+Mặc định một worker: admission limit (AIMD), single-flight, LRU response cache, hedging
+và health probe của backend là state riêng của từng process. Với WORKERS=N, upstream
+nhận tới N x ADMISSION_MAX_LIMIT request đồng thời, request trùng ở hai worker đều gọi
+upstream và mỗi worker probe backend riêng. Khi tăng WORKERS hãy chia ADMISSION_*_LIMIT
+cho N và dùng LLM_CACHE_DB_PATH / JOB_DB_PATH / RATE_LIMIT_DB_PATH cho state cần dùng chung.
+"""
+import multiprocessing
+
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker
+
+from app.config import settings
+
+def _available(module: str) -> bool:
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+class TunedUvicornWorker(UvicornWorker):
+    """Uvicorn worker với event loop và HTTP parser nhanh (fallback asyncio/h11)"""
+    CONFIG_KWARGS = {
+        "loop": "uvloop" if _available("uvloop") else "asyncio",
+        "http": "httptools" if _available("httptools") else "h11",
+        "lifespan": "on"
+    }
+
+def post_fork(server, worker):
+    """Tài nguyên không dùng chung được giữa các process phải mở lại trong worker"""
+    from app.cache import response_cache
+    from app.jobs import job_queue
+    from app.rate_limit import rate_limiter
+    if response_cache is not None:
+        response_cache.after_fork()
+    job_queue.after_fork()
+    if rate_limiter is not None:
+        rate_limiter.after_fork()
+
+class ProductionServer(BaseApplication):
+    def __init__(self, app, options: dict):
+        self.application = app
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+def main():
+    # Preload: import app ở master, worker fork ra dùng chung code + settings đã nạp
+    from app.main import app
+
+    workers = settings.WORKERS or multiprocessing.cpu_count()
+    if workers > 1:
+        print(f"⚠️  {workers} workers: admission limit, single-flight and in-memory cache are per worker "
+              f"(upstream may see up to {workers * settings.ADMISSION_MAX_LIMIT} concurrent requests)")
+    options = {
+        "bind": f"{settings.HOST}:{settings.PORT}",
+        "workers": workers,
+        "worker_class": TunedUvicornWorker,
+        "preload_app": True,
+        "graceful_timeout": settings.GRACEFUL_TIMEOUT,
+        "max_requests": settings.WORKER_MAX_REQUESTS,
+        "max_requests_jitter": settings.WORKER_MAX_REQUESTS_JITTER,
+        "post_fork": post_fork,
+        "accesslog": "-",
+    }
+    print(f"🚀 Starting {workers} workers on {options['bind']} "
+          f"(loop={TunedUvicornWorker.CONFIG_KWARGS['loop']}, http={TunedUvicornWorker.CONFIG_KWARGS['http']})")
+    ProductionServer(app, options).run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Fixture chung: mock upstream (app.mock_upstream) và TestClient của app
+
+Biến môi trường được đặt trước khi import app (settings đọc lúc import),
+nên app luôn gọi mock upstream thay vì Ollama thật.
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+from statistics import median
+from typing import Callable
+
+import pytest
+
+MOCK_PORT = int(os.getenv("TEST_MOCK_UPSTREAM_PORT", "18281"))
+MOCK_LATENCY = 0.02
+# Ngưỡng p50 overhead phía server (ms), gồm cả overhead của TestClient
+MAX_OVERHEAD_MS = float(os.getenv("TEST_MAX_OVERHEAD_MS", "50"))
+
+os.environ.update({
+    "OLLAMA_BASE_URL": f"http://127.0.0.1:{MOCK_PORT}/v1",
+    "OLLAMA_API_KEY": "mock",
+    "LLM_BACKENDS": "",
+    "RATE_LIMIT_ENABLED": "false",
+    "HEALTH_PROBE_INTERVAL": "0.5",
+})
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+# Script review của CI (.github/scripts) import lẫn nhau theo tên module
+sys.path.insert(0, str(ROOT / ".github" / "scripts"))
+
+# Tên test -> p50 overhead (ms), in ở cuối phiên test
+OVERHEAD_RESULTS = {}
+
+def pytest_terminal_summary(terminalreporter):
+    if not OVERHEAD_RESULTS:
+        return
+    terminalreporter.section("server overhead (p50 ms)")
+    for name, overhead in OVERHEAD_RESULTS.items():
+        terminalreporter.write_line(f"{name:<32} {overhead:>8.2f}")
+
+@pytest.fixture(scope="session")
+def mock_upstream():
+    """Mock upstream chạy trong thread; trả về FastAPI app (state.stats, state.service_times)"""
+    from app.mock_upstream import start_mock_upstream
+    server = start_mock_upstream(MOCK_PORT, latency=f"fixed:{MOCK_LATENCY}", tokens=20,
+                                 tokens_per_second=0, seed=42, answer="LGTM")
+    yield server.config.app
+    server.should_exit = True
+
+@pytest.fixture(scope="session")
+def client(mock_upstream):
+    """TestClient của app (chạy startup/shutdown hook), chờ warm-up và probe upstream đầu tiên"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+    with TestClient(app) as client:
+        deadline = time.monotonic() + 10
+        while not client.get("/health").json()["upstream_ok"] and time.monotonic() < deadline:
+            time.sleep(0.05)
+        yield client
+
+@pytest.fixture
+def measure_overhead(request, mock_upstream) -> Callable:
+    """
+    Gọi request n lần, trả về (response cuối, p50 overhead ms)
+    Overhead = latency phía client trừ thời gian phục vụ của mock upstream (nếu có gọi upstream)
+    """
+    service_times = mock_upstream.state.service_times
+
+    def measure(send: Callable, n: int = 20):
+        overheads = []
+        response = None
+        for _ in range(n):
+            before = len(service_times)
+            start = time.perf_counter()
+            response = send()
+            elapsed = time.perf_counter() - start
+            assert response.status_code == 200, response.text
+            if len(service_times) > before:
+                elapsed -= service_times[-1]
+            overheads.append(elapsed * 1000)
+        OVERHEAD_RESULTS[request.node.name] = median(overheads)
+        return response, OVERHEAD_RESULTS[request.node.name]
+
+    return measure
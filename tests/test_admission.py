@@ -0,0 +1,95 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from app.admission import AdmissionController, Overloaded
+from app.backends import NoBackendAvailable
+
+def controller(**overrides) -> AdmissionController:
+    options = dict(initial_limit=8, min_limit=1, max_limit=16, max_queue=4,
+                   queue_timeout=1.0, tolerance=2.0, backoff=0.5)
+    options.update(overrides)
+    return AdmissionController(**options)
+
+ERROR_CLASSES = {
+    400: openai.BadRequestError, 401: openai.AuthenticationError, 413: openai.APIStatusError,
+    429: openai.RateLimitError, 500: openai.InternalServerError
+}
+
+def status_error(status: int) -> openai.APIStatusError:
+    """Lỗi như client openai trả về cho status này"""
+    request = httpx.Request("POST", "http://upstream/v1/chat/completions")
+    response = httpx.Response(status, request=request)
+    return ERROR_CLASSES[status](f"status {status}", response=response, body=None)
+
+async def fail_in_slot(admission: AdmissionController, error: BaseException):
+    with pytest.raises(type(error)):
+        async with admission.slot():
+            raise error
+
+@pytest.mark.parametrize("error", [
+    status_error(500), status_error(429), NoBackendAvailable("all backends failed"),
+    openai.APITimeoutError(httpx.Request("POST", "http://upstream")),
+])
+def test_overload_errors_shrink_limit(error):
+    admission = controller()
+    asyncio.run(fail_in_slot(admission, error))
+    assert admission.limit == 4
+    assert admission.in_flight == 0
+
+@pytest.mark.parametrize("error", [
+    status_error(400), status_error(401), status_error(413), asyncio.TimeoutError(), ValueError("bad")
+])
+def test_client_errors_keep_limit(error):
+    admission = controller()
+    asyncio.run(fail_in_slot(admission, error))
+    assert admission.limit == 8
+    assert admission.in_flight == 0
+    # Không có mẫu latency: baseline không bị ảnh hưởng
+    assert admission.info()["baseline_latency"] == {}
+
+def test_limit_grows_while_latency_stays_at_baseline():
+    admission = controller(initial_limit=4, max_limit=6)
+    admission.in_flight = 4
+    for _ in range(40):
+        admission.in_flight += 1
+        admission.release(0.1, ok=True)
+    assert admission.limit == 6
+    assert admission.capacity == 6
+
+def test_limit_stays_when_it_is_not_used():
+    admission = controller(initial_limit=8)
+    for _ in range(40):
+        admission.in_flight += 1
+        admission.release(0.1, ok=True)
+    assert admission.limit == 8
+
+def test_limit_shrinks_once_per_hold_period_on_slow_latency():
+    admission = controller(initial_limit=8, backoff=0.5)
+    admission.in_flight = 3
+    admission.release(0.1, ok=True, held=1.0)
+    admission.release(1.0, ok=True)
+    assert admission.limit == 4
+    # Chu kỳ latency chưa qua: mẫu chậm tiếp theo không giảm thêm
+    admission.release(1.0, ok=True)
+    assert admission.limit == 4
+    assert admission.info()["baseline_latency"]["complete"] < 0.2
+
+def test_full_queue_is_rejected_with_retry_after():
+    async def scenario():
+        admission = controller(initial_limit=1, max_queue=1, queue_timeout=5.0)
+        await admission.acquire()
+        waiter = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as rejected:
+            await admission.acquire()
+        admission.release(0.1, ok=True)
+        await waiter
+        return admission, rejected.value
+
+    admission, rejected = asyncio.run(scenario())
+    assert rejected.status_code == 503
+    assert int(rejected.headers["Retry-After"]) >= 1
+    assert admission.in_flight == 1
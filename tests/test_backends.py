@@ -0,0 +1,113 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from app.backends import BackendPool, NoBackendAvailable
+
+def pool(*names: str, failure_threshold: int = 2, cooldown: float = 30.0) -> BackendPool:
+    configs = [dict(name=name, base_url=f"http://{name}/v1", api_key="x", model=f"{name}-model", weight=1.0)
+               for name in names]
+    return BackendPool(configs, httpx.AsyncClient(), policy="least_outstanding",
+                       failure_threshold=failure_threshold, cooldown=cooldown)
+
+def server_error() -> openai.InternalServerError:
+    request = httpx.Request("POST", "http://upstream/v1/chat/completions")
+    return openai.InternalServerError("status 500", response=httpx.Response(500, request=request), body=None)
+
+def failing(*broken: str, error=None):
+    """request(backend) lỗi trên các backend `broken`, thành công trên backend còn lại"""
+    calls = []
+
+    async def request(backend):
+        calls.append(backend.name)
+        if backend.name in broken:
+            raise error or server_error()
+        return backend.name
+
+    return request, calls
+
+def connect(backends: BackendPool, request):
+    async def scenario():
+        response, backend = await backends.connect("complete", request)
+        backends.finish(backend, "complete", 0.1)
+        return response
+    return asyncio.run(scenario())
+
+def by_name(backends: BackendPool, name: str):
+    return next(b for b in backends.backends if b.name == name)
+
+def test_retryable_error_fails_over_to_another_backend():
+    backends = pool("a", "b")
+    by_name(backends, "b").outstanding = 1  # "a" được chọn trước
+    request, calls = failing("a")
+    assert connect(backends, request) == "b"
+    assert calls == ["a", "b"]
+    assert by_name(backends, "a").failures == 1
+    assert by_name(backends, "a").outstanding == 0
+
+def test_client_error_is_not_failed_over():
+    backends = pool("a", "b")
+    by_name(backends, "b").outstanding = 1
+    request, calls = failing("a", error=ValueError("bad request"))
+    with pytest.raises(ValueError):
+        connect(backends, request)
+    assert calls == ["a"]
+    assert by_name(backends, "a").failures == 0
+
+def test_all_backends_failing_raises_last_error():
+    backends = pool("a", "b")
+    request, calls = failing("a", "b")
+    with pytest.raises(openai.InternalServerError):
+        connect(backends, request)
+    assert sorted(calls) == ["a", "b"]
+
+def test_circuit_opens_after_threshold_and_is_skipped():
+    backends = pool("a", "b", failure_threshold=2)
+    a = by_name(backends, "a")
+    for _ in range(2):
+        a.outstanding += 1
+        backends.finish(a, "complete", None, ok=False)
+    assert a.state == "open"
+
+    request, calls = failing()
+    for _ in range(3):
+        connect(backends, request)
+    assert calls == ["b"] * 3
+
+def test_half_open_allows_one_probe_and_closes_on_success():
+    backends = pool("a", "b", failure_threshold=1, cooldown=0.0)
+    a = by_name(backends, "a")
+    a.outstanding += 1
+    backends.finish(a, "complete", None, ok=False)
+    assert a.state == "open"
+
+    # Hết cooldown: một request thăm dò, các request khác không được chọn "a" khi probe đang chạy
+    assert backends.pick("complete", {"b"}) is a
+    assert a.state == "half_open"
+    a.outstanding += 1
+    assert backends.pick("complete", set()).name == "b"
+    backends.finish(a, "complete", 0.1)
+    assert a.state == "closed"
+    assert a.consecutive_failures == 0
+
+def test_failed_probe_reopens_circuit():
+    backends = pool("a", failure_threshold=3, cooldown=0.0)
+    a = by_name(backends, "a")
+    a.state, a.opened_at = "open", 0.0
+    request, _ = failing("a")
+    with pytest.raises(openai.InternalServerError):
+        connect(backends, request)
+    assert a.state == "open"
+
+def test_excluded_backends_raise_no_backend_available():
+    backends = pool("a")
+    request, calls = failing()
+
+    async def scenario():
+        return await backends.connect("complete", request, exclude={"a"})
+
+    with pytest.raises(NoBackendAvailable):
+        asyncio.run(scenario())
+    assert calls == []
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+import app.llm_client as llm_module
+from app.cascade import ESCALATE_MARKER, ModelCascade
+
+def cascade(**overrides) -> ModelCascade:
+    options = dict(fast_model="small", fast_max_tokens=256, full_max_tokens=4000, max_diff_lines=5,
+                   max_prompt_tokens=200, full_extensions=[".rs"], escalate=True)
+    options.update(overrides)
+    return ModelCascade(**options)
+
+def review(path: str, changed: int) -> str:
+    diff = "\n".join(f"+x{i} = {i}" for i in range(changed))
+    return f"FILE: {path}\n```diff\n--- a/{path}\n+++ b/{path}\n{diff}\n```"
+
+@pytest.mark.parametrize("question, tier", [
+    (review("app.py", 3), "fast"),
+    (review("app.py", 6), "full"),
+    (review("lib.rs", 1), "full"),
+    ("word " * 300, "full"),
+])
+def test_route(question, tier):
+    route = cascade().route(question)
+    assert route.tier == tier
+    assert route.model == ("small" if tier == "fast" else None)
+    assert route.max_tokens == (256 if tier == "fast" else 4000)
+
+@pytest.mark.parametrize("answer, finish_reason, reason", [
+    ("Looks good", "stop", None),
+    ("", "stop", "empty"),
+    (f"{ESCALATE_MARKER}\n", "stop", "low_confidence"),
+    ("The first issue is", "length", "truncated"),
+])
+def test_escalation_reason(answer, finish_reason, reason):
+    assert cascade().escalation_reason(answer, finish_reason) == reason
+    assert cascade(escalate=False).escalation_reason(answer, finish_reason) is None
+
+def test_fast_messages_ask_for_escalation_marker():
+    messages = [{"role": "system", "content": "Review"}, {"role": "user", "content": "x"}]
+    fast = cascade().fast_messages(messages)
+    assert ESCALATE_MARKER in fast[0]["content"] and fast[1:] == messages[1:]
+    assert cascade(escalate=False).fast_messages(messages) is messages
+
+class FakeUpstream:
+    """_call_upstream giả: trả lời theo model được yêu cầu (None = model chính)"""
+
+    def __init__(self, fast_answer: str, fast_finish: str = "stop"):
+        self.fast_answer = fast_answer
+        self.fast_finish = fast_finish
+        self.models = []
+
+    async def __call__(self, messages, model=None, max_tokens=None):
+        self.models.append(model)
+        if model is None:
+            return {"answer": "full review", "model": "main", "tokens_used": 100}, 0.5, "stop"
+        return {"answer": self.fast_answer, "model": model, "tokens_used": 10}, 0.1, self.fast_finish
+
+def complete(monkeypatch, upstream: FakeUpstream, question: str) -> tuple:
+    routing = cascade()
+    monkeypatch.setattr(llm_module, "cascade", routing)
+    monkeypatch.setattr(llm_module.llm_client, "_call_upstream", upstream)
+    messages = [{"role": "user", "content": question}]
+    route = routing.route(question)
+    result = asyncio.run(llm_module.llm_client._complete(messages, f"test-cascade-{id(upstream)}", None, route))
+    return result, routing
+
+def test_confident_fast_answer_is_kept(monkeypatch):
+    upstream = FakeUpstream("Looks good")
+    result, routing = complete(monkeypatch, upstream, review("app.py", 2))
+    assert upstream.models == ["small"]
+    assert result["answer"] == "Looks good"
+    assert routing.stats["escalated"] == 0
+
+@pytest.mark.parametrize("answer, finish_reason, reason", [
+    (ESCALATE_MARKER, "stop", "low_confidence"),
+    ("The first issue", "length", "truncated"),
+])
+def test_fast_answer_is_escalated(monkeypatch, answer, finish_reason, reason):
+    upstream = FakeUpstream(answer, finish_reason)
+    result, routing = complete(monkeypatch, upstream, review("app.py", 2))
+    assert upstream.models == ["small", None]
+    assert result["answer"] == "full review"
+    # Token của lần thử với model nhanh vẫn được tính
+    assert result["tokens_used"] == 110
+    assert routing.stats["escalation_reasons"] == {reason: 1}
+    assert routing.info()["tiers"]["fast"]["requests"] == 1
+    assert routing.info()["tiers"]["full"]["requests"] == 1
+
+def test_complex_request_goes_straight_to_main_model(monkeypatch):
+    upstream = FakeUpstream("Looks good")
+    result, routing = complete(monkeypatch, upstream, review("lib.rs", 2))
+    assert upstream.models == [None]
+    assert routing.info()["tiers"]["fast"]["requests"] == 0
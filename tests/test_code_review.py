@@ -0,0 +1,44 @@
+import code_review
+
+ITEMS = [{"path": f"f{i}.py", "question": f"review {i}"} for i in range(4)]
+
+def test_batch_timeout_scales_with_size(monkeypatch):
+    monkeypatch.setattr(code_review, "REVIEW_TIMEOUT", 60.0)
+    monkeypatch.setattr(code_review, "REVIEW_DEADLINE", 55.0)
+    monkeypatch.setattr(code_review, "REVIEW_BATCH_TIMEOUT", 0.0)
+    assert code_review.batch_timeout(1) == (60.0, 55.0)
+    assert code_review.batch_timeout(8) == (480.0, 475.0)
+    monkeypatch.setattr(code_review, "REVIEW_BATCH_TIMEOUT", 200.0)
+    assert code_review.batch_timeout(8) == (200.0, 195.0)
+
+def test_batch_failure_falls_back_to_single_requests(monkeypatch):
+    calls = []
+
+    def fake_post(url, payload, session=None, deadline=0, timeout=0, max_retries=0):
+        calls.append((len(payload["items"]), timeout, max_retries))
+        return "Request Error: read timed out"
+
+    monkeypatch.setattr(code_review, "post_with_retry", fake_post)
+    monkeypatch.setattr(code_review, "call_llm_api", lambda prompt, session=None: f"single {prompt}")
+    reviews = code_review.call_llm_batch_api(ITEMS)
+    assert reviews == [f"single review {i}" for i in range(4)]
+    # Một lần gửi batch, không retry cả batch
+    assert len(calls) == 1 and calls[0][2] == 0
+
+def test_failed_and_partial_items_retried_one_by_one(monkeypatch):
+    results = [
+        {"index": 0, "success": True, "answer": "ok 0"},
+        {"index": 1, "success": False, "error": "Deadline exceeded"},
+        {"index": 2, "success": True, "answer": "half", "partial": True},
+        {"index": 3, "success": True, "answer": "ok 3"},
+    ]
+    monkeypatch.setattr(code_review, "post_with_retry", lambda *args, **kwargs: {"results": results})
+    retried = []
+
+    def fake_single(prompt, session=None):
+        retried.append(prompt)
+        return f"single {prompt}"
+
+    monkeypatch.setattr(code_review, "call_llm_api", fake_single)
+    assert code_review.call_llm_batch_api(ITEMS) == ["ok 0", "single review 1", "single review 2", "ok 3"]
+    assert retried == ["review 1", "review 2"]
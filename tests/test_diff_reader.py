@@ -0,0 +1,65 @@
+import os
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from diff_reader import header_path, iter_file_diffs
+
+def git(repo: Path, *args: str):
+    subprocess.run(["git", "-c", "user.name=t", "-c", "user.email=t@t", *args],
+                   cwd=repo, check=True, capture_output=True)
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    git(tmp_path, "init", "-q")
+    files = {
+        "a.py": "a = 1\n",
+        "b.py": "b = 1\n",
+        "c.py": "c = 1\n",
+        "old name.py": "".join(f"line_{i} = {i}\n" for i in range(20)),
+        "gone.py": "gone = 1\n",
+        "z.py": "z = 1\n",
+    }
+    for name, text in files.items():
+        (tmp_path / name).write_text(text)
+    git(tmp_path, "add", "-A")
+    git(tmp_path, "commit", "-q", "-m", "base")
+
+    (tmp_path / "a.py").write_text("a = 2\n")
+    # b.py: file -> symlink (one raw record, two patches)
+    (tmp_path / "b.py").unlink()
+    os.symlink("a.py", tmp_path / "b.py")
+    (tmp_path / "c.py").write_text("c = 2\n")
+    git(tmp_path, "mv", "old name.py", "new name.py")
+    with open(tmp_path / "new name.py", "a") as f:
+        f.write("extra = 1\n")
+    (tmp_path / "gone.py").unlink()
+    (tmp_path / "z.py").write_text("z = 2\n")
+    git(tmp_path, "add", "-A")
+    git(tmp_path, "commit", "-q", "-m", "change")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def test_patches_matched_to_files_by_path(repo):
+    diffs = {d.path: d for d in iter_file_diffs(["HEAD~1", "HEAD"], lambda path: True)}
+    assert set(diffs) == {"a.py", "b.py", "c.py", "new name.py", "gone.py", "z.py"}
+
+    assert diffs["b.py"].status == "T"
+    assert "-b = 1" in diffs["b.py"].diff and "+a.py" in diffs["b.py"].diff
+    assert "+c = 2" in diffs["c.py"].diff and "a.py" not in diffs["c.py"].diff
+    assert "+z = 2" in diffs["z.py"].diff and "c = " not in diffs["z.py"].diff
+
+    renamed = diffs["new name.py"]
+    assert (renamed.status, renamed.old_path) == ("R", "old name.py")
+    assert "+extra = 1" in renamed.diff
+    assert diffs["gone.py"].status == "D" and "-gone = 1" in diffs["gone.py"].diff
+
+def test_excluded_files_skipped(repo):
+    paths = [d.path for d in iter_file_diffs(["HEAD~1", "HEAD"], lambda path: path != "b.py")]
+    assert "b.py" not in paths and "c.py" in paths
+
+def test_header_path():
+    assert header_path("diff --git a/x y.py b/x y.py") == "x y.py"
+    assert header_path('diff --git "a/f\\303\\266o.py" "b/f\\303\\266o.py"') == "föo.py"
+    assert header_path("diff --git a/old.py b/new.py") is None
@@ -0,0 +1,71 @@
+import asyncio
+
+import httpx
+
+from app.backends import BackendPool
+from app.hedging import Hedger
+
+def pool(*names: str) -> BackendPool:
+    configs = [dict(name=name, base_url=f"http://{name}/v1", api_key="x", model=f"{name}-model", weight=1.0)
+               for name in names]
+    return BackendPool(configs, httpx.AsyncClient(), policy="least_outstanding",
+                       failure_threshold=3, cooldown=30.0)
+
+def hedger(**overrides) -> Hedger:
+    options = dict(quantile=0.95, min_delay=0.01, min_samples=5, budget=1.0, model="")
+    options.update(overrides)
+    return Hedger(**options)
+
+def test_delay_is_tracked_per_key():
+    h = hedger()
+    for _ in range(10):
+        h.observe(0.05, "fast-model")
+        h.observe(2.0)
+    assert h.delay("fast-model") == 0.05
+    assert h.delay() == 2.0
+    assert h.delay("other-model") is None
+    assert h.info()["delays"] == {"fast-model": {"delay": 0.05, "samples": 10},
+                                  "default": {"delay": 2.0, "samples": 10}}
+
+def test_fast_tier_samples_do_not_hedge_full_tier_calls():
+    h = hedger()
+    backends = pool("a", "b")
+    for _ in range(10):
+        h.observe(0.02, "fast-model")
+
+    async def request(backend, model):
+        await asyncio.sleep(0.1)
+        return backend.name
+
+    async def scenario():
+        # Không có mẫu cho tầng chính: không hedge dù tầng nhanh có delay rất nhỏ
+        response, backend, _ = await h.run(backends, request)
+        backends.finish(backend, "complete", None)
+        return response
+
+    asyncio.run(scenario())
+    assert h.stats["hedged"] == 0
+
+def test_slow_primary_is_hedged_to_another_backend():
+    h = hedger()
+    backends = pool("a", "b")
+    for _ in range(10):
+        h.observe(0.02)
+    calls = []
+
+    async def request(backend, model):
+        calls.append(backend.name)
+        # Lời gọi đầu chậm, bản sao trả về ngay
+        await asyncio.sleep(1.0 if len(calls) == 1 else 0.0)
+        return backend.name
+
+    async def scenario():
+        response, backend, _ = await h.run(backends, request)
+        backends.finish(backend, "complete", None)
+        return response
+
+    winner = asyncio.run(scenario())
+    assert len(set(calls)) == 2
+    assert winner == calls[1]
+    assert h.stats["hedged"] == 1 and h.stats["hedge_wins"] == 1
+    assert all(b.outstanding == 0 for b in backends.backends)
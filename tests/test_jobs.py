@@ -0,0 +1,52 @@
+import asyncio
+
+from app import jobs
+from app.jobs import JobQueue, SQLiteJobStore
+
+def make_queue(tmp_path, workers: int = 1) -> JobQueue:
+    return JobQueue(workers=workers, max_queue=10, result_ttl=60, callback_timeout=1,
+                    callback_hosts=["127.0.0.1"], db_path=str(tmp_path / "jobs.sqlite3"))
+
+def test_job_lifecycle(tmp_path, monkeypatch):
+    async def fake_ask(question, **kwargs):
+        return {"answer": f"review of {question}", "model": "mock", "tokens_used": 3,
+                "usage": {"prompt_tokens": 1, "completion_tokens": 2}, "prompt_source": "code_review@1"}
+
+    monkeypatch.setattr(jobs.llm_client, "ask", fake_ask)
+
+    async def scenario():
+        queue = make_queue(tmp_path)
+        job = await queue.submit("x = 1", "system", "code_review@1")
+        assert (await queue.get(job.id))["status"] in ("queued", "running")
+        while not job.done:
+            await asyncio.sleep(0.01)
+        info = await queue.get(job.id)
+        await queue.stop()
+        return info
+
+    info = asyncio.run(scenario())
+    assert info["status"] == "succeeded"
+    assert info["result"]["answer"] == "review of x = 1"
+
+def test_unfinished_jobs_fail_on_shutdown(tmp_path, monkeypatch):
+    async def hanging_ask(question, **kwargs):
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(jobs.llm_client, "ask", hanging_ask)
+
+    async def scenario():
+        queue = make_queue(tmp_path, workers=1)
+        running = await queue.submit("a", "system", "p")
+        queued = await queue.submit("b", "system", "p")
+        while running.status != "running":
+            await asyncio.sleep(0.01)
+        await queue.stop(drain_timeout=0.2)
+        return running.id, queued.id, queue.stats
+
+    ids = asyncio.run(scenario())
+    store = SQLiteJobStore(str(tmp_path / "jobs.sqlite3"))
+    for job_id in ids[:2]:
+        info = store.load(job_id)
+        assert info["status"] == "failed"
+        assert "shutting down" in info["error"]
+    assert ids[2]["failed"] == 2
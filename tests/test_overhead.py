@@ -0,0 +1,87 @@
+"""Endpoint chính qua mock upstream: status, dạng payload và overhead phía server trên mỗi request"""
+
+import itertools
+
+from conftest import MAX_OVERHEAD_MS
+
+REVIEW_FIELDS = {
+    "success", "question", "answer", "model", "used_prompt", "prompt_length",
+    "cached", "prompt_source", "cache_match", "partial"
+}
+COMPACT_FIELDS = {"answer", "model", "usage", "prompt_version", "cached", "cache_match", "partial"}
+BYPASS = {"X-Cache-Bypass": "1"}
+
+counter = itertools.count()
+
+def upstream_requests(mock_upstream) -> int:
+    return mock_upstream.state.stats["requests"]
+
+def test_review_miss(client, mock_upstream, measure_overhead):
+    before = upstream_requests(mock_upstream)
+    response, overhead = measure_overhead(
+        lambda: client.post("/api/review/", json={"question": "def f(): return 1"}, headers=BYPASS)
+    )
+    body = response.json()
+    assert set(body) == REVIEW_FIELDS
+    assert body["success"] is True
+    assert body["answer"] == "LGTM"
+    assert body["cached"] is False
+    assert body["cache_match"] is None
+    assert body["prompt_length"] == len(body["used_prompt"]) > 0
+    assert upstream_requests(mock_upstream) - before == 20
+    assert overhead < MAX_OVERHEAD_MS
+
+def test_review_cache_hit(client, mock_upstream, measure_overhead):
+    question = f"def g(): return {next(counter)}"
+    client.post("/api/review/", json={"question": question})
+    before = upstream_requests(mock_upstream)
+    response, overhead = measure_overhead(lambda: client.post("/api/review/", json={"question": question}))
+    assert response.json()["cached"] is True
+    assert response.json()["cache_match"] == "exact"
+    assert upstream_requests(mock_upstream) == before
+    assert overhead < MAX_OVERHEAD_MS
+
+def test_review_compact(client, measure_overhead):
+    response, overhead = measure_overhead(
+        lambda: client.post("/api/review/?compact=true", json={"question": "x = 1"}, headers=BYPASS)
+    )
+    body = response.json()
+    assert set(body) == COMPACT_FIELDS
+    assert body["answer"] == "LGTM"
+    assert body["usage"]["completion_tokens"] == 20
+    assert body["usage"]["total_tokens"] == body["usage"]["prompt_tokens"] + 20
+    assert overhead < MAX_OVERHEAD_MS
+
+def test_test_endpoint(client, mock_upstream, measure_overhead):
+    before = upstream_requests(mock_upstream)
+    response, overhead = measure_overhead(
+        lambda: client.get("/api/test/", params={"question": "hello"}, headers=BYPASS)
+    )
+    body = response.json()
+    assert set(body) == REVIEW_FIELDS
+    assert body["question"] == "hello"
+    assert body["answer"] == "LGTM"
+    assert upstream_requests(mock_upstream) - before == 20
+    assert overhead < MAX_OVERHEAD_MS
+
+def test_review_requires_question(client):
+    assert client.post("/api/review/", json={}).status_code == 422
+
+def test_health(client, mock_upstream, measure_overhead):
+    before = upstream_requests(mock_upstream)
+    response, overhead = measure_overhead(lambda: client.get("/health"), n=50)
+    body = response.json()
+    assert body["status"] == "healthy"
+    assert body["upstream_ok"] is True
+    assert body["staleness_seconds"] >= 0
+    # Health trả lời từ bộ nhớ, không gọi chat completion
+    assert upstream_requests(mock_upstream) == before
+    assert overhead < MAX_OVERHEAD_MS
+
+def test_api_health(client, measure_overhead):
+    response, overhead = measure_overhead(lambda: client.get("/api/health"), n=50)
+    body = response.json()
+    assert body["status"] == "healthy"
+    assert body["prompt_loaded"] is True
+    assert body["ollama_connected"] is True
+    assert overhead < MAX_OVERHEAD_MS
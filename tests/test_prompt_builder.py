@@ -0,0 +1,97 @@
+from prompt_builder import (
+    build_review_prompts, build_segments, estimate_tokens, find_enclosing_scope,
+    pack_for_review, parse_unified_diff, segment_key
+)
+
+SOURCE = """import os
+
+
+def load(path):
+    with open(path) as f:
+        data = f.read()
+    return data
+
+
+class Store:
+    def get(self, key):
+        value = self.items[key]
+        return value
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.dirty = True
+"""
+
+DIFF = """diff --git a/store.py b/store.py
+--- a/store.py
++++ b/store.py
+@@ -6 +6 @@ def load(path):
+-        data = f.read()
++        data = f.read().strip()
+@@ -16,0 +17 @@ class Store:
++        self.dirty = True
+"""
+
+def test_parse_unified_diff():
+    hunks = parse_unified_diff(DIFF)
+    assert [(h.old_start, h.old_count, h.new_start, h.new_count) for h in hunks] == [(6, 1, 6, 1), (16, 0, 17, 1)]
+    assert hunks[0].section == " def load(path):"
+    assert hunks[0].lines == ["-        data = f.read()", "+        data = f.read().strip()"]
+    assert hunks[1].header == "@@ -16,0 +17,1 @@ class Store:"
+
+def test_enclosing_scope_is_the_function():
+    lines = SOURCE.splitlines()
+    # Scope kéo tới dòng khác rỗng đầu tiên thụt lề ít hơn (gồm cả dòng trống phía sau)
+    assert find_enclosing_scope(lines, 5, 6) == (3, 9)
+    # Method bên trong class: scope là method, không phải cả class
+    assert find_enclosing_scope(lines, 11, 12) == (10, 14)
+    # Code ở cấp module không có scope bao quanh
+    assert find_enclosing_scope(lines, 0, 1) is None
+
+def test_segments_pair_hunks_with_their_scope():
+    segments = build_segments(SOURCE, DIFF)
+    assert len(segments) == 2
+    assert "def load(path):" in segments[0].context
+    assert "class Store" not in segments[0].context
+    assert "f.read().strip()" in segments[0].diff
+    assert "def put(self, key, value):" in segments[1].context
+    # Ngữ cảnh có số dòng của file mới
+    assert segments[0].context.splitlines()[0].strip().startswith("4 | def load")
+
+def test_overlapping_windows_are_merged():
+    diff = "@@ -5 +5 @@\n-    a\n+    b\n@@ -6 +6 @@\n-    c\n+    d\n"
+    segments = build_segments(SOURCE, diff)
+    assert len(segments) == 1
+    assert segments[0].diff.count("@@ -") == 2
+
+def test_segment_key_ignores_line_numbers():
+    change = "\n-        data = f.read()\n+        data = f.read().strip()"
+    key = segment_key("6 | data = f.read()", "@@ -6 +6 @@" + change)
+    assert key == segment_key("40 | data = f.read()", "@@ -40 +40 @@ def load(path):" + change)
+    assert key != segment_key("", "@@ -6 +6 @@\n+        data = None")
+
+def test_no_diff_reviews_whole_file():
+    segments = build_segments(SOURCE, "")
+    assert len(segments) == 1 and segments[0].diff == ""
+    assert build_segments("", "") == []
+
+def test_prompts_stay_under_budget_and_cover_every_hunk():
+    lines = [f"def f{i}(x):\n    return x + {i}\n" for i in range(60)]
+    content = "\n".join(lines)
+    diff = "\n".join(f"@@ -{3 * i + 2} +{3 * i + 2} @@\n-    return x\n+    return x + {i}" for i in range(60))
+    budget = 400
+    packed = pack_for_review("big.py", build_segments(content, diff), budget)
+    assert len(packed) > 1
+    for i, (prompt, keys) in enumerate(packed):
+        assert estimate_tokens(prompt) <= budget
+        assert f"FILE: big.py (part {i + 1}/{len(packed)})" in prompt
+        assert keys
+    prompts = build_review_prompts("big.py", content, diff, budget)
+    assert all(f"+    return x + {i}" in "".join(prompts) for i in range(60))
+
+def test_oversized_hunk_is_split():
+    diff = "@@ -1,0 +1,300 @@\n" + "\n".join(f"+value_{i} = compute({i})" for i in range(300))
+    prompts = build_review_prompts("gen.py", "", diff, 500)
+    assert len(prompts) > 1
+    assert all(estimate_tokens(p) <= 500 for p in prompts)
+    assert "+value_299 = compute(299)" in prompts[-1]
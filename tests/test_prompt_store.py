@@ -0,0 +1,30 @@
+import os
+
+from app.prompt_store import PromptStore, prompt_store
+
+def test_reload_on_change(tmp_path):
+    path = tmp_path / "review.txt"
+    path.write_text("Review v1")
+    store = PromptStore({"review": str(path)}, check_interval=0)
+    first = store.get("review")
+    assert (first.content, first.path) == ("Review v1", str(path))
+
+    path.write_text("Review v2 with more rules")
+    mtime = int(first.mtime) + 5
+    os.utime(path, (mtime, mtime))
+    second = store.get("review")
+    assert second.content == "Review v2 with more rules"
+    assert second.version != first.version
+    assert store.info()[0]["versions"] == [first.version, second.version]
+
+def test_missing_file_gives_empty_prompt(tmp_path):
+    store = PromptStore({"gone": str(tmp_path / "missing.txt")}, check_interval=0)
+    assert store.get("gone").content == ""
+
+def test_prompts_endpoint_reports_path_and_version(client):
+    info = client.get("/api/prompts/").json()["prompt_info"]
+    current = prompt_store.get("code_review")
+    assert info["source_file"] == current.path
+    assert os.path.isabs(info["source_file"])
+    assert info["version"] == current.version
+    assert info["content"] == current.content
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from app.rate_limit import RateLimited, RateLimiter
+
+def limiter(**overrides) -> RateLimiter:
+    options = dict(requests_per_second=1.0, burst=3, tokens_per_minute=0, api_keys=["secret"],
+                   api_key_header="X-API-Key", trust_forwarded=False, max_clients=100)
+    options.update(overrides)
+    return RateLimiter(**options)
+
+def request(host: str = "10.0.0.1", **headers: str) -> Request:
+    return Request({
+        "type": "http",
+        "headers": [(k.replace("_", "-").lower().encode(), v.encode()) for k, v in headers.items()],
+        "client": (host, 1234)
+    })
+
+def checks(rate_limiter: RateLimiter, client: str, n: int) -> list:
+    """Kết quả n lần check liên tiếp: None (cho qua) hoặc RateLimited"""
+    async def scenario():
+        results = []
+        for _ in range(n):
+            try:
+                await rate_limiter.check(client)
+                results.append(None)
+            except RateLimited as e:
+                results.append(e)
+        return results
+    return asyncio.run(scenario())
+
+def test_burst_then_429_with_retry_after():
+    results = checks(limiter(), "ip:a", 4)
+    assert results[:3] == [None] * 3
+    assert results[3].status_code == 429
+    assert results[3].headers["Retry-After"] == "1"
+
+def test_clients_have_separate_buckets():
+    rate_limiter = limiter()
+    checks(rate_limiter, "ip:a", 3)
+    assert checks(rate_limiter, "ip:b", 1) == [None]
+
+def test_token_quota_blocks_after_overuse():
+    rate_limiter = limiter(burst=100, tokens_per_minute=600)
+    asyncio.run(rate_limiter.charge("ip:a", 1200))
+    blocked = checks(rate_limiter, "ip:a", 1)[0]
+    assert "tokens" in blocked.detail
+    # 600 token/phút = 10 token/giây, quota đang âm 600
+    assert int(blocked.headers["Retry-After"]) == 60
+    assert rate_limiter.stats["limited_tokens"] == 1
+
+def test_sqlite_store_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "rate_limit.sqlite3")
+    first, second = limiter(db_path=path), limiter(db_path=path)
+    checks(first, "ip:a", 3)
+    assert isinstance(checks(second, "ip:a", 1)[0], RateLimited)
+
+@pytest.mark.parametrize("headers, trust_forwarded, expected", [
+    ({}, False, "ip:10.0.0.1"),
+    ({"X_Forwarded_For": "1.2.3.4, 10.0.0.1"}, False, "ip:10.0.0.1"),
+    ({"X_Forwarded_For": "1.2.3.4, 10.0.0.1"}, True, "ip:1.2.3.4"),
+    ({"X_API_Key": "unknown"}, False, "ip:10.0.0.1"),
+])
+def test_client_id(headers, trust_forwarded, expected):
+    assert limiter(trust_forwarded=trust_forwarded).client_id(request(**headers)) == expected
+
+def test_registered_key_gets_its_own_quota():
+    rate_limiter = limiter()
+    by_header = rate_limiter.client_id(request(X_API_Key="secret"))
+    by_bearer = rate_limiter.client_id(request(host="10.0.0.2", Authorization="Bearer secret"))
+    assert by_header == by_bearer
+    assert by_header.startswith("key:") and "secret" not in by_header
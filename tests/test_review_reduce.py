@@ -0,0 +1,75 @@
+import code_review
+from code_review import format_review_for_pr, merge_reviews
+from prompt_builder import estimate_tokens
+from review_reduce import FILE_REDUCE_HEADER, build_reduce_prompts, dedupe_findings
+
+SUGGESTION = """Consider caching the lookup:
+
+```python
+# build the index once
+index = build_index(rows)
+
+for row in rows:
+    handle(index[row.key])
+
+```"""
+
+def test_fenced_block_kept_intact():
+    [merged] = dedupe_findings([SUGGESTION])
+    assert merged == SUGGESTION
+    assert merged.count("```") == 2
+
+def test_fenced_block_deduplicated_as_a_whole():
+    other = "Another note.\n\n```python\nindex = build_index(rows)\n```"
+    merged = dedupe_findings([SUGGESTION, SUGGESTION, other])
+    assert merged == [SUGGESTION, other]
+
+def test_blocks_without_text_are_kept():
+    merged = dedupe_findings(["First point.\n\n---\n\nSecond point.", "Third.\n\n---"])
+    assert merged == ["First point.\n\n---\n\nSecond point.", "Third.\n\n---"]
+
+def test_format_marks_failed_files():
+    comment = format_review_for_pr({
+        "a.py": "Looks good.",
+        "b.py": "API Error: 502 - bad gateway",
+        "c.py": "Request Error: Review job 1 did not finish",
+    })
+    assert "❌ API Error" in comment
+    assert "❌ Request Error" in comment
+    assert "Reviewed 1/3 files" in comment
+
+def big_note(i: int, lines: int) -> str:
+    return "\n".join(f"- issue {i}.{n}: value is computed twice in loop {n}" for n in range(lines))
+
+def test_reduce_prompts_stay_under_budget():
+    header = FILE_REDUCE_HEADER.format(path="big.py")
+    notes = [(f"Part {i}", big_note(i, 400)) for i in range(6)]
+    prompts = build_reduce_prompts(header, notes, token_budget=1000)
+    assert all(estimate_tokens(prompt) <= 1000 for prompt in prompts)
+    # Mỗi note lớn hơn budget: bị cắt (có đánh dấu) và ghép ít nhất hai note mỗi prompt
+    assert len(prompts) == 3
+    assert all("note truncated" in prompt for prompt in prompts)
+
+def test_small_notes_not_truncated():
+    notes = [(f"Part {i}", big_note(i, 3)) for i in range(4)]
+    [prompt] = build_reduce_prompts("Merge:", notes, token_budget=1000)
+    assert "truncated" not in prompt
+    assert all(text in prompt for _, text in notes)
+
+def test_merge_reviews_reduces_in_tiers(monkeypatch):
+    sent = []
+
+    def fake_llm(prompt, session=None):
+        sent.append(prompt)
+        return big_note(len(sent), 120)
+
+    monkeypatch.setattr(code_review, "call_llm_api", fake_llm)
+    notes = [(f"Part {i}", big_note(i, 300)) for i in range(16)]
+    header = FILE_REDUCE_HEADER.format(path="big.py")
+    monkeypatch.setattr(code_review, "build_reduce_prompts",
+                        lambda h, n: build_reduce_prompts(h, n, token_budget=1000))
+
+    assert merge_reviews(header, notes) is not None
+    assert all(estimate_tokens(prompt) <= 1000 for prompt in sent)
+    # 16 -> 8 -> 4 -> 2 -> 1
+    assert len(sent) == 15
@@ -0,0 +1,79 @@
+from app.similarity_cache import SimilarityCache
+
+CONTEXT = "model|prompt"
+
+def review_prompt(path: str, code: str) -> str:
+    return f"Please review the following code changes:\n\nFILE: {path}\n\nCODE CONTEXT:\n```\n{code}\n```\n"
+
+def make_file(compare: str = ">", sign: str = "-", name: str = "total", comment: str = "") -> str:
+    functions = []
+    for i in range(80):
+        functions.append(
+            f"def step_{i}(items):{comment}\n"
+            f"    {name} = sum(items) * {i}\n"
+            f"    if {name} {compare} 7:\n"
+            f"        return {name} {sign} 7\n"
+            f"    return {name}\n"
+        )
+    return review_prompt("steps.py", "\n".join(functions))
+
+def cache_with_original() -> SimilarityCache:
+    cache = SimilarityCache(max_entries=100, ttl=3600)
+    cache.add(cache.signature(make_file()), CONTEXT, {"answer": "old review"})
+    return cache
+
+def test_logic_change_misses():
+    cache = cache_with_original()
+    assert cache.lookup(cache.signature(make_file(compare=">=")), CONTEXT) is None
+    assert cache.lookup(cache.signature(make_file(sign="+")), CONTEXT) is None
+
+def test_rename_and_comment_hit():
+    cache = cache_with_original()
+    assert cache.lookup(cache.signature(make_file(name="acc")), CONTEXT) == {"answer": "old review"}
+    assert cache.lookup(cache.signature(make_file(comment="  # TODO")), CONTEXT) == {"answer": "old review"}
+
+def test_other_context_misses():
+    cache = cache_with_original()
+    assert cache.lookup(cache.signature(make_file()), "other|prompt") is None
+
+PYTHON_FILE = '''import os
+MAX_RETRIES = 3
+
+def half(items, scale=2):
+    """Half of the total."""
+    total = sum(items) * scale  # running sum
+    color = "#fff"
+    return total // 2 + 1, MAX_RETRIES, color, os.sep
+'''
+
+C_FILE = '''#include <a.h>
+
+static int add(int a, int b) {
+    int total = a + b; // sum of both
+    return total * 2 + a - b + 1;
+}
+'''
+
+def hits(path: str, original: str, edited: str) -> bool:
+    cache = SimilarityCache(max_entries=100, ttl=3600)
+    cache.add(cache.signature(review_prompt(path, original)), CONTEXT, {"answer": "old review"})
+    return cache.lookup(cache.signature(review_prompt(path, edited)), CONTEXT) is not None
+
+def test_floor_division_is_not_a_comment():
+    assert not hits("m.py", PYTHON_FILE, PYTHON_FILE.replace("// 2 + 1", "// 2 - 1"))
+
+def test_module_level_names_kept():
+    assert not hits("m.py", PYTHON_FILE, PYTHON_FILE.replace("1, MAX_RETRIES", "1, MIN_RETRIES"))
+    assert not hits("m.py", PYTHON_FILE, PYTHON_FILE.replace("os.sep", "sys.sep"))
+
+def test_hash_inside_string_kept():
+    assert not hits("m.py", PYTHON_FILE, PYTHON_FILE.replace('"#fff"', '"#000"'))
+
+def test_c_include_is_not_a_comment():
+    assert not hits("m.c", C_FILE, C_FILE.replace("<a.h>", "<b.h>"))
+
+def test_local_rename_comment_and_docstring_hit():
+    edited = (PYTHON_FILE.replace("total", "acc").replace("# running sum", "# accumulate")
+              .replace("Half of the total.", "Halve it."))
+    assert hits("m.py", PYTHON_FILE, edited)
+    assert hits("m.c", C_FILE, C_FILE.replace("total", "acc").replace("// sum of both", "/* sum */"))
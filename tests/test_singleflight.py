@@ -0,0 +1,166 @@
+import asyncio
+from typing import Optional
+
+import pytest
+
+from app.singleflight import SingleFlight, StreamSingleFlight
+
+class Upstream:
+    """Lời gọi upstream giả: đếm số lần gọi, chờ tới khi được release"""
+
+    def __init__(self, result=None, error: Optional[Exception] = None):
+        self.calls = 0
+        self.cancelled = False
+        self.result = result
+        self.error = error
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+def test_concurrent_callers_share_one_call():
+    async def scenario():
+        flight = SingleFlight()
+        upstream = Upstream(result={"answer": "LGTM"})
+        callers = [asyncio.create_task(flight.do("k", upstream)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert flight.in_flight() == 1
+        upstream.release.set()
+        results = await asyncio.gather(*callers)
+        return flight, upstream, results
+
+    flight, upstream, results = asyncio.run(scenario())
+    assert upstream.calls == 1
+    assert results == [{"answer": "LGTM"}] * 3
+    assert flight.stats == {"leaders": 1, "shared": 2}
+    assert flight.in_flight() == 0
+
+def test_error_is_shared_and_key_is_released():
+    async def scenario():
+        flight = SingleFlight()
+        upstream = Upstream(error=RuntimeError("upstream down"))
+        callers = [asyncio.create_task(flight.do("k", upstream)) for _ in range(2)]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        # Lời gọi sau khi lỗi là một lời gọi mới
+        retry = Upstream(result="ok")
+        retry.release.set()
+        return results, await flight.do("k", retry)
+
+    results, retried = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert retried == "ok"
+
+def test_cancelled_caller_does_not_cancel_others():
+    async def scenario():
+        flight = SingleFlight()
+        upstream = Upstream(result="ok")
+        first = asyncio.create_task(flight.do("k", upstream))
+        second = asyncio.create_task(flight.do("k", upstream))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        upstream.release.set()
+        return first, await second, upstream
+
+    first, result, upstream = asyncio.run(scenario())
+    assert first.cancelled()
+    assert result == "ok"
+    assert not upstream.cancelled
+
+def test_timeout_of_last_waiter_cancels_upstream():
+    async def scenario():
+        flight = SingleFlight()
+        upstream = Upstream(result="ok")
+        with pytest.raises(asyncio.TimeoutError):
+            await flight.do("k", upstream, timeout=0.05)
+        await asyncio.sleep(0)
+        return flight, upstream
+
+    flight, upstream = asyncio.run(scenario())
+    assert upstream.cancelled
+    assert flight.in_flight() == 0
+
+def test_timeout_keeps_call_for_remaining_waiters():
+    async def scenario():
+        flight = SingleFlight()
+        upstream = Upstream(result="ok")
+        patient = asyncio.create_task(flight.do("k", upstream))
+        await asyncio.sleep(0)
+        with pytest.raises(asyncio.TimeoutError):
+            await flight.do("k", upstream, timeout=0.05)
+        upstream.release.set()
+        return upstream, await patient
+
+    upstream, result = asyncio.run(scenario())
+    assert not upstream.cancelled
+    assert result == "ok"
+
+async def collect(stream, limit=None):
+    events = []
+    async for event in stream:
+        events.append(event)
+        if limit is not None and len(events) == limit:
+            break
+    return events
+
+def test_late_stream_subscriber_gets_replay():
+    async def scenario():
+        flight = StreamSingleFlight()
+        gate = asyncio.Event()
+        produced = []
+
+        async def upstream():
+            for i in range(4):
+                if i == 2:
+                    await gate.wait()
+                produced.append(i)
+                yield {"i": i}
+
+        first = asyncio.create_task(collect(flight.subscribe("k", upstream)))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(collect(flight.subscribe("k", upstream)))
+        await asyncio.sleep(0.01)
+        gate.set()
+        return flight, produced, await first, await second
+
+    flight, produced, first, second = asyncio.run(scenario())
+    assert produced == [0, 1, 2, 3]
+    assert first == second == [{"i": i} for i in range(4)]
+    assert flight.stats == {"leaders": 1, "shared": 1}
+
+def test_stream_cancelled_when_last_subscriber_leaves():
+    async def scenario():
+        flight = StreamSingleFlight()
+        state = {"cancelled": False}
+
+        async def upstream():
+            try:
+                i = 0
+                while True:
+                    yield {"i": i}
+                    i += 1
+                    await asyncio.sleep(0.01)
+            except asyncio.CancelledError:
+                state["cancelled"] = True
+                raise
+
+        stream = flight.subscribe("k", upstream)
+        events = await collect(stream, limit=2)
+        await stream.aclose()
+        await asyncio.sleep(0.02)
+        return flight, state, events
+
+    flight, state, events = asyncio.run(scenario())
+    assert len(events) == 2
+    assert state["cancelled"]
+    assert flight.in_flight() == 0
@@ -0,0 +1,74 @@
+"""Streaming qua mock upstream: /review/stream (SSE, ndjson) và /review/batch"""
+
+import itertools
+import json
+
+from app.config import settings
+
+# Mock upstream stream 20 token "tok0 " ... "tok19 "
+STREAMED = "".join(f"tok{i} " for i in range(20))
+
+counter = itertools.count()
+
+def question() -> str:
+    return f"def stream_{next(counter)}(): pass"
+
+def parse_sse(text: str) -> list:
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append({"event": lines["event"], **json.loads(lines["data"])})
+    return events
+
+def parse_ndjson(text: str) -> list:
+    return [json.loads(line) for line in text.splitlines() if line]
+
+def check_review_events(events: list):
+    tokens = [e for e in events if e["event"] == "token"]
+    assert "".join(e["content"] for e in tokens) == STREAMED
+    assert events[-1]["event"] == "done"
+    assert events[-1]["success"] is True
+    assert events[-1]["tokens_used"] > 20
+    assert events[-1]["prompt_length"] > 0
+
+def test_review_stream_sse(client):
+    response = client.post("/api/review/stream", json={"question": question()})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["cache-control"] == "no-cache"
+    check_review_events(parse_sse(response.text))
+
+def test_review_stream_ndjson(client):
+    for kwargs in ({"params": {"format": "ndjson"}}, {"headers": {"Accept": "application/x-ndjson"}}):
+        response = client.post("/api/review/stream", json={"question": question()}, **kwargs)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        check_review_events(parse_ndjson(response.text))
+
+def batch_items(n: int) -> list:
+    return [{"path": f"f{i}.py", "content": f"x = {i}\n", "diff": f"@@ -0,0 +1 @@\n+x = {i}"}
+            for i in range(n)]
+
+def test_review_batch(client):
+    items = batch_items(3) + [{"path": "prebuilt.py", "question": question()}]
+    response = client.post("/api/review/batch", json={"items": items}, headers={"X-Cache-Bypass": "1"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["success"] is True
+    assert [r["index"] for r in body["results"]] == [0, 1, 2, 3]
+    assert [r["path"] for r in body["results"]] == ["f0.py", "f1.py", "f2.py", "prebuilt.py"]
+    assert all(r["answer"] == "LGTM" and r["cached"] is False for r in body["results"])
+
+def test_review_batch_stream(client):
+    response = client.post("/api/review/batch", params={"stream": "true"}, json={"items": batch_items(4)})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    results = parse_ndjson(response.text)
+    # Thứ tự theo lúc xong, mỗi item đúng một dòng
+    assert sorted(r["index"] for r in results) == [0, 1, 2, 3]
+    assert all(r["success"] for r in results)
+
+def test_review_batch_too_large(client, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_MAX_ITEMS", 2)
+    response = client.post("/api/review/batch", json={"items": batch_items(3)})
+    assert response.status_code == 413